@@ -0,0 +1,65 @@
+'''De-duplication and hysteresis of the commands sent to the actuators'''
+import time
+import threading
+from typing import Dict, Optional, Tuple
+
+
+class CommandGuard():
+    """Keeps the last command sent to every actuator topic and suppresses:
+    - the same command repeated before the repeat interval expires,
+    - a different command before the minimum dwell time of the last one,
+    - a different command for another band than the last one while the reading is
+      within the hysteresis margin of its measure type from a band threshold, so a
+      reading hovering on a boundary doesn't flip the actuator. The steps taken inside
+      the same band (e.g. the light going up a level at a time) are not held back."""
+
+    def __init__(self, min_dwell: float, repeat_interval: float, margins: Dict[str, float]):
+        self.min_dwell = min_dwell
+        self.repeat_interval = repeat_interval
+        self.margins = {k.lower(): float(v) for k, v in margins.items()}
+        self.lock = threading.Lock()
+        # topic -> {"command", "band", "sentAt"}
+        self._last_commands = {}
+        self.counters = {"published": 0, "duplicate": 0, "dwell": 0, "hysteresis": 0}
+
+    def allow(self, topic: str, command: str, measure_type: str=None, band: Optional[str]=None,
+              distance: Optional[float]=None) -> Tuple[bool, str]:
+        # band is the rule band of the reading, distance how far the reading is from its closest threshold
+        now = time.monotonic()
+        with self.lock:
+            last = self._last_commands.get(topic)
+            reason = self._suppression_reason(last, command, measure_type, band, distance, now)
+            if reason:
+                self.counters[reason] += 1
+                return False, reason
+
+            self._last_commands[topic] = {"command": command, "band": band, "sentAt": now}
+            self.counters["published"] += 1
+            return True, ""
+
+    def _suppression_reason(self, last: Optional[dict], command: str, measure_type: str, band: Optional[str],
+                            distance: Optional[float], now: float) -> str:
+        if not last:
+            return ""
+        elapsed = now - last["sentAt"]
+        if last["command"] == command:
+            return "duplicate" if elapsed < self.repeat_interval else ""
+
+        if elapsed < self.min_dwell:
+            return "dwell"
+        margin = self.margins.get((measure_type or "").lower())
+        if margin and band != last["band"] and distance is not None and distance < margin:
+            return "hysteresis"
+        return ""
+
+    def stats(self) -> dict:
+        with self.lock:
+            counters = dict(self.counters)
+            tracked = len(self._last_commands)
+        suppressed = counters["duplicate"] + counters["dwell"] + counters["hysteresis"]
+        return {
+            "published": counters["published"],
+            "suppressed": suppressed,
+            "suppressedByReason": {k: counters[k] for k in ["duplicate", "dwell", "hysteresis"]},
+            "trackedActuators": tracked
+        }
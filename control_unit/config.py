@@ -13,12 +13,33 @@ class Config:
     GENERAL_ENDPOINT = os.getenv("GENERAL_ENDPOINT")
     SERVICES_ENDPOINT = os.getenv("SERVICES_ENDPOINT")
     SERVICE_REGISTRY_NAME = os.getenv("SERVICE_REGISTRY_NAME")
+    CATALOG_TIMEOUT = float(os.getenv("CATALOG_TIMEOUT", 5))  # seconds
+    CATALOG_RETRIES = int(os.getenv("CATALOG_RETRIES", 2))  # retries of the idempotent requests
+    CATALOG_BACKOFF = float(os.getenv("CATALOG_BACKOFF", 0.2))  # seconds, doubled at every retry
+    CATALOG_POOL_SIZE = int(os.getenv("CATALOG_POOL_SIZE", 10))  # keep-alive connections
+    CATALOG_DISCOVERY_TTL = int(os.getenv("CATALOG_DISCOVERY_TTL", 300))  # seconds before the endpoint map is reloaded
+    CATALOG_DISCOVERY_NEGATIVE_TTL = int(os.getenv("CATALOG_DISCOVERY_NEGATIVE_TTL", 30))  # seconds a miss or a failure is remembered
+    CATALOG_CONDITIONAL_CACHE_SIZE = int(os.getenv("CATALOG_CONDITIONAL_CACHE_SIZE", 256))  # GET responses kept for revalidation
     MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID")
     LOGGER_NAME = os.getenv("BASE_LOGGER")
     ROOMS_ENDPOINT = os.getenv("ROOMS_ENDPOINT")
     MQTT_LOGGER = os.getenv("MQTT_LOGGER")
     TOPICS_UPDATE_INTERVAL = int(os.getenv("TOPICS_UPDATE_INTERVAL", 200))  # seconds
+    CHANGES_ENDPOINT = os.getenv("CHANGES_ENDPOINT", "changes")
+    CHANGE_FEED_WAIT = int(os.getenv("CHANGE_FEED_WAIT", 25))  # seconds a long poll is held by the registry
+    CHANGE_FEED_RETRY_INTERVAL = int(os.getenv("CHANGE_FEED_RETRY_INTERVAL", 10))  # seconds
+    CHANGE_FEED_MIN_REFRESH_INTERVAL = int(os.getenv("CHANGE_FEED_MIN_REFRESH_INTERVAL", 5))  # seconds between two refreshes on changes
     CU_PORT = int(os.getenv("CU_PORT"))
+    ROOM_CONTEXT_TTL = int(os.getenv("ROOM_CONTEXT_TTL", 300))  # seconds
+    ROOM_CONTEXT_RETRY_INTERVAL = int(os.getenv("ROOM_CONTEXT_RETRY_INTERVAL", 10))  # seconds
+    WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", 4))
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 1000))  # readings waiting for a worker
+    COMMAND_MIN_DWELL = int(os.getenv("COMMAND_MIN_DWELL", 30))  # seconds before an actuator changes again
+    COMMAND_REPEAT_INTERVAL = int(os.getenv("COMMAND_REPEAT_INTERVAL", 300))  # seconds before a command is repeated
+    HYSTERESIS_MARGINS = json.loads(os.getenv("HYSTERESIS_MARGINS", '{"temperature": 0.5, "light": 10, "ph": 0.1, "soil_moisture": 1}'))
+    WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 900))  # seconds
+    WEATHER_GRID_SIZE = float(os.getenv("WEATHER_GRID_SIZE", 0.1))  # degrees of latitude/longitude
+    WEATHER_REQUEST_TIMEOUT = int(os.getenv("WEATHER_REQUEST_TIMEOUT", 5))  # seconds
     # WEATHER_FORECAST_URL = os.getenv("WEATHER_FORECAST_URL")
     # WEATHER_FORECAST_API_KEY = os.getenv("WEATHER_FORECAST_API_KEY")
     ROOM_IDS = list(map(int, os.getenv("ROOM_IDS", "").split(",")))
@@ -4,9 +4,15 @@ import time
 import threading
 import copy
 from datetime import date, datetime
-from typing import Literal, List
+from typing import List
 from config import Config, MyLogger
 from MyMQTT2 import MyMQTT
+from room_context import RoomContextCache
+from dispatcher import ReadingDispatcher
+from rules import RuleEngine
+from command_guard import CommandGuard
+from weather import WeatherCache
+from catalog_client import CatalogClient
 
 from utility import create_response
 
@@ -46,13 +52,22 @@ class Controler():
         self.device_topics = {}
         self.catalog_address = self.config.CATALOG_URL
         self.logger = MyLogger.get_main_loggger()
-        self.endpoint_cache = {}
+        self.catalog = CatalogClient(self.config, self.logger)
         self.broker = None
         self.port = None
         self.template = {}
+        self.room_contexts = RoomContextCache(ttl=self.config.ROOM_CONTEXT_TTL)
+        self.rules = RuleEngine()
+        self.command_guard = CommandGuard(min_dwell=self.config.COMMAND_MIN_DWELL,
+                                          repeat_interval=self.config.COMMAND_REPEAT_INTERVAL,
+                                          margins=self.config.HYSTERESIS_MARGINS)
         weather_forecast = self.get_weather_forecast() 
         self.forecast_url = weather_forecast.get("address", "")
         self.forecast_api_key = weather_forecast.get("key", "")
+        self.weather = WeatherCache(fetcher=self._fetch_outside_temperature,
+                                    ttl=self.config.WEATHER_CACHE_TTL,
+                                    grid_size=self.config.WEATHER_GRID_SIZE,
+                                    logger=self.logger)
         self.msg = {
             "bn": "",
             "e": [
@@ -67,10 +82,20 @@ class Controler():
         
         self.logger.info("Initiating the controler...")
         self.lock = threading.RLock()
+        # Readings are handed over by the MQTT thread and processed by the worker pool
+        self.dispatcher = ReadingDispatcher(handler=self.process_reading,
+                                            workers=self.config.WORKER_POOL_SIZE,
+                                            queue_size=self.config.INGEST_QUEUE_SIZE,
+                                            logger=MyLogger.set_logger(logger_name="DISPATCHER"))
         self.get_broker()
         self.initiate_mqtt()
         self.get_topic_template()
+        # Taken before the first update, so that the changes made during it are followed
+        cursor = self._get_changes_cursor()
         self.update_sensors_location_and_subscriptions(from_main=True)
+
+        # The periodic update stays as a fallback of the change feed
+        threading.Thread(target=self.follow_registry_changes, args=(cursor,), name="registry_changes", daemon=True).start()
         
         # self.start_sensors_update_thread(self)
 
@@ -78,57 +103,154 @@ class Controler():
     def update_sensors_location_and_subscriptions(self, from_main: bool=False):
         with self.lock:
             self.logger.info("Updating sensors and subscriptions...")
-            self._set_rooms_location()
-            self._outside_weather_update()
+            self._refresh_rooms()
             self._get_sensors()
             self._subscribe_to_sensors()
 
+        # Out of the lock, the forecast provider must not hold back the subscriptions
+        self._outside_weather_update()
+
         if from_main:
             # Schedule the next update if the method is not triggered by external requests
             threading.Timer(self.config.TOPICS_UPDATE_INTERVAL, lambda: self.update_sensors_location_and_subscriptions(from_main=True)).start()
 
 
-    def _set_rooms_location(self):
-        self.logger.info("Updating the room locations...")
+    def _get_changes_cursor(self):
+        # None when the registry can't be reached, the first poll then refreshes everything
+        result = self.catalog.follow_changes(None, ["devices", "rooms", "services"], wait=0)
+        if not result.success:
+            self.logger.error(f"Failed to get the registry changes cursor: {result.message}")
+            return None
+        return (result.content or {}).get("cursor")
 
-        for room in self.rooms:
-            room_location = self._get_room_location(room_id = room)
-            if self.rooms_location.get(room):
-                self.rooms_location[room]["location"] = room_location
-            else:
-                self.rooms_location[room] = {"location": room_location}
 
-        self.logger.info("Room locations updated.")
+    def follow_registry_changes(self, cursor: str=None):
+        while True:
+            result = self.catalog.follow_changes(cursor, ["devices", "rooms", "services"], wait=self.config.CHANGE_FEED_WAIT)
+            if not result.success:
+                self.logger.error(f"Failed to follow the registry changes: {result.message}")
+                time.sleep(self.config.CHANGE_FEED_RETRY_INTERVAL)
+                continue
 
+            content = result.content or {}
+            # A new cursor (no cursor from the start, registry restart or events lost) may have missed changes
+            reset = cursor is None or content.get("reset", False)
+            cursor = content.get("cursor")
+            if self._apply_registry_changes(content.get("events", []), reset):
+                # Changes arriving meanwhile are applied together with the next poll
+                time.sleep(self.config.CHANGE_FEED_MIN_REFRESH_INTERVAL)
 
-    def _get_room_location(self, room_id: int):
-        endpoint = self._discover_service(self.config.ROOMS_ENDPOINT, 'GET')
-        try:
-            if endpoint:    
-                url = f"{self.catalog_address}{endpoint}/{room_id}"
-            else:
-                self.logger.error(f"Failed to get rooms endpoint")
-                return
-            
-            self.logger.info(f"Fetching rooms information from {url}.")
-            response = requests.get(url)
-            response.raise_for_status()
-            rooms_response = response.json()
-
-            if rooms_response.get("success"):
-                rooms_list = rooms_response["content"]
-                if rooms_list:
-                    room = rooms_list[0]
-                    location = room.get("location", {})
-                    return location
-            
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch rooms information: {e}")
-        return {}
+
+    def _apply_registry_changes(self, events: List[dict], reset: bool) -> bool:
+        # Returns True when the rooms were refreshed
+        if reset or any(event["collection"] == "services" for event in events):
+            self.catalog.invalidate()
+        if reset:
+            self.update_sensors_location_and_subscriptions()
+            return True
+
+        # The status updates (those following our own commands among them) leave the contexts as they are
+        touched = [event for event in events if event["collection"] in ("devices", "rooms")
+                   and not (event.get("fields") and set(event["fields"]) <= {"deviceStatus"})]
+        # roomIds is missing when the registry couldn't tell which rooms were touched
+        if any(event.get("roomIds") is None for event in touched):
+            self.logger.info("Change of unknown rooms received from the registry.")
+            self.update_sensors_location_and_subscriptions()
+            return True
+
+        room_ids = sorted({room_id for event in touched for room_id in event["roomIds"] if room_id in self.rooms})
+        if not room_ids:
+            return False
+        sensor_room_ids = sorted({room_id for event in touched if event["collection"] == "devices"
+                                  for room_id in event["roomIds"] if room_id in self.rooms})
+        self.logger.info(f"Change(s) of the rooms {room_ids} received from the registry.")
+        with self.lock:
+            snapshots = self._get_room_snapshots(room_ids)
+            for room_id in room_ids:
+                self._refresh_room(room_id, snapshots)
+            if sensor_room_ids:
+                self._get_sensors(sensor_room_ids)
+                self._subscribe_to_sensors()
+        return True
+
+
+    def _refresh_rooms(self):
+        self.logger.info("Updating the room locations and decision contexts...")
+        # A single request for all the rooms, joined with their plant kinds and devices
+        snapshots = self._get_room_snapshots(self.rooms)
+        for room_id in self.rooms:
+            self._refresh_room(room_id, snapshots)
+
+        self.logger.info("Room locations and decision contexts updated.")
+
+
+    def _refresh_room(self, room_id: int, snapshots: dict=None):
+        self.room_contexts.mark_attempt(room_id)
+        if snapshots is None:
+            snapshots = self._get_room_snapshots([room_id])
+        room = snapshots.get(room_id)
+        if not room:
+            self.logger.error(f"Failed to refresh the context of room {room_id}")
+            return
+
+        room_location = room.get("location", {})
+        if self.rooms_location.get(room_id):
+            self.rooms_location[room_id]["location"] = room_location
+        else:
+            self.rooms_location[room_id] = {"location": room_location}
+
+        plant_kind = room.get("plantKind", "")
+        plant_kind_info = room.get("plantKindInfo") or {}
+        # Thresholds are compiled again only when the plant kind changed in the registry
+        if plant_kind_info and self.rules.load(plant_kind, plant_kind_info):
+            self.logger.info(f"Rules of plant kind {plant_kind} (re)compiled.")
+
+        actuators = [device for device in room.get("devices", []) if device.get("deviceType") == "actuator"]
+        self.room_contexts.set(room_id,
+                               plant_kind=plant_kind,
+                               plant_kind_info=plant_kind_info,
+                               plant_date=room.get("plantDate") or "2001-01-01",
+                               actuators=actuators)
+
+
+    def _get_room_context(self, room_id: int):
+        if self.room_contexts.get(room_id) is None and room_id in self.rooms:
+            # Expired or missing context, refreshed at most once per retry interval. Out of the
+            # message path: the stale context is served meanwhile
+            if not self.room_contexts.recently_attempted(room_id, self.config.ROOM_CONTEXT_RETRY_INTERVAL):
+                self.logger.info(f"Context of room {room_id} expired, refreshing it...")
+                self.room_contexts.mark_attempt(room_id)
+                threading.Thread(target=self._refresh_room_locked, args=(room_id,),
+                                 name=f"room_context_{room_id}", daemon=True).start()
+        return self.room_contexts.get(room_id, stale=True)
+
+
+    def _refresh_room_locked(self, room_id: int):
+        # rooms_location and the rules are shared with the periodic and change feed refreshes
+        with self.lock:
+            self._refresh_room(room_id)
+
+
+    def _get_room_snapshots(self, room_ids: List[int]) -> dict:
+        # room_id -> the room with its plantKindInfo, plants and devices
+        if not room_ids:
+            return {}
+        endpoint = self.catalog.discover(self.config.ROOMS_ENDPOINT, 'GET', sub_path="snapshot")
+        if not endpoint:
+            self.logger.error(f"Failed to get room snapshots endpoint")
+            return {}
+
+        url = f"{self.catalog_address}{endpoint}"
+        self.logger.info(f"Fetching snapshots of rooms {room_ids} from {url}.")
+        result = self.catalog.fetch("GET", url, params={"rooms": ",".join(map(str, room_ids))})
+        if not result.success:
+            self.logger.error(f"Failed to fetch rooms information: {result.message}")
+            return {}
+        return {room.get("roomId"): room for room in result.content or []}
 
 
     def get_weather_forecast(self):
-        endpoint = self._discover_service(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint = self.catalog.discover(self.config.GENERAL_ENDPOINT, 'GET')
         output = {}
         try:
             if endpoint:    
@@ -137,7 +259,7 @@ class Controler():
                 self.logger.error(f"Failed to get weather forecast's endpoint")
                 
             self.logger.info(f"Fetching weather forecast information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             json_data = response.json()
 
@@ -207,12 +329,13 @@ class Controler():
         
 
 
-    def _get_sensors(self):
+    def _get_sensors(self, room_ids: List[int]=None):
         with self.lock:
             # Remove sensors whose roomId is not in self.rooms
             self.sensors = [sensor for sensor in self.sensors if sensor["deviceLocation"]["roomId"] in self.rooms]
 
-            for room_id in self.rooms:
+            # All the rooms, or only those changed in the registry
+            for room_id in room_ids or self.rooms:
                 sensors = self._get_devices(device_type="sensor", room_id=room_id)
                 for sensor in sensors:
                     if sensor not in self.sensors:
@@ -236,7 +359,7 @@ class Controler():
     }
         
         params = {k: v for k, v in local_vars.items() if v is not None}
-        endpoint = self._discover_service(self.config.DEVICES_ENDPOINT, 'GET')
+        endpoint = self.catalog.discover(self.config.DEVICES_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}"
@@ -245,7 +368,7 @@ class Controler():
                 return
             
             self.logger.info(f"Fetching sensors information from {url} with params: {params}")
-            response = requests.get(url, params)
+            response = self.catalog.get(url, params)
             response.raise_for_status()
             devices_response = response.json()
 
@@ -262,7 +385,7 @@ class Controler():
 
 
     def get_broker(self):
-        endpoint = self._discover_service(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint = self.catalog.discover(self.config.GENERAL_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}/broker"
@@ -271,7 +394,7 @@ class Controler():
                 return
             
             self.logger.info(f"Fetching broker information from {url} ...")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             broker_response = response.json()
 
@@ -291,45 +414,8 @@ class Controler():
             self.logger.error(f"Invalid broker information received: {e}")
 
 
-    def _discover_service(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None):
-        # Return the endpoint from the cache
-        if item in self.endpoint_cache and method in self.endpoint_cache[item]:
-            return self.endpoint_cache[item][method]
-
-        try:
-            url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}/{self.config.SERVICE_REGISTRY_NAME}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            service_response = response.json()
-
-            if service_response.get("success"):
-                # Extract the service registry from the response
-                service_registry = service_response.get("content", [[]])
-                service = service_registry[0]
-                if service:
-                    endpoints = service.get("endpoints", [])
-                    for endpoint in endpoints:
-                        path = endpoint.get("path", "")
-                        service_method = endpoint.get("method", "")
-
-                        if item in path and method == service_method:
-                            if sub_path:
-                                if sub_path in path:
-                                    self.endpoint_cache.setdefault(item, {})[method] = path
-                                    return path
-                            else:
-                                self.endpoint_cache.setdefault(item, {})[method] = path
-                                return path
-                            
-            self.logger.error(f"Failed to discover service endpoint")
-
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch services endpoint: {e}")
-
-
     def get_topic_template(self):
-        endpoint = self._discover_service(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint = self.catalog.discover(self.config.GENERAL_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}/template"
@@ -338,7 +424,7 @@ class Controler():
                 return
             
             self.logger.info(f"Fetching template information from {url} ...")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             template_response = response.json()
 
@@ -368,6 +454,7 @@ class Controler():
 
     def stop_mqtt(self):
         self.mqtt_client.stop()
+        self.dispatcher.stop()
 
 
 
@@ -385,6 +472,7 @@ class Controler():
 
             # Add new rooms to self.rooms
             self.rooms.extend(rooms_to_add)
+            self.room_contexts.invalidate(list(rooms_to_add))
             
             # Log the rooms that were added
             for room in rooms_to_add:
@@ -409,7 +497,9 @@ class Controler():
             intersection = current_rooms_set & removable_rooms_set
             for room in intersection:
                 self.rooms.remove(room)
+                self.rooms_location.pop(room, None)
                 self.logger.info(f"Room {room} eliminated.")
+            self.room_contexts.invalidate(list(intersection))
 
             response = create_response(True, message=f"Eliminated rooms: {list(intersection)}.", status=200)
 
@@ -443,6 +533,10 @@ class Controler():
         msg_info["measure_type"] = event['n']
         msg_info["value"] = event['v']
 
+        # Runs on the MQTT network thread, the decision is taken by the worker of the room
+        self.dispatcher.submit(msg_info.get("room_id"), topic, msg_info)
+
+    def process_reading(self, msg_info: dict):
         # Classifing and analysing the data according to the type of measurements
         if msg_info["measure_type"] == "temperature":
             self.send_temp_command(msg_info)
@@ -466,76 +560,6 @@ class Controler():
             topic += msg_info.get(reversed_template[index]) + "/"
         return topic.rstrip("/")
     
-    def _get_plant_kind_for_room(self, msg_info: dict):
-        endpoint = self._discover_service("rooms", 'GET')
-        try:
-            if endpoint:    
-                url = f"{self.catalog_address}{endpoint}/{msg_info.get('room_id')}"
-            else:
-                self.logger.error(f"Failed to get rooms endpoint")
-                return
-            
-            response = requests.get(url)
-            response.raise_for_status()
-            rooms_response = response.json()
-
-            if rooms_response.get("success"):
-                rooms_list = rooms_response["content"]
-                if rooms_list:
-                    room = rooms_list[0]
-                    plant_kind = room.get("plantKind", "")
-                    return plant_kind
-            return ""
-            
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch rooms information: {e}")
-    
-    def _get_plant_date_for_room(self, msg_info: dict):
-        endpoint = self._discover_service("rooms", 'GET')
-        try:
-            if endpoint:    
-                url = f"{self.catalog_address}{endpoint}/{msg_info.get('room_id')}"
-            else:
-                self.logger.error(f"Failed to get rooms endpoint")
-                return
-            
-            response = requests.get(url)
-            response.raise_for_status()
-            rooms_response = response.json()
-
-            if rooms_response.get("success"):
-                rooms_list = rooms_response["content"]
-                if rooms_list:
-                    room = rooms_list[0]
-                    plant_date = room.get("plantDate", "")
-                    return plant_date
-            return "2001-01-01"
-            
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch rooms information: {e}")
-
-    def _get_plant_kind_info(self, plant_kind: str):
-        endpoint = self._discover_service("plant_kinds", 'GET')
-        try:
-            if endpoint:    
-                url = f"{self.catalog_address}{endpoint}/{plant_kind}"
-            else:
-                self.logger.error(f"Failed to get plant_kinds endpoint")
-                return
-            
-            response = requests.get(url)
-            response.raise_for_status()
-            plant_kinds_response = response.json()
-
-            if plant_kinds_response.get("success"):
-                plant_kinds_list = plant_kinds_response["content"]
-                if plant_kinds_list:
-                    return plant_kinds_list[0]
-            return {}
-            
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch rooms information: {e}")
-
     def _find_topic_for_actuator(self, actuators: list, actuator_name: str):
         topic = ""
         for actuator in actuators:
@@ -547,317 +571,83 @@ class Controler():
 
     # Processing the temperature data
     def send_temp_command(self, msg_info: dict):
-        # # Topic preparation according to the universal template
-        # topic = self._prepare_topic(msg_info)
-
-        # Get corressponding plant kind
-        plant_kind = self._get_plant_kind_for_room(msg_info)
-        if not plant_kind:
-            self.logger.error(f"Faild to figure out plant kind for room {msg_info['room_id']}")
-        
-        # Getting the suitable temperature of the corresponding plant kind
-        plant_kind_dict = self._get_plant_kind_info(plant_kind)
-        if not plant_kind_dict:
-                self.logger.error(f"Faild to get plant kind information for plant kind {plant_kind}")
-            
-        minTemp, maxTemp, bestTempRange = plant_kind_dict.get("coldestTemperature"), plant_kind_dict.get("hottestTemperature"), plant_kind_dict.get("bestTemperatureRange")
-        outTemp = self.rooms_location.get(int(msg_info["room_id"])).get("outsideTemperature", 0)
-        
-        # Status of the temp actuators of the plant     
-        fan_status, heater_status, window_status = None, None, 'DISABLE'
-        # Fetch temperature actuators of the room
-        actuators = self._get_devices(measure_type="temperature", device_type="actuator", room_id=int(msg_info["room_id"]))
-        for actuator in actuators:
-            if actuator["deviceName"] == "fan_switch":
-                fan_status = actuator.get("deviceStatus")
-            
-            elif actuator["deviceName"] == "heater_switch":
-                heater_status = actuator.get("deviceStatus")
-
-            elif actuator["deviceName"] == "window_switch":
-                window_status = actuator.get("deviceStatus", "DISABLE")
-
-        if not (fan_status and heater_status):
-            self.logger.error('Failed to get the status of the fan and heater')
-            return
-
-        # Checking if actuator is operating
-        if (fan_status and heater_status) != "DISABLE":
-            # Structure the SenML message
-            msg = copy.deepcopy(self.msg)
-            msg["e"][0]["t"] = str(time.time())
-            
-
-            ### Check the temperature regarding the plant suitable temperature
-            # Check if temperature is less than minimum threshold
-            value = msg_info["value"]
-            corresponding_actuator = ""
-            if value < minTemp:
-                if window_status != "DISABLE":
-                    if value > outTemp and outTemp > minTemp and window_status == "CLOSE":
-                        self.logger.info("Temperature less than threshold, OPEN the window")
-                        corresponding_actuator = "window_switch"
-                        msg["e"][0]["v"] = "OPEN"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-                    elif heater_status == "OFF":
-                        self.logger.info("Temperature less than threshold, Turn ON the heater")
-                        corresponding_actuator = "heater_switch"
-                        msg["e"][0]["v"] = "ON"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-                else:
-                    if heater_status == "OFF":
-                        self.logger.info("Temperature less than threshold, Turn ON the heater")
-                        corresponding_actuator = "heater_switch"
-                        msg["e"][0]["v"] = "ON"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-                    if fan_status == "ON":
-                        self.logger.info("Temperature less than threshold, Turn OFF the fan")
-                        corresponding_actuator = "fan_switch"
-                        msg["e"][0]["v"] = "OFF"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-
-            # Check if temperature is more than maximum threshold
-            elif value > maxTemp:
-                if window_status != "DISABLE":
-                    if value < outTemp and outTemp < maxTemp and window_status == "OPEN":
-                        self.logger.info("Temperature more than threshold, CLOSE the window")
-                        corresponding_actuator = "window_switch"
-                        msg["e"][0]["v"] = "CLOSE"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-                    elif fan_status == "OFF":
-                        self.logger.info("Temperature more than threshold, Turn ON the fan")
-                        corresponding_actuator = "fan_switch"
-                        msg["e"][0]["v"] = "ON"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-                else:
-                    if fan_status == "OFF":
-                        self.logger.info("Temperature more than threshold, Turn ON the fan")
-                        corresponding_actuator = "fan_switch"
-                        msg["e"][0]["v"] = "ON"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-                    if heater_status == "ON":
-                        self.logger.info("Temperature more than threshold, Turn OFF the heater")
-                        corresponding_actuator = "heater_switch"
-                        msg["e"][0]["v"] = "OFF"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-            
-            # Check if temperature is in the optimal range
-            elif bestTempRange[0] <= value <= bestTempRange[1]:
-                if window_status != "DISABLE":
-                    if outTemp not in range(bestTempRange[0], bestTempRange[1]) and window_status == "OPEN":
-                        self.logger.info("Temperature in optimal range, but outside temperature is not optimal, CLOSE the window")
-                        corresponding_actuator = "window_switch"
-                        msg["e"][0]["v"] = "CLOSE"
-                        self.publish_command(actuators, corresponding_actuator, msg)
-                if heater_status == "ON":
-                    self.logger.info("Temperature in optimal range, turn OFF the heater")
-                    corresponding_actuator = "heater_switch"
-                    msg["e"][0]["v"] = "OFF"
-                    self.publish_command(actuators, corresponding_actuator, msg)
-                if fan_status == "ON":
-                    self.logger.info("Temperature in optimal range, turn OFF the fan")
-                    corresponding_actuator = "fan_switch"
-                    msg["e"][0]["v"] = "OFF"
-                    self.publish_command(actuators, corresponding_actuator, msg)
-        else:
-            self.logger.warning("The heating actuators are DISABLE!")
+        self._apply_rules(msg_info, measure_type="temperature")
 
 
     # Processing the brightness data and send command if intervention is needed
     def send_light_command(self, msg_info: dict):
-        # Get corressponding plant kind
-        plant_kind = self._get_plant_kind_for_room(msg_info)
-        if not plant_kind:
-            self.logger.error(f"Faild to figure out plant kind for room {msg_info['room_id']}")
-        
-        plant_kind_dict = self._get_plant_kind_info(plant_kind)
-        if not plant_kind_dict:
-            self.logger.error(f"Faild to get plant kind information for plant kind {plant_kind}")
-                
-        vegetative_light_range, flowering_light_rang = plant_kind_dict["vegetativeLightRange"], plant_kind_dict["floweringLightRang"]
-
-        # Status of the light switch actuators of the plant
-        light_switch_status = None
-        # Fetch light actuators of the room
-        actuators = self._get_devices(measure_type="light", device_type="actuator", room_id=int(msg_info["room_id"]))
-        actuator = actuators[0]
-        light_switch_status = actuator.get("deviceStatus")
-        
-        if not light_switch_status:
-            self.logger.error('Failed to get the status of the light switch')
-
-        # Checking if actuator is operating
-        if light_switch_status != "DISABLE":
-            plant_date = self._get_plant_date_for_room(msg_info)
-            plant_age = self.days_difference_from_today(plant_date)
-
-            # Structure the SenML message
-            msg = copy.deepcopy(self.msg)
-            msg["e"][0]["t"] = str(time.time())
-            command_value = None
-            value = msg_info["value"]
-
-            ## availableStatuses: ["OFF","LOW","MID","HIGH"]
-            # Vegetative stage
-            if plant_age <= 15:
-                # If brightness is less that what is expected in vegetetive stage
-                # Ligh switch will be put on one level stronger
-                if value < vegetative_light_range[0]:
-                    if light_switch_status == "OFF":
-                        command_value = "LOW"
-                    elif light_switch_status == "LOW":
-                        command_value = "MID"
-                    elif light_switch_status == "MID":
-                        command_value = "HIGH"
-
-                # If brightness is in the range of flowering stage
-                # Ligh switch will be put on one level weaker
-                elif value in range(flowering_light_rang[0], flowering_light_rang[1]):
-                    if light_switch_status == "HIGH":
-                        command_value = "MID"
-                    elif light_switch_status == "MID":
-                        command_value = "LOW"
-                    elif light_switch_status == "LOW":
-                        command_value = "OFF"
-
-                # If brightness is way more than what is expected 
-                # Ligh switch will be shut down
-                elif value > flowering_light_rang[1]:
-                    if light_switch_status != "OFF":
-                        command_value = "OFF"
-                    
-
-            # Flowering stage
-            elif plant_age > 15:
-                ## Set the switch to full power
-                if value < vegetative_light_range[0]:
-                    if light_switch_status != "HIGH":
-                        command_value = "HIGH"
-
-                # One level forward
-                elif value in range(vegetative_light_range[0], vegetative_light_range[1]):
-                    if light_switch_status == "OFF":
-                        command_value = "LOW"
-                    elif light_switch_status == "LOW":
-                        command_value = "MID"
-                    elif light_switch_status == "MID":
-                        command_value = "HIGH"
-
-                # One level backward
-                elif value > flowering_light_rang[1]:
-                    if light_switch_status == "HIGH":
-                        command_value = "MID"
-                    elif light_switch_status == "MID":
-                        command_value = "LOW"
-                    elif light_switch_status == "LOW":
-                        command_value = "OFF"
-
-            if command_value:
-                msg["e"][0]["v"] = command_value
-                self.publish_command(actuators, "light_switch", msg)
-        else:
-            self.logger.warning("Light actuator is DISABLE!")
+        self._apply_rules(msg_info, measure_type="light")
 
 
     # Processing the PH data and send command if intervention is needed
     def send_PH_command(self, msg_info: dict):
-        # Get corressponding plant kind
-        plant_kind = self._get_plant_kind_for_room(msg_info)
-        if not plant_kind:
-            self.logger.error(f"Faild to figure out plant kind for room {msg_info['room_id']}")
-        
-        plant_kind_dict = self._get_plant_kind_info(plant_kind)
-        if not plant_kind_dict:
-            self.logger.error(f"Faild to get plant kind information for plant kind {plant_kind}")
-                
-        PH_range = plant_kind_dict["PHRange"]
-
-        # Status of the PH switch actuators of the plant
-        PH_actuator_status = None
-        # Fetch PH actuator of the plant
-        actuators = self._get_devices(measure_type="PH", device_type="actuator", 
-                                      room_id=int(msg_info["room_id"]), plant_id=int(msg_info["plant_id"]))
-        if not actuators:
-            return
-        actuator = actuators[0]
-        PH_actuator_status = actuator["deviceStatus"]
-        
-        if not PH_actuator_status:
-            self.logger.error('Failed to get the status of the PH actuator')
-
-        # Checking if actuator is operating
-        if PH_actuator_status != "DISABLE":
-            # Structure the SenML message
-            msg = copy.deepcopy(self.msg)
-            msg["e"][0]["t"] = str(time.time())
-            command_value = None
-            value = msg_info["value"]
-
-            # Setting the command
-            if value < PH_range[0]:
-                command_value = "release_PH_high"
-            elif value > PH_range[1]:
-                command_value = "release_PH_low"
-
-            if command_value:
-                msg["e"][0]["v"] = command_value
-                self.publish_command(actuators, "PH_actuator", msg)
-        else:
-            self.logger.warning("PH actuator is DISABLE!")
+        self._apply_rules(msg_info, measure_type="PH", plant_id=int(msg_info["plant_id"]))
 
 
     # Processing the water level data and send command if intervention is needed
     def send_soilMoisture_command(self, msg_info: dict):
-        # Get corressponding plant kind
-        plant_kind = self._get_plant_kind_for_room(msg_info)
-        if not plant_kind:
-            self.logger.error(f"Faild to figure out plant kind for room {msg_info['room_id']}")
-        
-        plant_kind_dict = self._get_plant_kind_info(plant_kind)
-        if not plant_kind_dict:
-            self.logger.error(f"Faild to get plant kind information for plant kind {plant_kind}")
-                
-        minMoisture = plant_kind_dict["volumetricWaterContent"][0]
+        self._apply_rules(msg_info, measure_type="soil_moisture", plant_id=int(msg_info["plant_id"]))
+
+
+    def _apply_rules(self, msg_info: dict, measure_type: str, plant_id: int=None):
+        room_id = int(msg_info["room_id"])
+        # Served from the room context cache, no request to the registry on the hot path
+        context = self._get_room_context(room_id)
+        if not context:
+            self.logger.error(f"No decision context available for room {room_id}")
+            return
+        if not context["plantKind"]:
+            self.logger.error(f"Faild to figure out plant kind for room {room_id}")
+            return
+        if not self.rules.is_loaded(context["plantKind"]):
+            self.logger.error(f"Faild to get plant kind information for plant kind {context['plantKind']}")
+            return
 
-        # Status of the light switch actuators of the plant
-        irrigator_status = None
-        # Fetch irrigator of the plant
-        actuators = self._get_devices(measure_type="soil_moisture", device_type="actuator", 
-                                      room_id=int(msg_info["room_id"]), plant_id=int(msg_info["plant_id"]))
+        actuators = self.room_contexts.get_actuators(room_id, measure_type=measure_type, plant_id=plant_id, stale=True)
         if not actuators:
             return
-        actuator = actuators[0]
-        irrigator_status = actuator["deviceStatus"]
-        
-        if not irrigator_status:
-            self.logger.error('Failed to get the status of the irrigator')
+        statuses = {actuator["deviceName"]: actuator.get("deviceStatus") for actuator in actuators}
+        if all(status in [None, "DISABLE"] for status in statuses.values()):
+            self.logger.warning(f"The {measure_type} actuators of room {room_id} are DISABLE!")
+            return
 
-        # Checking if actuator is operating
-        if irrigator_status != "DISABLE":
+        plant_age = self.days_difference_from_today(context["plantDate"]) if measure_type == "light" else 0
+        outside_temperature = self.rooms_location.get(room_id, {}).get("outsideTemperature", 0)
+        commands = self.rules.evaluate(context["plantKind"], measure_type, msg_info["value"], statuses,
+                                       plant_age=plant_age, outside_temperature=outside_temperature)
+
+        band, distance = self.rules.locate(context["plantKind"], measure_type, msg_info["value"], plant_age=plant_age)
+        for actuator_name, command in commands:
             # Structure the SenML message
             msg = copy.deepcopy(self.msg)
             msg["e"][0]["t"] = str(time.time())
-            command_value = None
-            value = msg_info["value"]
-
-            # Setting the command
-            if value < minMoisture:
-                command_value = "pour_water"
-
-            if command_value:
-                msg["e"][0]["v"] = command_value
-                self.publish_command(actuators, "irrigator", msg)
-        else:
-            self.logger.warning("Irrigator is DISABLE!")
+            msg["e"][0]["v"] = command
+            self.publish_command(actuators, actuator_name, msg, measure_type=measure_type, band=band, distance=distance)
 
 
 
-    def publish_command(self, actuators, corresponding_actuator, msg):
+    def publish_command(self, actuators, corresponding_actuator, msg, measure_type: str=None, band: str=None, distance: float=None):
         # Sending command to the actuators 
             topic = self._find_topic_for_actuator(actuators, corresponding_actuator)
+            command = msg['e'][0]['v']
+            if not topic:
+                self.logger.error(f"No MQTT topic found for the actuator {corresponding_actuator}, {command} not sent.")
+                return
+            allowed, reason = self.command_guard.allow(topic, command, measure_type=measure_type, band=band, distance=distance)
+            if not allowed:
+                self.logger.debug(f"{command} on topic {topic} suppressed ({reason}).")
+                return
+
             msg['bn'] = topic   
             self.mqtt_client.publish(topic, msg)
-            self.logger.info(f"{msg['e'][0]['v']} is published on topic: {topic}")
+            self.logger.info(f"{command} is published on topic: {topic}")
+
+            # The registry is updated by the device connector, meanwhile the cached status follows the command
+            for actuator in actuators:
+                if actuator["deviceName"] == corresponding_actuator:
+                    self.room_contexts.update_actuator_status(actuator["deviceLocation"]["roomId"],
+                                                              actuator["deviceId"],
+                                                              command)
 
 
     def days_difference_from_today(self, plantingDate):
@@ -875,40 +665,42 @@ class Controler():
     
     # Gets and adds the outter temperature to the plant dict
     def _outside_weather_update(self):
-        pre_location = {"lat": "","lon": ""}
-        default_temp = 0
-        for room_id, outside_dict in self.rooms_location.items():
+        for room_id, outside_dict in list(self.rooms_location.items()):
             location = outside_dict.get("location")
-            if not location:
+            if not location or location.get("lat") in [None, ""] or location.get("lon") in [None, ""]:
+                continue
+
+            current_temp = self.weather.get_temperature(location["lat"], location["lon"])
+            if current_temp is None:
+                # Neither fresh nor stale forecast available, keep the previous value
+                outside_dict.setdefault("outsideTemperature", 0)
                 continue
+            outside_dict["outsideTemperature"] = current_temp
+            self.logger.info(f"Outside temperature of {current_temp} degree recieved for the room {room_id}")
+
+
+    def _fetch_outside_temperature(self, lat: float, lon: float):
+        # call forecast api
+        req = requests.get(url=self.forecast_url, params={
+            "lat": lat,
+            "lon": lon,
+            "sections": "current",
+            "key": self.forecast_api_key
+        }, timeout=self.config.WEATHER_REQUEST_TIMEOUT)
+        req.raise_for_status()
+        forecast_dict = req.json()
+        current = forecast_dict.get("current")
+        if not current or current.get("temperature") is None:
+            raise ValueError(f"No current temperature in the forecast: {forecast_dict}")
+        return current["temperature"]
+
 
-            if location.get("lat") == pre_location.get("lat"):
-                current_temp = default_temp
-                self.rooms_location[room_id]["outsideTemperature"] = current_temp
-
-            # to avoid api call many times for the same location at the same time
-            else:    
-                # call forecast api
-                try:
-                    req = requests.get(url=self.forecast_url, params={
-                        "lat": location["lat"],
-                        "lon": location["lon"],
-                        "sections": "current",
-                        "key": self.forecast_api_key
-                    })
-                    forecast_dict = req.json()
-                except requests.exceptions as e:
-                    self.logger.debug(f"Error fetching weatherforcast from api: {str(e)}")
-                    forecast_dict = {}
-                # clean it and attach to plant dictionary 
-                current_temp = forecast_dict["current"].get("temperature", 0)
-                self.rooms_location[room_id]["outsideTemperature"] = current_temp
-                self.logger.info(f"Outside temperature of {current_temp} degree recieved for the room {room_id}")
-
-                pre_location = location
-                default_temp = current_temp
 
 
+    def get_metrics(self):
+        return {"ingest": self.dispatcher.stats(),
+                "commands": self.command_guard.stats(),
+                "weather": self.weather.stats()}
 
 
     def fetch_actuators(self, room_id):
@@ -0,0 +1,128 @@
+'''Bounded ingest queue and worker pool between the MQTT callback and the decision logic'''
+import math
+import time
+import threading
+from collections import deque
+
+
+class _Partition():
+    def __init__(self, index: int, capacity: int):
+        self.index = index
+        self.capacity = capacity
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.max_depth = 0
+
+
+class ReadingDispatcher():
+    """Readings of the same room always land on the same worker, so their order is preserved.
+    When a partition is full, only the latest reading of each topic is kept and, if that
+    is still not enough, the oldest reading is dropped."""
+
+    def __init__(self, handler, workers: int, queue_size: int, logger):
+        self.handler = handler
+        self.logger = logger
+        self.workers = max(1, workers)
+        self.queue_size = max(self.workers, queue_size)
+        capacity = math.ceil(self.queue_size / self.workers)
+        self.partitions = [_Partition(index, capacity) for index in range(self.workers)]
+
+        self.stats_lock = threading.Lock()
+        self.counters = {"received": 0, "processed": 0, "failed": 0, "coalesced": 0, "dropped": 0}
+        self.processing_time = 0.0
+        self.running = True
+
+        self.threads = []
+        for partition in self.partitions:
+            thread = threading.Thread(target=self._work, args=(partition,),
+                                      name=f"reading_worker_{partition.index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.logger.info(f"Reading dispatcher started with {self.workers} workers and a queue of {self.queue_size}.")
+
+
+    def submit(self, partition_key, topic: str, reading):
+        partition = self.partitions[hash(str(partition_key)) % self.workers]
+        with partition.condition:
+            if len(partition.queue) >= partition.capacity:
+                self._relieve(partition, topic)
+            partition.queue.append((topic, reading))
+            partition.max_depth = max(partition.max_depth, len(partition.queue))
+            partition.condition.notify()
+        self._count("received")
+
+
+    def _relieve(self, partition: _Partition, incoming_topic: str):
+        # Keep only the latest reading of every topic, in the order they were received
+        latest = {incoming_topic: None}
+        for position, (topic, _) in enumerate(partition.queue):
+            latest[topic] = position
+        if latest[incoming_topic] is None:
+            del latest[incoming_topic]
+        else:
+            # The incoming reading supersedes the queued one of the same topic
+            latest[incoming_topic] = -1
+        kept = deque(item for position, item in enumerate(partition.queue) if latest[item[0]] == position)
+        coalesced = len(partition.queue) - len(kept)
+        partition.queue = kept
+        if coalesced:
+            self._count("coalesced", coalesced)
+
+        if len(partition.queue) >= partition.capacity:
+            topic, _ = partition.queue.popleft()
+            self._count("dropped")
+            self.logger.warning(f"Ingest queue {partition.index} is full, oldest reading of {topic} dropped.")
+
+
+    def _work(self, partition: _Partition):
+        while self.running:
+            with partition.condition:
+                while not partition.queue and self.running:
+                    partition.condition.wait()
+                if not self.running:
+                    return
+                topic, reading = partition.queue.popleft()
+
+            start = time.perf_counter()
+            try:
+                self.handler(reading)
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                self.logger.error(f"Failed to process the reading of {topic}: {e}")
+            with self.stats_lock:
+                self.processing_time += time.perf_counter() - start
+
+
+    def _count(self, counter: str, amount: int=1):
+        with self.stats_lock:
+            self.counters[counter] += amount
+
+
+    def stats(self) -> dict:
+        depths = []
+        for partition in self.partitions:
+            with partition.condition:
+                depths.append({"depth": len(partition.queue),
+                               "maxDepth": partition.max_depth,
+                               "capacity": partition.capacity})
+        with self.stats_lock:
+            counters = dict(self.counters)
+            processing_time = self.processing_time
+
+        processed = counters["processed"] + counters["failed"]
+        return {
+            "workers": self.workers,
+            "queueSize": self.queue_size,
+            "queueDepth": sum(partition["depth"] for partition in depths),
+            "partitions": depths,
+            **counters,
+            "avgProcessingMs": round(processing_time / processed * 1000, 3) if processed else 0
+        }
+
+
+    def stop(self):
+        self.running = False
+        for partition in self.partitions:
+            with partition.condition:
+                partition.condition.notify_all()
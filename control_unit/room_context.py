@@ -0,0 +1,80 @@
+'''In-process cache of the per-room information needed to take decisions'''
+import time
+import threading
+from typing import Optional, List
+
+
+class RoomContextCache():
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        # room_id -> {"plantKind", "plantKindInfo", "plantDate", "actuators", "updatedAt"}
+        self._contexts = {}
+        # room_id -> time of the last refresh attempt, to avoid hammering the registry
+        self._attempts = {}
+
+    def set(self, room_id: int, plant_kind: str, plant_kind_info: dict, plant_date: str, actuators: List[dict]):
+        with self.lock:
+            self._contexts[room_id] = {
+                "plantKind": plant_kind,
+                "plantKindInfo": plant_kind_info,
+                "plantDate": plant_date,
+                "actuators": actuators,
+                "updatedAt": time.monotonic()
+            }
+
+    def get(self, room_id: int, stale: bool=False) -> Optional[dict]:
+        # Returns None when the room is unknown or its context is expired (unless stale is accepted)
+        with self.lock:
+            context = self._contexts.get(room_id)
+            if not context or (not stale and time.monotonic() - context["updatedAt"] > self.ttl):
+                return None
+            return context
+
+    def mark_attempt(self, room_id: int):
+        with self.lock:
+            self._attempts[room_id] = time.monotonic()
+
+    def recently_attempted(self, room_id: int, window: int) -> bool:
+        with self.lock:
+            last_attempt = self._attempts.get(room_id)
+            return last_attempt is not None and time.monotonic() - last_attempt < window
+
+    def get_actuators(self, room_id: int, measure_type: str, plant_id: int=None, stale: bool=False) -> List[dict]:
+        context = self.get(room_id, stale=stale)
+        if not context:
+            return []
+
+        measure_type = measure_type.lower()
+        actuators = []
+        for actuator in context["actuators"]:
+            if measure_type not in [m.lower() for m in actuator.get("measureTypes", [])]:
+                continue
+            if plant_id is not None and actuator.get("deviceLocation", {}).get("plantId") != plant_id:
+                continue
+            actuators.append(actuator)
+        return actuators
+
+    def update_actuator_status(self, room_id: int, device_id: int, status: str):
+        # Keeps the cached status in line with the commands sent in the meantime
+        with self.lock:
+            context = self._contexts.get(room_id)
+            if not context:
+                return
+            for actuator in context["actuators"]:
+                if actuator.get("deviceId") == device_id and status in actuator.get("statusOptions", []):
+                    actuator["deviceStatus"] = status
+
+    def invalidate(self, room_ids: List[int]=None):
+        with self.lock:
+            if room_ids is None:
+                self._contexts.clear()
+                self._attempts.clear()
+                return
+            for room_id in room_ids:
+                self._contexts.pop(room_id, None)
+                self._attempts.pop(room_id, None)
+
+    def rooms(self) -> List[int]:
+        with self.lock:
+            return list(self._contexts.keys())
@@ -0,0 +1,265 @@
+'''Declarative actuator rules, compiled once per plant kind into sorted interval tables'''
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Plants younger than this (in days) are in the vegetative stage, older ones are flowering
+VEGETATIVE_STAGE_DAYS = 15
+ANY_STATUS = "*"
+
+## availableStatuses of the light switch: ["OFF","LOW","MID","HIGH"]
+STEP_UP = {"OFF": "LOW", "LOW": "MID", "MID": "HIGH"}
+STEP_DOWN = {"HIGH": "MID", "MID": "LOW", "LOW": "OFF"}
+TURN_OFF = {"LOW": "OFF", "MID": "OFF", "HIGH": "OFF"}
+FULL_POWER = {"OFF": "HIGH", "LOW": "HIGH", "MID": "HIGH"}
+
+# (stage, band) -> {current status -> command}
+LIGHT_RULES = {
+    # One level stronger when too dark, weaker in the flowering range and off above it
+    ("vegetative", "dark"): STEP_UP,
+    ("vegetative", "bright"): STEP_DOWN,
+    ("vegetative", "too_bright"): TURN_OFF,
+    # Full power when too dark, one level forward in the vegetative range, one backward above
+    ("flowering", "dark"): FULL_POWER,
+    ("flowering", "dim"): STEP_UP,
+    ("flowering", "too_bright"): STEP_DOWN,
+}
+
+PH_RULES = {
+    (None, "acidic"): {ANY_STATUS: "release_PH_high"},
+    (None, "alkaline"): {ANY_STATUS: "release_PH_low"},
+}
+
+SOIL_MOISTURE_RULES = {
+    (None, "dry"): {ANY_STATUS: "pour_water"},
+}
+
+# (band, window available) -> groups of (actuator, current status, command, condition on the outside)
+# Every group is evaluated, inside a group only the first applicable rule is fired.
+TEMPERATURE_RULES = {
+    ("cold", True): (
+        (("window_switch", "CLOSE", "OPEN", "outside_warms"), ("heater_switch", "OFF", "ON", None)),
+    ),
+    ("cold", False): (
+        (("heater_switch", "OFF", "ON", None),),
+        (("fan_switch", "ON", "OFF", None),),
+    ),
+    ("hot", True): (
+        (("window_switch", "OPEN", "CLOSE", "outside_cools"), ("fan_switch", "OFF", "ON", None)),
+    ),
+    ("hot", False): (
+        (("fan_switch", "OFF", "ON", None),),
+        (("heater_switch", "ON", "OFF", None),),
+    ),
+    ("optimal", True): (
+        (("window_switch", "OPEN", "CLOSE", "outside_not_optimal"),),
+        (("heater_switch", "ON", "OFF", None),),
+        (("fan_switch", "ON", "OFF", None),),
+    ),
+    ("optimal", False): (
+        (("heater_switch", "ON", "OFF", None),),
+        (("fan_switch", "ON", "OFF", None),),
+    ),
+}
+
+# The actuator commanded by the single-actuator measure types
+ACTUATOR_OF_MEASURE = {"light": "light_switch", "ph": "PH_actuator", "soil_moisture": "irrigator"}
+
+
+class IntervalTable():
+    """Maps a value to its band with a binary search over the sorted thresholds.
+    Segment 2i is the open interval right before thresholds[i] and segment 2i+1 is
+    thresholds[i] itself, so strict and non-strict bounds are both exact for floats."""
+
+    def __init__(self, thresholds: List[float], classify: Callable[[float], Optional[str]]):
+        self.thresholds = sorted(set(thresholds))
+        self.bands = []
+        previous = None
+        for threshold in self.thresholds:
+            below = threshold - 1 if previous is None else (previous + threshold) / 2
+            self.bands.append(classify(below))
+            self.bands.append(classify(threshold))
+            previous = threshold
+        self.bands.append(classify(previous + 1 if previous is not None else 0))
+
+    def lookup(self, value: float) -> Optional[str]:
+        index = bisect_left(self.thresholds, value)
+        if index < len(self.thresholds) and self.thresholds[index] == value:
+            return self.bands[2 * index + 1]
+        return self.bands[2 * index]
+
+    def distance(self, value: float) -> Optional[float]:
+        # To the closest threshold, i.e. to the closest band boundary
+        index = bisect_left(self.thresholds, value)
+        neighbours = self.thresholds[max(index - 1, 0):index + 1]
+        return min(abs(value - threshold) for threshold in neighbours) if neighbours else None
+
+
+class CompiledKind():
+    def __init__(self, plant_kind_info: dict):
+        self.tables = {}
+        self.temperature = None
+        self._compile_temperature(plant_kind_info)
+        self._compile_light(plant_kind_info)
+        self._compile_ph(plant_kind_info)
+        self._compile_soil_moisture(plant_kind_info)
+
+    def _compile_temperature(self, info: dict):
+        min_temp, max_temp = info.get("coldestTemperature"), info.get("hottestTemperature")
+        best_range = info.get("bestTemperatureRange")
+        if min_temp is None or max_temp is None or not best_range:
+            return
+        best_low, best_high = best_range[0], best_range[1]
+        self.temperature = (min_temp, max_temp, best_low, best_high)
+
+        def classify(value):
+            if value < min_temp:
+                return "cold"
+            if value > max_temp:
+                return "hot"
+            if best_low <= value <= best_high:
+                return "optimal"
+            return None
+        self.tables[("temperature", None)] = IntervalTable([min_temp, max_temp, best_low, best_high], classify)
+
+    def _compile_light(self, info: dict):
+        vegetative, flowering = info.get("vegetativeLightRange"), info.get("floweringLightRang")
+        if not vegetative or not flowering:
+            return
+
+        def classify_vegetative(value):
+            if value < vegetative[0]:
+                return "dark"
+            if flowering[0] <= value < flowering[1]:
+                return "bright"
+            if value > flowering[1]:
+                return "too_bright"
+            return None
+
+        def classify_flowering(value):
+            if value < vegetative[0]:
+                return "dark"
+            if vegetative[0] <= value < vegetative[1]:
+                return "dim"
+            if value > flowering[1]:
+                return "too_bright"
+            return None
+
+        thresholds = [vegetative[0], vegetative[1], flowering[0], flowering[1]]
+        self.tables[("light", "vegetative")] = IntervalTable(thresholds, classify_vegetative)
+        self.tables[("light", "flowering")] = IntervalTable(thresholds, classify_flowering)
+
+    def _compile_ph(self, info: dict):
+        ph_range = info.get("PHRange")
+        if not ph_range:
+            return
+
+        def classify(value):
+            if value < ph_range[0]:
+                return "acidic"
+            if value > ph_range[1]:
+                return "alkaline"
+            return None
+        self.tables[("ph", None)] = IntervalTable([ph_range[0], ph_range[1]], classify)
+
+    def _compile_soil_moisture(self, info: dict):
+        water_content = info.get("volumetricWaterContent")
+        if not water_content:
+            return
+        min_moisture = water_content[0]
+        self.tables[("soil_moisture", None)] = IntervalTable([min_moisture], lambda value: "dry" if value < min_moisture else None)
+
+    def outside_condition(self, condition: Optional[str], value: float, outside: float) -> bool:
+        if condition is None:
+            return True
+        min_temp, max_temp, best_low, best_high = self.temperature
+        if condition == "outside_warms":
+            return value > outside and outside > min_temp
+        if condition == "outside_cools":
+            return value < outside and outside < max_temp
+        if condition == "outside_not_optimal":
+            return not best_low <= outside <= best_high
+        return False
+
+
+class RuleEngine():
+    def __init__(self):
+        self.lock = threading.Lock()
+        # plant kind (lower case) -> (source thresholds, compiled tables)
+        self._kinds = {}
+
+    def load(self, plant_kind: str, plant_kind_info: dict) -> bool:
+        """Compiles the thresholds of a plant kind, only when they changed since the last load."""
+        key = plant_kind.lower()
+        with self.lock:
+            loaded = self._kinds.get(key)
+            if loaded and loaded[0] == plant_kind_info:
+                return False
+        compiled = CompiledKind(plant_kind_info)
+        with self.lock:
+            self._kinds[key] = (plant_kind_info, compiled)
+        return True
+
+    def is_loaded(self, plant_kind: str) -> bool:
+        with self.lock:
+            return plant_kind.lower() in self._kinds
+
+    @staticmethod
+    def growth_stage(plant_age: int) -> str:
+        return "vegetative" if plant_age <= VEGETATIVE_STAGE_DAYS else "flowering"
+
+    def locate(self, plant_kind: str, measure_type: str, value: float, plant_age: int=0) -> Tuple[Optional[str], Optional[float]]:
+        """Returns the band of a reading and its distance to the closest band threshold."""
+        with self.lock:
+            loaded = self._kinds.get(plant_kind.lower())
+        measure_type = measure_type.lower()
+        stage = self.growth_stage(plant_age) if measure_type == "light" else None
+        table = loaded[1].tables.get((measure_type, stage)) if loaded else None
+        if not table:
+            return None, None
+        value = float(value)
+        return table.lookup(value), table.distance(value)
+
+    def evaluate(self, plant_kind: str, measure_type: str, value: float, statuses: Dict[str, str],
+                 plant_age: int=0, outside_temperature: float=0) -> List[Tuple[str, str]]:
+        """Returns the (actuator name, command) pairs to send for a reading."""
+        with self.lock:
+            loaded = self._kinds.get(plant_kind.lower())
+        if not loaded:
+            return []
+        compiled = loaded[1]
+        measure_type = measure_type.lower()
+        value = float(value)
+
+        if measure_type == "temperature":
+            return self._evaluate_temperature(compiled, value, statuses, float(outside_temperature))
+
+        stage = self.growth_stage(plant_age) if measure_type == "light" else None
+        table = compiled.tables.get((measure_type, stage))
+        actuator_name = ACTUATOR_OF_MEASURE.get(measure_type)
+        if not table or not actuator_name:
+            return []
+
+        band = table.lookup(value)
+        rules = {"light": LIGHT_RULES, "ph": PH_RULES, "soil_moisture": SOIL_MOISTURE_RULES}[measure_type]
+        commands = rules.get((stage, band), {})
+        status = statuses.get(actuator_name)
+        if not status or status == "DISABLE":
+            return []
+        command = commands.get(status, commands.get(ANY_STATUS))
+        return [(actuator_name, command)] if command else []
+
+    def _evaluate_temperature(self, compiled: CompiledKind, value: float, statuses: Dict[str, str], outside: float):
+        table = compiled.tables.get(("temperature", None))
+        if not table:
+            return []
+        band = table.lookup(value)
+        window_available = statuses.get("window_switch", "DISABLE") != "DISABLE"
+
+        commands = []
+        for group in TEMPERATURE_RULES.get((band, window_available), ()):
+            for actuator_name, status, command, condition in group:
+                if statuses.get(actuator_name) == status and compiled.outside_condition(condition, value, outside):
+                    commands.append((actuator_name, command))
+                    break
+        return commands
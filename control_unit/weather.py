@@ -0,0 +1,70 @@
+'''Location-keyed cache of the outside temperature'''
+import time
+import threading
+from typing import Callable, Optional, Tuple
+
+
+class WeatherCache():
+    """Coordinates are rounded to a grid so that close rooms share the same entry.
+    Concurrent requests for the same cell wait for a single in-flight fetch, and the
+    last known temperature is served when the provider fails."""
+
+    def __init__(self, fetcher: Callable[[float, float], float], ttl: int, grid_size: float, logger):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.grid_size = grid_size
+        self.logger = logger
+        self.lock = threading.Lock()
+        # (lat, lon) cell -> {"temperature", "fetchedAt"}
+        self._entries = {}
+        # (lat, lon) cell -> threading.Event set when the in-flight fetch is over
+        self._in_flight = {}
+        self.counters = {"hits": 0, "fetches": 0, "failures": 0, "staleServed": 0}
+
+    def _cell(self, lat, lon) -> Tuple[float, float]:
+        return (round(round(float(lat) / self.grid_size) * self.grid_size, 6),
+                round(round(float(lon) / self.grid_size) * self.grid_size, 6))
+
+    def get_temperature(self, lat, lon) -> Optional[float]:
+        cell = self._cell(lat, lon)
+        with self.lock:
+            entry = self._entries.get(cell)
+            if entry and time.monotonic() - entry["fetchedAt"] < self.ttl:
+                self.counters["hits"] += 1
+                return entry["temperature"]
+
+            in_flight = self._in_flight.get(cell)
+            leader = in_flight is None
+            if leader:
+                in_flight = threading.Event()
+                self._in_flight[cell] = in_flight
+
+        if leader:
+            self._fetch(cell, in_flight)
+        else:
+            in_flight.wait()
+
+        with self.lock:
+            entry = self._entries.get(cell)
+            if entry and time.monotonic() - entry["fetchedAt"] >= self.ttl:
+                self.counters["staleServed"] += 1
+            return entry["temperature"] if entry else None
+
+    def _fetch(self, cell: Tuple[float, float], in_flight: threading.Event):
+        try:
+            temperature = self.fetcher(cell[0], cell[1])
+            with self.lock:
+                self._entries[cell] = {"temperature": temperature, "fetchedAt": time.monotonic()}
+                self.counters["fetches"] += 1
+        except Exception as e:
+            with self.lock:
+                self.counters["failures"] += 1
+            self.logger.error(f"Error fetching weather forecast for location {cell}: {e}")
+        finally:
+            with self.lock:
+                self._in_flight.pop(cell, None)
+            in_flight.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"locations": len(self._entries), **self.counters}
@@ -15,9 +15,12 @@ class WebControler():
     def GET(self, *uri, **params):
         print({"uri":uri, "param":params})
         if len(uri) < 1:
-            return create_response(False, message="No url inserted, try 'rooms'")
+            return create_response(False, message="No url inserted, try 'rooms' or 'metrics'")
         if uri[0] == "rooms":
             return create_response(True, content=self.controler.expose_rooms(), status=200)
+        if uri[0] == "metrics":
+            return create_response(True, content=self.controler.get_metrics(), status=200)
+        return create_response(False, message="No valid url inserted, try 'rooms' or 'metrics'", status=404)
 
     @cherrypy.tools.json_out()
     @cherrypy.tools.json_in()
@@ -5,9 +5,9 @@ import docker
 import json
 import socket
 import copy
-from typing import Literal
 from itertools import zip_longest
 from config import Config, MyLogger
+from catalog_client import CatalogClient
 
 
 class ControllerManager:
@@ -18,7 +18,7 @@ class ControllerManager:
         self.service_specification = {}
         self.logger = MyLogger.get_main_loggger()
         self.client = docker.from_env()
-        self.endpoint_cache = {}
+        self.catalog = CatalogClient(config, self.logger)
         self.controllers = {}
         self.load_state()
         self.load_service_specification()
@@ -58,48 +58,8 @@ class ControllerManager:
         except json.JSONDecodeError:
             self.logger.error(f"Error decoding JSON from file: {self.config.SERVICE_REGISTRY_FILE}")
 
-    def _discover_service_plus(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str = None, microservice: str = Config.SERVICE_REGISTRY_NAME):
-        internal_logger = MyLogger.set_logger("SERVICE_DISCOVERY")
-        # Return the endpoint from the cache
-        if item in self.endpoint_cache and method in self.endpoint_cache[item]:
-            return self.endpoint_cache[item][method], self.endpoint_cache[item]['host']
-
-        try:
-            url = f"{self.config.CATALOG_URL}/{self.config.SERVICES_ENDPOINT}/{microservice}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            service_response = response.json()
-
-            if service_response.get("success"):
-                # Extract the service registry from the response
-                service_registry = service_response.get("content", [[]])
-                service = service_registry[0]
-                if service:
-                    endpoints = service.get("endpoints", [])
-                    host = service.get("host", "")
-                    for endpoint in endpoints:
-                        path = endpoint.get("path", "")
-                        service_method = endpoint.get("method", "")
-
-                        if item in path and method == service_method:
-                            if sub_path:
-                                if sub_path in path:
-                                    self.endpoint_cache.setdefault(item, {})[method] = path
-                                    self.endpoint_cache[item]["host"] = host
-                                    return path, host
-                            else:
-                                self.endpoint_cache.setdefault(item, {})[method] = path
-                                self.endpoint_cache[item]["host"] = host
-                                return path, host
-
-            internal_logger.error("Failed to discover service endpoint")
-
-        except requests.RequestException as e:
-            internal_logger.error(f"Failed to fetch services endpoint: {e}")
-
     def _get_rooms(self, room_id: str = None):
-        endpoint, host = self._discover_service_plus(self.config.ROOMS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.ROOMS_ENDPOINT, 'GET')
         output = []
         try:
             if endpoint:
@@ -110,7 +70,7 @@ class ControllerManager:
                 self.logger.error("Failed to get rooms endpoint")
 
             self.logger.info(f"Fetching rooms information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             rooms_response = response.json()
 
@@ -377,7 +337,7 @@ class ControllerManager:
         data = copy.deepcopy(self.service_specification)
         data.update({"name": controller_name, "host": f"http://{controller_name}:{controller_port}"})
         try:
-            response = requests.post(url, json=data)
+            response = self.catalog.post(url, json=data)
             response.raise_for_status()
             if response.json().get("success"): 
                 self.logger.info("Service registered successfully.")
@@ -390,7 +350,7 @@ class ControllerManager:
         url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}/{controller_name}"
 
         try:
-            response = requests.delete(url)
+            response = self.catalog.delete(url)
             response.raise_for_status()
             if response.json().get("success"): 
                 self.logger.debug("Service registeration removed.")
@@ -13,6 +13,13 @@ class Config:
     ROOMS_ENDPOINT = os.getenv("ROOMS_ENDPOINT")
     SERVICES_ENDPOINT = os.getenv("SERVICES_ENDPOINT")
     SERVICE_REGISTRY_NAME = os.getenv("SERVICE_REGISTRY_NAME")
+    CATALOG_TIMEOUT = float(os.getenv("CATALOG_TIMEOUT", 5))  # seconds
+    CATALOG_RETRIES = int(os.getenv("CATALOG_RETRIES", 2))  # retries of the idempotent requests
+    CATALOG_BACKOFF = float(os.getenv("CATALOG_BACKOFF", 0.2))  # seconds, doubled at every retry
+    CATALOG_POOL_SIZE = int(os.getenv("CATALOG_POOL_SIZE", 10))  # keep-alive connections
+    CATALOG_DISCOVERY_TTL = int(os.getenv("CATALOG_DISCOVERY_TTL", 300))  # seconds before the endpoint map is reloaded
+    CATALOG_DISCOVERY_NEGATIVE_TTL = int(os.getenv("CATALOG_DISCOVERY_NEGATIVE_TTL", 30))  # seconds a miss or a failure is remembered
+    CATALOG_CONDITIONAL_CACHE_SIZE = int(os.getenv("CATALOG_CONDITIONAL_CACHE_SIZE", 256))  # GET responses kept for revalidation
     
     LOGGER_NAME = os.getenv("BASE_LOGGER")
     # MODEL_LOGGER = os.getenv("MODEL_LOGGER")
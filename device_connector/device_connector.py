@@ -4,12 +4,13 @@ import requests
 import time
 import threading
 import copy
-from typing import Literal
+from typing import List, Literal
 from models import Device, Plant
 from config import Config, MyLogger
 from sensors import TempSen, LightSen, PHSen, SoilMoistureSen, create_sensor
 from utility import case_insensitive
 from MyMQTT2 import MyMQTT
+from catalog_client import CatalogClient
 
 
 class MyClientMQTT():
@@ -46,6 +47,7 @@ class DeviceConnector:
         self.available_sensors = {}
         self.catalog_address = self.config.CATALOG_URL
         self.logger = MyLogger.get_main_loggger()
+        self.catalog = CatalogClient(self.config, self.logger)
         self.broker = None
         self.port = None
         self.template = {}
@@ -164,7 +166,11 @@ class DeviceConnector:
 
     def _register_plants(self, initial: bool=False):
         method = "POST" if initial else "PUT"
-        endpoint = self._discover_service(self.config.PLANTS_ENDPOINT, method=method)
+        if self._register_in_bulk(self.config.PLANTS_ENDPOINT, method,
+                                  [plant.model_dump() for plant in self.plants], item_type="plant"):
+            return
+
+        endpoint = self.catalog.discover(self.config.PLANTS_ENDPOINT, method=method)
         if endpoint:
             url = f"{self.catalog_address}{endpoint}"
         else:
@@ -179,7 +185,11 @@ class DeviceConnector:
 
     def _register_devices(self, initial: bool=False):
         method = "POST" if initial else "PUT"
-        endpoint = self._discover_service(self.config.DEVICES_ENDPOINT, method=method)
+        if self._register_in_bulk(self.config.DEVICES_ENDPOINT, method,
+                                  [device.model_dump() for device in self.devices], item_type="device"):
+            return
+
+        endpoint = self.catalog.discover(self.config.DEVICES_ENDPOINT, method=method)
         if endpoint:
             url = f"{self.catalog_address}{endpoint}"
         else:
@@ -192,15 +202,46 @@ class DeviceConnector:
                                device.device_id, item_type="device")
 
     
+    def _register_in_bulk(self, item_endpoint: str, method: str, items: List[dict],
+                          item_type: Literal["plant", "device"]) -> bool:
+        # Returns False when the registry has no bulk endpoint, so the items are sent one by one
+        if not items:
+            return True
+        endpoint = self.catalog.discover(item_endpoint, method=method, sub_path="_bulk")
+        if not endpoint:
+            return False
+
+        url = f"{self.catalog_address}{endpoint}"
+        self.logger.info(f"Registring {len(items)} {item_type}s in bulk ...")
+        result = self.catalog.fetch(method, url, json=items)
+        if not isinstance(result.content, list):
+            self.logger.warning(f"Bulk registration of {item_type}s failed: {result.message}, registring them one by one.")
+            return False
+
+        conflicts = []
+        for item, item_result in zip(items, result.content):
+            if item_result.get("status") == 409 and method == 'POST':
+                conflicts.append(item)
+            elif not item_result.get("success"):
+                self.logger.info(f"Registration unsuccessful for {item_type} {item_result.get(f'{item_type}Id')} with message {item_result.get('message')}.")
+        self.logger.info(f"Bulk registration of {item_type}s: {result.message}")
+
+        if conflicts:
+            # Conflict, items already exist, retry with PUT
+            self.logger.warning(f"Conflict detected for {len(conflicts)} {item_type}s, retrying with PUT request.")
+            return self._register_in_bulk(item_endpoint, "PUT", conflicts, item_type)
+        return True
+
+
     def _send_request(self, method: str, url: str, data: dict, 
                       item_id: int, item_type: Literal["plant", "device", "status"]):
         try:
-            response = requests.request(method, url, json=data)
+            response = self.catalog.request(method, url, json=data)
             self.logger.info(f"{method} Request with response: {response.text}")
             if response.json().get("status") == 409 and method == 'POST':
                 # Conflict, item already exists, retry with PUT
                 self.logger.warning(f"Conflict detected for {item_type} {item_id}, retrying with PUT request.")
-                response = requests.put(url, json=data)
+                response = self.catalog.put(url, json=data)
 
             response.raise_for_status()
             if not response.json().get("success"):
@@ -283,7 +324,7 @@ class DeviceConnector:
             
 
     def get_broker(self):
-        endpoint = self._discover_service(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint = self.catalog.discover(self.config.GENERAL_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}/broker"
@@ -292,7 +333,7 @@ class DeviceConnector:
                 return
             
             self.logger.info(f"Fetching broker information from {url} ...")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             broker_response = response.json()
 
@@ -312,39 +353,8 @@ class DeviceConnector:
             self.logger.error(f"Invalid broker information received: {e}")
 
 
-    def _discover_service(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None):
-        try:
-            url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}/{self.config.SERVICE_REGISTRY_NAME}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            service_response = response.json()
-
-            if service_response.get("success"):
-                # Extract the service registry from the response
-                service_registry = service_response.get("content", [])
-                service = service_registry[0]
-                if service:
-                    endpoints = service.get("endpoints", [])
-                    for endpoint in endpoints:
-                        path = endpoint.get("path", "")
-                        service_method = endpoint.get("method", "")
-
-                        if item in path and method == service_method:
-                            if sub_path:
-                                if sub_path in path:
-                                    return path
-                            else:
-                                return path
-                            
-            self.logger.error(f"Failed to discover service endpoint")
-
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch services endpoint: {e}")
-
-
     def get_topic_template(self):
-        endpoint = self._discover_service(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint = self.catalog.discover(self.config.GENERAL_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}/template"
@@ -353,7 +363,7 @@ class DeviceConnector:
                 return
             
             self.logger.info(f"Fetching template information from {url} ...")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             template_response = response.json()
 
@@ -372,7 +382,7 @@ class DeviceConnector:
 
 
     def change_status_on_catalog(self, device_id: int, status: str):
-        endpoint = self._discover_service(self.config.DEVICES_ENDPOINT, method="PUT")
+        endpoint = self.catalog.discover(self.config.DEVICES_ENDPOINT, method="PUT")
         if endpoint:
             endpoint = endpoint.replace('{device_id}', str(device_id))
             url = f"{self.catalog_address}{endpoint}/status"
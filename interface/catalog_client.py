@@ -0,0 +1,226 @@
+'''Pooled HTTP client for the requests sent to the registry (catalog)'''
+import time
+import random
+import threading
+from collections import OrderedDict
+from typing import Any, List, Literal, NamedTuple, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CatalogResult(NamedTuple):
+    success: bool
+    status: int
+    content: Any = None
+    message: str = ""
+
+
+class CatalogClient():
+    # Only these are retried, a POST is sent once
+    RETRIABLE_METHODS = ("GET", "PUT", "DELETE")
+
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        self.catalog_address = config.CATALOG_URL
+        self.timeout = config.CATALOG_TIMEOUT
+        self.retries = config.CATALOG_RETRIES
+        self.backoff = config.CATALOG_BACKOFF
+
+        # Keep-alive connections shared by all the threads of the service
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config.CATALOG_POOL_SIZE, pool_maxsize=config.CATALOG_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Endpoints of all the registered services, loaded with a single request
+        self.discovery_ttl = config.CATALOG_DISCOVERY_TTL
+        self.negative_ttl = config.CATALOG_DISCOVERY_NEGATIVE_TTL
+        self.discovery_lock = threading.Lock()
+        self._services = {}
+        self._loaded_at = None
+        self._failed_at = None
+        # (microservice, item, method, sub_path) -> (path, host, cached at), path is None for a miss
+        self.endpoint_cache = {}
+        self.discovery_counters = {"hits": 0, "misses": 0, "loads": 0, "failures": 0}
+
+        # Last tagged answer of each GET url, revalidated with If-None-Match (least recently used first)
+        self.conditional_lock = threading.Lock()
+        self.conditional_cache = OrderedDict()
+        self.conditional_cache_size = config.CATALOG_CONDITIONAL_CACHE_SIZE
+        self.conditional_counters = {"notModified": 0, "modified": 0}
+
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends the request on the pooled session with a timeout, retrying connection
+        errors, timeouts and 5xx answers of idempotent methods with a jittered backoff.
+        A GET answered 304 Not Modified returns the cached response of the same url."""
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = 1 + (self.retries if method in self.RETRIABLE_METHODS else 0)
+
+        cache_key, cached = None, None
+        if method == "GET":
+            cache_key = requests.Request(method, url, params=kwargs.get("params")).prepare().url
+            with self.conditional_lock:
+                cached = self.conditional_cache.get(cache_key)
+            if cached is not None:
+                kwargs["headers"] = {**(kwargs.get("headers") or {}), "If-None-Match": cached.headers["ETag"]}
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code < 500 or last_attempt:
+                    return self._conditional(cache_key, cached, response) if cache_key else response
+                self.logger.warning(f"{method} {url} answered {response.status_code}, retrying...")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    raise
+                self.logger.warning(f"{method} {url} failed: {e}, retrying...")
+            # Full jitter, so that the services don't retry all at the same time
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _conditional(self, cache_key: str, cached: Optional[requests.Response], response: requests.Response) -> requests.Response:
+        with self.conditional_lock:
+            if response.status_code == 304 and cached is not None:
+                self.conditional_counters["notModified"] += 1
+                if cache_key in self.conditional_cache:
+                    self.conditional_cache.move_to_end(cache_key)
+                return cached
+
+            if response.status_code == 200 and response.headers.get("ETag"):
+                self.conditional_counters["modified"] += 1
+                self.conditional_cache[cache_key] = response
+                self.conditional_cache.move_to_end(cache_key)
+                while len(self.conditional_cache) > self.conditional_cache_size:
+                    self.conditional_cache.popitem(last=False)
+            else:
+                self.conditional_cache.pop(cache_key, None)
+        return response
+
+    def get(self, url: str, params: dict=None, **kwargs) -> requests.Response:
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url: str, json: Any=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, json=json, **kwargs)
+
+    def put(self, url: str, json: Any=None, **kwargs) -> requests.Response:
+        return self.request("PUT", url, json=json, **kwargs)
+
+    def delete(self, url: str, params: dict=None, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, params=params, **kwargs)
+
+
+    def fetch(self, method: str, url: str, **kwargs) -> CatalogResult:
+        """Same as request, decoding the registry answer ({success, status, content, message})."""
+        try:
+            response = self.request(method, url, **kwargs)
+            response.raise_for_status()
+            body = response.json()
+        except requests.RequestException as e:
+            return CatalogResult(False, getattr(e.response, "status_code", 0) or 0, message=str(e))
+        except ValueError as e:
+            return CatalogResult(False, response.status_code, message=f"Invalid JSON received: {e}")
+
+        return CatalogResult(success=bool(body.get("success")),
+                             status=body.get("status", response.status_code),
+                             content=body.get("content"),
+                             message=body.get("message", ""))
+
+
+    def follow_changes(self, since: Optional[str], collections: List[str], wait: float) -> CatalogResult:
+        """Long polls the registry change feed. Without since, only the current cursor is returned."""
+        endpoint = self.discover(self.config.CHANGES_ENDPOINT, 'GET')
+        if not endpoint:
+            return CatalogResult(False, 0, message="Failed to discover the changes endpoint")
+
+        params = {"collections": ",".join(collections), "timeout": wait}
+        if since:
+            params["since"] = since
+        # The registry holds the request up to wait seconds before answering
+        return self.fetch("GET", f"{self.catalog_address}{endpoint}", params=params, timeout=wait + self.timeout)
+
+
+    def discover(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None, microservice: str=None) -> Optional[str]:
+        return self.discover_with_host(item, method, sub_path, microservice)[0]
+
+    def discover_with_host(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None, microservice: str=None) -> Tuple[Optional[str], Optional[str]]:
+        microservice = microservice or self.config.SERVICE_REGISTRY_NAME
+        key = (microservice, item, method, sub_path)
+        with self.discovery_lock:
+            now = time.monotonic()
+            if self._loaded_at is None or now - self._loaded_at >= self.discovery_ttl:
+                self._load_services(now)
+
+            cached = self.endpoint_cache.get(key)
+            if cached and (cached[0] or now - cached[2] < self.negative_ttl):
+                self.discovery_counters["hits"] += 1
+                return cached[0], cached[1]
+
+            self.discovery_counters["misses"] += 1
+            path, host = self._match(microservice, item, method, sub_path)
+            if not path and self._reload_allowed(now):
+                # The service may have registered after the map was loaded
+                self._load_services(now)
+                path, host = self._match(microservice, item, method, sub_path)
+            self.endpoint_cache[key] = (path, host, now)
+
+        if not path:
+            self.logger.error(f"Failed to discover service endpoint for {method} {item} on {microservice}")
+        return path, host
+
+    def _match(self, microservice: str, item: str, method: str, sub_path: str=None) -> Tuple[Optional[str], Optional[str]]:
+        service = self._services.get(microservice)
+        if service:
+            for path, service_method in service["endpoints"]:
+                if item in path and method == service_method and (not sub_path or sub_path in path):
+                    return path, service["host"]
+        return None, None
+
+    def _reload_allowed(self, now: float) -> bool:
+        attempts = [t for t in (self._loaded_at, self._failed_at) if t is not None]
+        return not attempts or now - max(attempts) >= self.negative_ttl
+
+    def _load_services(self, now: float):
+        # Called holding discovery_lock. After a failure the previous map (if any) is
+        # kept and no other request is sent to the registry before the negative ttl.
+        if self._failed_at is not None and now - self._failed_at < self.negative_ttl:
+            return
+        url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}"
+        result = self.fetch("GET", url)
+        if not result.success:
+            self._failed_at = now
+            self.discovery_counters["failures"] += 1
+            self.logger.error(f"Failed to fetch services endpoint: {result.message}")
+            return
+
+        services = {}
+        for service in result.content or []:
+            if service and service.get("name"):
+                services[service["name"]] = {
+                    "host": service.get("host", ""),
+                    "endpoints": [(e.get("path", ""), e.get("method", "")) for e in service.get("endpoints", [])]
+                }
+        self._services = services
+        self._loaded_at = now
+        self._failed_at = None
+        self.endpoint_cache = {}
+        self.discovery_counters["loads"] += 1
+
+    def invalidate(self):
+        """Drops the endpoint map, the next discovery reloads it from the registry."""
+        with self.discovery_lock:
+            self._loaded_at = None
+            self._failed_at = None
+            self.endpoint_cache = {}
+
+    def discovery_stats(self) -> dict:
+        with self.discovery_lock:
+            return {"services": len(self._services),
+                    "cachedEndpoints": len(self.endpoint_cache),
+                    **self.discovery_counters}
+
+    def conditional_stats(self) -> dict:
+        with self.conditional_lock:
+            return {"cachedResponses": len(self.conditional_cache), **self.conditional_counters}
@@ -2,9 +2,9 @@ import os
 import requests
 import json
 import time
-from typing import Literal
 from MyMQTT2 import MyMQTT
 from config import Config, MyLogger
+from catalog_client import CatalogClient
 
 
 class MyClientMQTT():
@@ -40,7 +40,7 @@ class DataManager():
         self.logger = MyLogger.set_logger(self.config.MANAGER_LOGGER)
         self.catalog_address = self.config.CATALOG_URL
         self.plants = []
-        self.endpoint_cache = {}
+        self.catalog = CatalogClient(self.config, self.logger)
         self.broker = None
         self.port = None
 
@@ -54,7 +54,7 @@ class DataManager():
 
     # Add getting info of adaptor address from the catalog and then request
     def get_channel_detail(self, channel_name):
-        endpoint, host = self._discover_service_plus(item=self.config.ADAPTOR_CHANNEL_ENDPOINT, 
+        endpoint, host = self.catalog.discover_with_host(item=self.config.ADAPTOR_CHANNEL_ENDPOINT, 
                                                     method='GET',
                                                     microservice=self.config.THINGSPEAK_ADAPTOR_REGISTRY_NAME)
         try:
@@ -92,7 +92,7 @@ class DataManager():
         # Post the data to the registry system
         url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}"
         try:
-            response = requests.post(url, json=data)
+            response = self.catalog.post(url, json=data)
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Error posting service data: {str(e)}")
@@ -133,7 +133,7 @@ class DataManager():
 
 
     def update_plant_list(self, plant_id: int=None):
-        endpoint, host = self._discover_service_plus(self.config.PLANTS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.PLANTS_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}"
@@ -144,7 +144,7 @@ class DataManager():
                 return
             
             self.logger.info(f"Fetching sensors information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             plants_response = response.json()
 
@@ -182,7 +182,7 @@ class DataManager():
     }
         
         params = {k: v for k, v in local_vars.items() if v is not None}
-        endpoint, host = self._discover_service_plus(self.config.DEVICES_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.DEVICES_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}"
@@ -193,7 +193,7 @@ class DataManager():
                 return
             
             self.logger.info(f"Fetching sensors information from {url} with params: {params}")
-            response = requests.get(url, params)
+            response = self.catalog.get(url, params)
             response.raise_for_status()
             devices_response = response.json()
 
@@ -208,10 +208,27 @@ class DataManager():
             self.logger.error(f"Failed to fetch devices information: {e}")
 
 
+    def _get_room_snapshot(self, room_id: int) -> dict:
+        # The room with its plant kind, plants and devices, in a single request
+        endpoint = self.catalog.discover(self.config.ROOMS_ENDPOINT, 'GET', sub_path="snapshot")
+        if not endpoint:
+            self.logger.error(f"Failed to get room snapshots endpoint")
+            return {}
+
+        url = f"{self.catalog_address}{endpoint}"
+        result = self.catalog.fetch("GET", url, params={"rooms": room_id})
+        if not result.success:
+            self.logger.error(f"Failed to fetch the snapshot of room {room_id}: {result.message}")
+            return {}
+        return (result.content or [{}])[0]
+
+
     def get_devices_for_plant(self, room_id: int, plant_id: int): 
-        plant_devices = self._get_devices(room_id=room_id, plant_id=plant_id) 
-        temp_device = self._get_devices(measure_type="temperature", room_id=room_id)
-        ligh_device = self._get_devices(measure_type="light", room_id=room_id)
+        # Filtered from the room snapshot instead of a request per filter
+        devices = self._get_room_snapshot(room_id).get("devices", [])
+        plant_devices = [device for device in devices if device.get("deviceLocation", {}).get("plantId") == plant_id]
+        temp_device = [device for device in devices if "temperature" in [m.lower() for m in device.get("measureTypes", [])]]
+        ligh_device = [device for device in devices if "light" in [m.lower() for m in device.get("measureTypes", [])]]
 
         return plant_devices + temp_device + ligh_device
 
@@ -229,48 +246,8 @@ class DataManager():
         self.mqtt_client.stop()
 
 
-    def _discover_service_plus(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None, microservice: str=Config.SERVICE_REGISTRY_NAME):
-        # Return the endpoint from the cache
-        if item in self.endpoint_cache and method in self.endpoint_cache[item]:
-            return self.endpoint_cache[item][method], self.endpoint_cache[item]['host']
-
-        try:
-            url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}/{microservice}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            service_response = response.json()
-
-            if service_response.get("success"):
-                # Extract the service registry from the response
-                service_registry = service_response.get("content", [[]])
-                service = service_registry[0]
-                if service:
-                    endpoints = service.get("endpoints", [])
-                    host = service.get("host", "")
-                    for endpoint in endpoints:
-                        path = endpoint.get("path", "")
-                        service_method = endpoint.get("method", "")
-
-                        if item in path and method == service_method:
-                            if sub_path:
-                                if sub_path in path:
-                                    self.endpoint_cache.setdefault(item, {})[method] = path
-                                    self.endpoint_cache[item]["host"] = host
-                                    return path, host
-                            else:
-                                self.endpoint_cache.setdefault(item, {})[method] = path
-                                self.endpoint_cache[item]["host"] = host
-                                return path, host
-                            
-            self.logger.error(f"Failed to discover service endpoint")
-
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch services endpoint: {e}")
-
-
     def get_broker(self):
-        endpoint, host = self._discover_service_plus(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.GENERAL_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}/broker"
@@ -279,7 +256,7 @@ class DataManager():
                 return
             
             self.logger.info(f"Fetching broker information from {url} ...")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             broker_response = response.json()
 
@@ -300,7 +277,7 @@ class DataManager():
 
 
     def get_report(self, plant_id, results: int=100):
-        endpoint, host = self._discover_service_plus(item=self.config.REPORTER_ENDPOINT, 
+        endpoint, host = self.catalog.discover_with_host(item=self.config.REPORTER_ENDPOINT, 
                                                     method='GET',
                                                     microservice=self.config.REPORTER_REGISTRY_NAME)
         try:
@@ -344,7 +321,7 @@ class DataManager():
         self.logger.info(f"Username: {username} and password: {password} inserted!")
         if username == Config.ADMIN_USERNAME and password == Config.ADMIN_PASSWORD:
             return True
-        endpoint, host = self._discover_service_plus(self.config.USERS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.USERS_ENDPOINT, 'GET')
         params = {'plant_id': plant_id}
         try:
             if endpoint:    
@@ -354,7 +331,7 @@ class DataManager():
                 return
             
             self.logger.info(f"Fetching users from {url} with params: {params}")
-            response = requests.get(url, params)
+            response = self.catalog.get(url, params)
             response.raise_for_status()
             response = response.json()
 
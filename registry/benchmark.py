@@ -0,0 +1,130 @@
+'''Load test of a running registry with the GET/PUT mix of the other services'''
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# (weight, method, path) like the traffic of the services: the device connectors update the device
+# statuses on every measurement, the others mostly read the lists, the snapshots and the general info
+MIX = [
+    (30, "PUT", "/devices/{device_id}/status"),
+    (15, "GET", "/devices"),
+    (15, "GET", "/rooms/snapshot?rooms={room_id}"),
+    (10, "GET", "/plants"),
+    (10, "GET", "/rooms"),
+    (10, "GET", "/general/broker"),
+    (5, "GET", "/general/template"),
+    (5, "GET", "/services"),
+]
+
+
+class Worker(threading.Thread):
+    """Sends the requests on its own keep-alive connection, as the services' sessions do"""
+
+    def __init__(self, host: str, port: int, devices: list, room_ids: list, deadline: float, conditional: bool):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.devices = devices
+        self.room_ids = room_ids
+        self.deadline = deadline
+        self.conditional = conditional
+        self.etags = {}
+        # route -> latencies (seconds), route -> errors, route -> not modified
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.not_modified = defaultdict(int)
+
+    def run(self):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        weights = [weight for weight, _, _ in MIX]
+        while time.monotonic() < self.deadline:
+            _, method, route = random.choices(MIX, weights=weights)[0]
+            path, body = self._request(method, route)
+            headers = {"Content-Type": "application/json"} if body else {}
+            if self.conditional and method == "GET" and path in self.etags:
+                headers["If-None-Match"] = self.etags[path]
+            started_at = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors[route] += 1
+                connection.close()
+                continue
+            self.latencies[route].append(time.perf_counter() - started_at)
+            if response.status == 304:
+                self.not_modified[route] += 1
+            elif response.status >= 400:
+                self.errors[route] += 1
+            elif response.getheader("ETag"):
+                self.etags[path] = response.getheader("ETag")
+        connection.close()
+
+    def _request(self, method: str, route: str):
+        if method == "PUT":
+            # The current status is sent back, the load leaves the devices as they are
+            device = random.choice(self.devices)
+            return route.format(device_id=device["deviceId"]), json.dumps({"status": device["deviceStatus"]})
+        return route.format(room_id=random.choice(self.room_ids)), None
+
+
+def _get(host: str, port: int, path: str) -> list:
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    connection.request("GET", path)
+    content = json.loads(connection.getresponse().read()).get("content") or []
+    connection.close()
+    return content
+
+
+def _percentile(latencies: list, fraction: float) -> float:
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+
+def run(url: str, concurrency: int, duration: float, conditional: bool):
+    address = urlsplit(url)
+    host, port = address.hostname, address.port or 80
+    devices = _get(host, port, "/devices?fields=deviceId,deviceStatus&limit=1000")
+    room_ids = [room["roomId"] for room in _get(host, port, "/rooms?fields=roomId&limit=1000")]
+    if not devices or not room_ids:
+        raise SystemExit("The registry must have devices and rooms to run the benchmark.")
+
+    deadline = time.monotonic() + duration
+    workers = [Worker(host, port, devices, room_ids, deadline, conditional) for _ in range(concurrency)]
+    started_at = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started_at
+
+    print(f"{concurrency} clients for {elapsed:.1f}s against {url}"
+          f"{' (with If-None-Match)' if conditional else ''}\n")
+    print(f"{'route':<40}{'requests':>10}{'req/s':>9}{'errors':>8}{'304':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    total = 0
+    for _, method, route in MIX:
+        latencies = sorted(latency for worker in workers for latency in worker.latencies[route])
+        errors = sum(worker.errors[route] for worker in workers)
+        not_modified = sum(worker.not_modified[route] for worker in workers)
+        total += len(latencies)
+        if not latencies:
+            print(f"{method + ' ' + route:<40}{0:>10}{0:>9.1f}{errors:>8}")
+            continue
+        print(f"{method + ' ' + route:<40}{len(latencies):>10}{len(latencies) / elapsed:>9.1f}{errors:>8}{not_modified:>7}"
+              f"{_percentile(latencies, 0.5):>9.2f}{_percentile(latencies, 0.95):>9.2f}{_percentile(latencies, 0.99):>9.2f}")
+    print(f"\n{total} requests, {total / elapsed:.1f} req/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drives the GET/PUT mix of the services against a running registry. "
+                                                 "The PUTs rewrite the current status of the devices.")
+    parser.add_argument("--url", default="http://localhost:8080", help="address of the registry")
+    parser.add_argument("--concurrency", type=int, default=16, help="parallel clients, each on a keep-alive connection")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--conditional", action="store_true", help="revalidate the GETs with If-None-Match, as the catalog clients do")
+    arguments = parser.parse_args()
+    run(arguments.url, arguments.concurrency, arguments.duration, arguments.conditional)
@@ -0,0 +1,68 @@
+'''In-process log of the changes made through the registry, followed with long polling'''
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Tuple
+from utility import DATETIME_FORMAT
+
+
+class ChangeFeed():
+    """Keeps the last events in a ring buffer. A cursor is '<epoch>:<seq>', the epoch
+    changes with every restart of the registry, so that a cursor from a previous
+    process (or older than the buffer) is answered with a reset instead of a gap."""
+
+    def __init__(self, size: int):
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.events = deque(maxlen=size)
+        self.seq = 0
+        self.condition = threading.Condition()
+
+    def record(self, collection: str, operation: str, ids: list=None, room_ids: list=None, fields: list=None):
+        # ids and room_ids are left out when a write hits documents we don't know in advance,
+        # fields (the ones an update changed) when it may have changed any of them
+        with self.condition:
+            self.seq += 1
+            self.events.append({
+                "seq": self.seq,
+                "collection": collection,
+                "operation": operation,
+                "ids": ids,
+                "roomIds": room_ids,
+                "fields": fields,
+                "at": datetime.now().strftime(DATETIME_FORMAT)
+            })
+            self.condition.notify_all()
+
+    def cursor(self) -> str:
+        with self.condition:
+            return f"{self.epoch}:{self.seq}"
+
+    def _parse_cursor(self, cursor: str) -> Optional[int]:
+        epoch, _, seq = cursor.partition(":")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def read(self, since: str, collections: List[str]=None, timeout: float=0) -> Tuple[List[dict], str, bool]:
+        """Returns the events after the cursor, waiting up to timeout seconds for the first one.
+        The last element tells the consumer to list everything again (reset)."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            seq = self._parse_cursor(since)
+            oldest = self.events[0]["seq"] if self.events else self.seq + 1
+            # Unknown cursor, or events were dropped from the buffer since
+            if seq is None or seq > self.seq or seq + 1 < oldest:
+                return [], f"{self.epoch}:{self.seq}", True
+
+            while True:
+                events = [event for event in self.events if event["seq"] > seq
+                          and (not collections or event["collection"] in collections)]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events, f"{self.epoch}:{self.seq}", False
+                self.condition.wait(remaining)
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {"epoch": self.epoch, "seq": self.seq, "buffered": len(self.events), "capacity": self.events.maxlen}
@@ -1,8 +1,8 @@
 '''Cleaner is responsible for removing outdated items'''
 
 import datetime
-import sched
 import time
+from pymongo.errors import PyMongoError
 from config import Config
 
 
@@ -10,64 +10,47 @@ class Cleaner():
     def __init__(self, database_agent, logger) -> None:
         self.db = database_agent
         self.logger = logger
-        
-        # Scheduler config  
+        # Counts and duration of the last cleanup
+        self.last_report = {}
         self.threshold = Config.CLEANUP_THRESHOLD
-        self.interval = Config.CLEANUP_INTERVAL
-        self.scheduler = sched.scheduler(time.time, time.sleep)
-        self.scheduler.enter(0, 1, self.cleanup, ())
-        self.scheduler.run(blocking=False)
 
 
-    def cleanup(self):
+    # Run periodically by the maintenance scheduler
+    def cleanup(self) -> dict:
         self.logger.info("Cleaning up outdated Plants and Devices...")
-        self._cleanup_plants()
-        self._cleanup_devices()
-        self._cleanup_empty_rooms()
-        self.logger.info("Clean up completed.")
-
-        # Reschedule the periodic cleanup every x seconds
-        self.scheduler.enter(self.interval, 1, self.cleanup, ())
+        start = time.perf_counter()
+        a_threshold_ago = datetime.datetime.now() - datetime.timedelta(minutes=self.threshold)
+        report = {"startedAt": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                  "plants": 0, "devices": 0, "rooms": 0}
+        try:
+            report["plants"] = self._cleanup_plants(a_threshold_ago)
+            report["devices"] = self._cleanup_devices(a_threshold_ago)
+            report["rooms"] = self._cleanup_empty_rooms()
+        except PyMongoError as e:
+            report["error"] = str(e)
+            self.logger.error(f"Clean up failed: {str(e)}")
+
+        report["durationMs"] = round((time.perf_counter() - start) * 1000, 3)
+        self.last_report = report
+        self.logger.info(f"Clean up completed in {report['durationMs']} ms: {report['plants']} plants, "
+                         f"{report['devices']} devices and {report['rooms']} rooms removed.")
+        return report
 
 
     # Removes outdated plants
-    def _cleanup_plants(self):
-        a_threshold_ago = datetime.datetime.now() - datetime.timedelta(minutes=self.threshold)
-        find_plants_respose = self.db.find_plants()
-        if find_plants_respose.get("success"):
-            plants = find_plants_respose.get("content", [])
-        else:
-            self.logger.error(f"Unable to get plants: {str(find_plants_respose)}")
-            plants =[]
-
-        for plant in plants:
-            last_updated = datetime.datetime.strptime(plant['lastUpdated'], "%Y-%m-%d %H:%M:%S")
-            if last_updated < a_threshold_ago:
-                self.db.delete_plant(plant['plantId'])
+    def _cleanup_plants(self, a_threshold_ago: datetime.datetime) -> int:
+        return self.db.delete_outdated_plants(older_than=a_threshold_ago)
 
 
     # Removes outdated devices
-    def _cleanup_devices(self):
-        a_threshold_ago = datetime.datetime.now() - datetime.timedelta(minutes=self.threshold)
-        find_devices_response = self.db.find_devices()
-
-        if find_devices_response.get("success"):
-            devices = find_devices_response.get("content", [])
-        else:
-            self.logger.error(f"Unable to get plants: {str(find_devices_response)}")
-            devices = []
-
-        for device in devices:
-            last_updated = datetime.datetime.strptime(device['lastUpdated'], "%Y-%m-%d %H:%M:%S")
-            if last_updated < a_threshold_ago:
-                self.db.delete_device(device['deviceId'])
+    def _cleanup_devices(self, a_threshold_ago: datetime.datetime) -> int:
+        return self.db.delete_outdated_devices(older_than=a_threshold_ago)
 
 
     # Removes empty rooms
-    def _cleanup_empty_rooms(self):
-        self.db.remove_empty_rooms()
+    def _cleanup_empty_rooms(self) -> int:
+        return self.db.remove_empty_rooms()
 
     
 
 
-    
\ No newline at end of file
@@ -22,6 +22,38 @@ class Config:
     DB_LOGGER = os.getenv("DB_LOGGER")
     CLEANUP_THRESHOLD = int(os.getenv("CLEANUP_THRESHOLD"))
     CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL"))
+    CLEANUP_JITTER = float(os.getenv("CLEANUP_JITTER", 0.1))  # fraction of the interval
+    INDEX_MAINTENANCE_INTERVAL = int(os.getenv("INDEX_MAINTENANCE_INTERVAL", 3600))  # seconds
+    MAINTENANCE_LOGGER = os.getenv("MAINTENANCE_LOGGER", "MAINTENANCE")
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))  # connections per server, 0 for no limit
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))  # connections kept open per server
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0))  # wait for a free connection, 0 for no limit
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 20000))  # 0 for no limit
+    # The list endpoints and the room snapshots read from the secondaries (when there are any), the single
+    # items and the writes from the primary. Right after a write of the registry a collection is read from
+    # the primary too, as the consumers revalidate their copies against the new ETag at once
+    MONGO_LIST_READ_PREFERENCE = os.getenv("MONGO_LIST_READ_PREFERENCE", "secondaryPreferred")
+    MONGO_MAX_STALENESS = int(os.getenv("MONGO_MAX_STALENESS", -1))  # seconds a secondary may lag (at least 90), -1 for no limit
+    MONGO_READ_AFTER_WRITE_WINDOW = int(os.getenv("MONGO_READ_AFTER_WRITE_WINDOW", 10))  # seconds, above the replication lag
+    MONGO_TRANSACTIONS = os.getenv("MONGO_TRANSACTIONS", "auto").lower()  # auto: on replica sets, off: conditional updates only
+    REGISTRATION_STATS_WINDOW = int(os.getenv("REGISTRATION_STATS_WINDOW", 1000))  # registrations kept for the latency percentiles
+    BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 5000))  # items per bulk registration request
+    PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", 1000))  # items per page of the list endpoints
+    MIRROR_ENABLED = os.getenv("MIRROR_ENABLED", "true").lower() in ["true", "1"]
+    MIRROR_REFRESH_INTERVAL = int(os.getenv("MIRROR_REFRESH_INTERVAL", 60))  # seconds
+    CHANGE_FEED_SIZE = int(os.getenv("CHANGE_FEED_SIZE", 10000))  # events kept for the consumers
+    CHANGE_FEED_MAX_WAIT = int(os.getenv("CHANGE_FEED_MAX_WAIT", 30))  # seconds a long poll is held
+    SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", 8080))
+    SERVER_ENVIRONMENT = os.getenv("SERVER_ENVIRONMENT", "production")  # CherryPy environment, production: no autoreload, tracebacks nor screen log; empty for the defaults
+    # Every long poll of /changes holds a worker for up to CHANGE_FEED_MAX_WAIT, size the pool for them on top of the API traffic
+    SERVER_THREAD_POOL = int(os.getenv("SERVER_THREAD_POOL", 30))  # workers started with the server
+    SERVER_THREAD_POOL_MAX = int(os.getenv("SERVER_THREAD_POOL_MAX", -1))  # upper bound the pool can grow to, -1 for no limit
+    SERVER_SOCKET_QUEUE_SIZE = int(os.getenv("SERVER_SOCKET_QUEUE_SIZE", 64))  # pending connections of the listening socket
+    SERVER_ACCEPTED_QUEUE_SIZE = int(os.getenv("SERVER_ACCEPTED_QUEUE_SIZE", -1))  # accepted connections waiting for a worker, -1 for no limit
+    SERVER_SOCKET_TIMEOUT = int(os.getenv("SERVER_SOCKET_TIMEOUT", 10))  # seconds an idle keep-alive connection is kept
 
 
 class MyLogger:
@@ -1,10 +1,20 @@
 import os
+import time
+from datetime import datetime
 from typing import Optional, List
-from pymongo import MongoClient
+from pymongo import ASCENDING
 from pymongo.errors import PyMongoError
 from config import Config
-from utility import create_response
-from models import DeviceParam
+from utility import create_response, DATETIME_FORMAT
+from models import DeviceParam, PageParam
+from revisions import RevisionTracker
+from streaming import StreamedItems
+from mirror import CatalogMirror
+from change_feed import ChangeFeed
+from db.pool import client, pool_monitor, read_preference
+
+# Strength 2 compares letters ignoring their case, so 'Lettuce' matches 'lettuce'
+CASE_INSENSITIVE = {"locale": "en", "strength": 2}
 
 
 class Database:
@@ -12,8 +22,8 @@ class Database:
         # Logger configuartion (child from the main logger)
         self.child_logger = logger
         
-        # Initialize the MongoDB client and database
-        self.client = MongoClient(Config.MONGO_URL)
+        # The MongoDB client (shared with the models) and database
+        self.client = client
         db = self.client[Config.DB]
         self.general_collection = db[Config.GENERAL_COLLECTION]
         self.services_collection = db[Config.SERVICES_COLLECTION]
@@ -24,13 +34,202 @@ class Database:
         self.users_collection = db[Config.USERS_COLLECTION]
         # Excludes MongoDB id
         self.defult_projection = {"_id":0}
+        # Updated on every write, tag the GET responses and feed the /changes consumers
+        self.revisions = RevisionTracker()
+        self.changes = ChangeFeed(size=Config.CHANGE_FEED_SIZE)
+
+        # Read preference of the list reads, and the last write of each collection (by Mongo name)
+        self.list_read_preference = read_preference(Config.MONGO_LIST_READ_PREFERENCE, Config.MONGO_MAX_STALENESS)
+        self._collection_names = {"general": Config.GENERAL_COLLECTION, "services": Config.SERVICES_COLLECTION,
+                                  "plants": Config.PLANTS_COLLECTION, "rooms": Config.ROOMS_COLLECTION,
+                                  "devices": Config.DEVICES_COLLECTION, "plant_kinds": Config.PLANT_KINDS_COLLECTION,
+                                  "users": Config.USERS_COLLECTION}
+        self._written_at = {}
+
+        # collection -> {index name: "ready" or the reason of the failure}
+        self.index_status = {}
+        self._migrate_last_updated()
+        self.ensure_indexes()
+
+        # Small collections read by every service, served from memory
+        self.mirror = None
+        if Config.MIRROR_ENABLED:
+            self.mirror = CatalogMirror({"plant_kinds": self.plant_kinds_collection,
+                                         "general": self.general_collection,
+                                         "services": self.services_collection},
+                                        logger=self.child_logger, on_change=self.record_change)
+            self.mirror.watch(db, retry_interval=Config.MIRROR_REFRESH_INTERVAL)
+
+    def record_change(self, collection: str, operation: str, ids: list=None, room_ids: list=None, fields: list=None):
+        self._written_at[self._collection_names.get(collection, collection)] = time.monotonic()
+        self.revisions.bump(collection)
+        self.changes.record(collection, operation, ids=ids, room_ids=room_ids, fields=fields)
+
+    def _for_list(self, collection, *joined):
+        # Secondaries serve the lists, unless a collection read was just written: a read-after-write
+        # goes to the primary, otherwise a lagging secondary would be cached under the new ETag
+        now = time.monotonic()
+        for read in (collection, *joined):
+            if now - self._written_at.get(read.name, float("-inf")) < Config.MONGO_READ_AFTER_WRITE_WINDOW:
+                return collection
+        return collection.with_options(read_preference=self.list_read_preference)
+
+    def find_pool_stats(self) -> dict:
+        stats = pool_monitor.stats()
+        stats["listReadPreference"] = self.list_read_preference.mongos_mode
+        stats["maxStaleness"] = self.list_read_preference.max_staleness
+        stats["readAfterWriteWindow"] = Config.MONGO_READ_AFTER_WRITE_WINDOW
+        return create_response(True, content=stats, status=200)
+
+    def find_mirror_stats(self) -> dict:
+        if not self.mirror:
+            return create_response(False, message="The mirror is disabled (MIRROR_ENABLED).", status=404)
+        return create_response(True, content=self.mirror.stats(), status=200)
+
+    def _migrate_last_updated(self):
+        # lastUpdated used to be stored as a string, converts the remaining ones to BSON dates
+        to_date = [{"$set": {"lastUpdated": {"$dateFromString": {
+            "dateString": "$lastUpdated", "format": DATETIME_FORMAT, "onError": "$$NOW"}}}}]
+        for collection in [self.plants_collection, self.devices_collection]:
+            try:
+                result = collection.update_many({"lastUpdated": {"$type": "string"}}, to_date)
+                if result.modified_count:
+                    self.child_logger.info(f"lastUpdated of {result.modified_count} documents in {collection.name} converted to dates.")
+            except PyMongoError as e:
+                self.child_logger.error(f"Error converting lastUpdated in {collection.name}: {str(e)}")
+
+    def _index_declarations(self) -> list:
+        # [(collection, [(keys, options)])], following the fields the registry queries by
+        return [
+            (self.plants_collection, [
+                ([("plantId", ASCENDING)], {"name": "plantId_unique", "unique": True}),
+                ([("roomId", ASCENDING)], {"name": "roomId"}),
+                ([("deviceInventory", ASCENDING)], {"name": "deviceInventory"}),
+                ([("lastUpdated", ASCENDING)], {"name": "lastUpdated"}),
+            ]),
+            (self.rooms_collection, [
+                ([("roomId", ASCENDING)], {"name": "roomId_unique", "unique": True}),
+                ([("plantInventory", ASCENDING)], {"name": "plantInventory"}),
+                ([("deviceInventory", ASCENDING)], {"name": "deviceInventory"}),
+            ]),
+            (self.devices_collection, [
+                ([("deviceId", ASCENDING)], {"name": "deviceId_unique", "unique": True}),
+                ([("deviceLocation.roomId", ASCENDING), ("deviceType", ASCENDING), ("measureTypes", ASCENDING)],
+                 {"name": "roomId_deviceType_measureTypes", "collation": CASE_INSENSITIVE}),
+                ([("deviceLocation.plantId", ASCENDING), ("measureTypes", ASCENDING)],
+                 {"name": "plantId_measureTypes", "collation": CASE_INSENSITIVE}),
+                ([("lastUpdated", ASCENDING)], {"name": "lastUpdated"}),
+            ]),
+            (self.users_collection, [
+                ([("userName", ASCENDING)], {"name": "userName_unique", "unique": True}),
+                ([("telegramId", ASCENDING)], {"name": "telegramId"}),
+                ([("plantInventory", ASCENDING)], {"name": "plantInventory"}),
+            ]),
+            (self.services_collection, [
+                ([("name", ASCENDING)], {"name": "name_unique", "unique": True}),
+            ]),
+            (self.plant_kinds_collection, [
+                ([("plantKind", ASCENDING)], {"name": "plantKind", "collation": CASE_INSENSITIVE}),
+            ]),
+        ]
+
+    def ensure_indexes(self) -> dict:
+        # create_index is a no-op for an index that already exists with the same options,
+        # so this also runs periodically to rebuild a dropped or failed index
+        for collection, indexes in self._index_declarations():
+            status = self.index_status.setdefault(collection.name, {})
+            for keys, options in indexes:
+                try:
+                    self._drop_if_collation_changed(collection, options)
+                    collection.create_index(keys, **options)
+                    status[options["name"]] = "ready"
+                except PyMongoError as e:
+                    status[options["name"]] = f"failed: {str(e)}"
+                    self.child_logger.error(f"Error creating index {options['name']} on {collection.name}: {str(e)}")
+        self.child_logger.info(f"Indexes ensured: {self.index_status}")
+        return self.index_status
+
+    def _drop_if_collation_changed(self, collection, options: dict):
+        # An index built with another collation can't be redefined in place, it's rebuilt
+        current = collection.index_information().get(options["name"])
+        if not current:
+            return
+        current_collation = current.get("collation") or {}
+        declared_collation = options.get("collation") or {}
+        if (current_collation.get("locale"), current_collation.get("strength")) != \
+           (declared_collation.get("locale"), declared_collation.get("strength")):
+            self.child_logger.info(f"Collation of index {options['name']} on {collection.name} changed, rebuilding it.")
+            collection.drop_index(options["name"])
+
+    def find_index_stats(self) -> dict:
+        indexes = []
+        try:
+            for collection, _ in self._index_declarations():
+                usage = {stat["name"]: stat for stat in collection.aggregate([{"$indexStats": {}}])}
+                for index in collection.list_indexes():
+                    name = index["name"]
+                    stat = usage.get(name, {})
+                    indexes.append({
+                        "collection": collection.name,
+                        "name": name,
+                        "keys": dict(index["key"]),
+                        "unique": index.get("unique", False),
+                        "status": self.index_status.get(collection.name, {}).get(name, "existing"),
+                        "accesses": stat.get("accesses", {}).get("ops", 0),
+                        "since": str(stat["accesses"]["since"]) if stat.get("accesses") else None
+                    })
+                # Declared indexes that failed to build are not listed by MongoDB
+                for name, status in self.index_status.get(collection.name, {}).items():
+                    if status != "ready" and name not in usage:
+                        indexes.append({"collection": collection.name, "name": name, "status": status})
+            return create_response(True, content=indexes, status=200)
+
+        except PyMongoError as e:
+            self.child_logger.error(f"Error retrieving index statistics: {str(e)}")
+            return create_response(False, message=str(e), status=500)
 
-    def _create_case_insensitive_query(self, variable):
-        return {"$regex": f"^{variable}$", "$options": "i"}
+    def _projection(self, id_field: str, no_detail: bool = False, page: Optional[PageParam] = None) -> dict:
+        projection = self.defult_projection.copy()
+        # Shows only Ids
+        if no_detail:
+            projection[id_field] = 1
+        elif page and page.field_list():
+            projection.update({field: 1 for field in page.field_list()})
+            projection[id_field] = 1
+        return projection
+
+    def _find_page(self, collection, query: dict, projection: dict, id_field: str,
+                   page: Optional[PageParam] = None, collation: Optional[dict] = None) -> dict:
+        # Without limit and after, the whole list is returned as before
+        paged = page is not None and (page.limit is not None or page.after is not None)
+        if paged and page.after is not None:
+            query = {"$and": [query, {id_field: {"$gt": page.after}}]}
+
+        cursor = self._for_list(collection).find(query, projection, collation=collation)
+        if paged:
+            # Walks the unique index of the ID, so a page costs the same wherever it starts
+            cursor = cursor.sort(id_field, ASCENDING)
+            if page.limit:
+                cursor = cursor.limit(page.limit)
+
+        # Encoded by the web layer while it's read, the list is never held in memory
+        if page is not None and page.stream:
+            return create_response(True, content=StreamedItems(cursor, id_field, limit=page.limit if paged else None), status=200)
+
+        items = list(cursor)
+        response = create_response(True, content=items, status=200)
+        if paged:
+            # No next page when this one isn't full
+            response["nextAfter"] = items[-1].get(id_field) if page.limit and len(items) == page.limit else None
+        return response
 
     def find_general(self, to_find: str = 'broker') -> dict:
         try:
-            item = self.general_collection.find_one({to_find: {"$exists": True}}, {"_id":0})
+            general = self.mirror.get("general") if self.mirror else None
+            if general is not None:
+                item = next((item for item in general if to_find in item), None)
+            else:
+                item = self.general_collection.find_one({to_find: {"$exists": True}}, {"_id":0})
             if item:
                 return create_response(True, content=item, status=200)
             else:
@@ -45,11 +244,16 @@ class Database:
         projection = self.defult_projection.copy()
         
         try:
+            services = self.mirror.get("services") if self.mirror else None
             if not service_name:
-                services = list(self.services_collection.find({}, projection))
+                if services is None:
+                    services = list(self.services_collection.find({}, projection))
                 return create_response(True, content=services, status=200)
             
-            service = self.services_collection.find_one({'name': service_name}, projection)
+            if services is not None:
+                service = next((service for service in services if service.get("name") == service_name), None)
+            else:
+                service = self.services_collection.find_one({'name': service_name}, projection)
             return create_response(True, content=[service], status=200)
             
         except PyMongoError as e:
@@ -57,14 +261,13 @@ class Database:
             return create_response(False, message=str(e), status=500)
         
     
-    def find_rooms(self, room_id: Optional[int] = None) -> dict:
-        projection = self.defult_projection.copy()
+    def find_rooms(self, room_id: Optional[int] = None, page: Optional[PageParam] = None) -> dict:
+        projection = self._projection("roomId", page=page)
 
         try:
             # List all rooms
             if not room_id:
-                rooms = list(self.rooms_collection.find({"roomId": {"$exists": True}}, projection))
-                return create_response(True, content=rooms, status=200)
+                return self._find_page(self.rooms_collection, {"roomId": {"$exists": True}}, projection, "roomId", page)
             
             # An specific room
             else:
@@ -79,17 +282,38 @@ class Database:
             return create_response(False, message=str(e), status=500)
 
 
-    def find_plants(self, plant_id: Optional[int] = None, no_detail: bool = False) -> dict:
-        projection = self.defult_projection.copy()
-        # Shows only Ids
-        if no_detail:
-            projection["plantId"] = 1
+    def find_room_snapshots(self, room_ids: List[int]) -> dict:
+        # A single aggregation joins the plant kind thresholds, the plants and the devices of the rooms.
+        # Run with the collation of the plantKind and device indexes, so kinds match regardless of case.
+        pipeline = [
+            {"$match": {"roomId": {"$in": room_ids}}},
+            {"$lookup": {"from": Config.PLANT_KINDS_COLLECTION, "localField": "plantKind",
+                         "foreignField": "plantKind", "as": "plantKindInfo"}},
+            {"$lookup": {"from": Config.PLANTS_COLLECTION, "localField": "roomId",
+                         "foreignField": "roomId", "as": "plants"}},
+            {"$lookup": {"from": Config.DEVICES_COLLECTION, "localField": "roomId",
+                         "foreignField": "deviceLocation.roomId", "as": "devices"}},
+            {"$addFields": {"plantKindInfo": {"$arrayElemAt": ["$plantKindInfo", 0]}}},
+            {"$project": {"_id": 0, "plantKindInfo._id": 0, "plants._id": 0, "devices._id": 0}},
+        ]
+
+        try:
+            rooms = self._for_list(self.rooms_collection, self.plant_kinds_collection, self.plants_collection, self.devices_collection)
+            snapshots = list(rooms.aggregate(pipeline, collation=CASE_INSENSITIVE))
+            return create_response(True, content=snapshots, status=200)
+
+        except PyMongoError as e:
+            self.child_logger.error(f"Error retrieving snapshots of rooms {room_ids}: {str(e)}")
+            return create_response(False, message=str(e), status=500)
+
+
+    def find_plants(self, plant_id: Optional[int] = None, no_detail: bool = False, page: Optional[PageParam] = None) -> dict:
+        projection = self._projection("plantId", no_detail=no_detail, page=page)
 
         try:
             # List all plants
             if not plant_id:
-                plants = list(self.plants_collection.find({"plantId": {"$exists": True}}, projection))
-                return create_response(True, content=plants, status=200)
+                return self._find_page(self.plants_collection, {"plantId": {"$exists": True}}, projection, "plantId", page)
             
             # An specific plant
             else:
@@ -111,14 +335,26 @@ class Database:
             projection["plantKind"] = 1
 
         try:
+            mirrored = self.mirror.get("plant_kinds") if self.mirror else None
+            if mirrored is not None:
+                mirrored = [kind for kind in mirrored if "plantKind" in kind]
+                if no_detail:
+                    mirrored = [{"plantKind": kind["plantKind"]} for kind in mirrored]
+
             # List all plant kinds (case-insensitive)
             if not kind_name: 
+                if mirrored is not None:
+                    return create_response(True, content=mirrored, status=200)
                 kinds = list(self.plant_kinds_collection.find({"plantKind": {"$exists": True}}, projection))
                 return create_response(True, content=kinds, status=200)
             
             # An specific plant kind
             else:
-                kind = self.plant_kinds_collection.find_one({"plantKind": self._create_case_insensitive_query(kind_name)}, projection)
+                if mirrored is not None:
+                    # Same match as the collation of the index
+                    kind = next((kind for kind in mirrored if str(kind["plantKind"]).casefold() == kind_name.casefold()), None)
+                else:
+                    kind = self.plant_kinds_collection.find_one({"plantKind": kind_name}, projection, collation=CASE_INSENSITIVE)
                 if kind:
                     return create_response(True, content=[kind], status=200)
                 else:
@@ -129,31 +365,28 @@ class Database:
             return create_response(False, message=str(e), status=500)
         
 
-    def find_devices(self, device_params: Optional[DeviceParam]=None, device_id: Optional[int]=None) -> dict:
+    def find_devices(self, device_params: Optional[DeviceParam]=None, device_id: Optional[int]=None, page: Optional[PageParam]=None) -> dict:
         query = {}
-        projection = self.defult_projection.copy()
+        projection = self._projection("deviceId", no_detail=bool(device_params and device_params.no_detail), page=page)
         if device_id:
             query['deviceId'] = device_id
-        # Shows only Ids
         if device_params:
-            if device_params.no_detail:
-                projection["deviceId"] = 1
             if device_params.room_id:
                 query['deviceLocation.roomId'] = device_params.room_id
             if device_params.plant_id:
                 query['deviceLocation.plantId'] = device_params.plant_id
             if device_params.measure_type:
-                query['measureTypes'] = self._create_case_insensitive_query(device_params.measure_type)
+                query['measureTypes'] = device_params.measure_type
             if device_params.device_type:
                 query['deviceType'] = device_params.device_type
 
         try:
             if not device_id:
-                devices = list(self.devices_collection.find(query, projection))
-                return create_response(True, content=devices, status=200)
+                # Same collation as the device indexes, so that measureTypes is an indexed equality match
+                return self._find_page(self.devices_collection, query, projection, "deviceId", page, collation=CASE_INSENSITIVE)
             # An specific device
             else:
-                device = self.devices_collection.find_one(query, projection)
+                device = self.devices_collection.find_one(query, projection, collation=CASE_INSENSITIVE)
                 if device:
                     return create_response(True, content=[device], status=200)
                 else:
@@ -163,10 +396,20 @@ class Database:
             return create_response(False, message=str(e), status=500)
 
 
-    def find_users(self, params):
+    def find_registered(self, item_type: str, ids: list) -> Optional[dict]:
+        # id -> document of the plants or devices about to be registered again, None when unknown
+        collection, id_field = (self.plants_collection, "plantId") if item_type == "plants" else (self.devices_collection, "deviceId")
+        try:
+            return {item[id_field]: item for item in collection.find({id_field: {"$in": ids}}, self.defult_projection)}
+        except PyMongoError as e:
+            self.child_logger.error(f"Error retrieving the registered {item_type}: {str(e)}")
+            return None
+
+
+    def find_users(self, params, page: Optional[PageParam] = None):
        # Create a query based on the parameters
         query = {}
-        projection = self.defult_projection.copy()
+        projection = self._projection("userName", page=page)
         
         if 'user_name' in params:
             query['userName'] = params['user_name']
@@ -177,8 +420,7 @@ class Database:
 
         try:
             if not params:
-                users = list(self.users_collection.find(query, projection))
-                return create_response(True, content=users, status=200)
+                return self._find_page(self.users_collection, query, projection, "userName", page)
             # An specific user
             else:
                 user = self.users_collection.find_one(query, projection)
@@ -208,12 +450,19 @@ class Database:
                     {"$set": data}
                 )
                 if update_result.modified_count > 0:
+                    # A re-registration with the same details (the heartbeats) changes nothing
+                    self.record_change("services", "update", ids=[name])
+                    if self.mirror:
+                        self.mirror.upsert("services", "name", data)
                     return create_response(True, message=f"Service {name} updated successfully.", status=200)
                 return create_response(True, message=f"No changes made to service {name}.", status=200)
             
             # If service does not exist, add it
             insert_result = self.services_collection.insert_one(data)
             if insert_result.inserted_id:
+                self.record_change("services", "insert", ids=[name])
+                if self.mirror:
+                    self.mirror.upsert("services", "name", data)
                 self.child_logger.info(f"Service {name} added successfully.")
                 return create_response(True, message=f"Service {name} registered successfully.", status=201)
 
@@ -247,6 +496,7 @@ class Database:
                 },
                 upsert=True
             )
+            self.record_change("users", "update", ids=[user_name])
             return create_response(True, message=f"User {user_name} registered.", status=200)
         
         except PyMongoError as e:
@@ -270,8 +520,9 @@ class Database:
                 {'deviceId': device_id},
                 {'$set': {"deviceStatus": status}},
             )
-
             if device_update_result.modified_count:
+                self.record_change("devices", "update", ids=[device_id], room_ids=[device.get("deviceLocation", {}).get("roomId")],
+                                   fields=["deviceStatus"])
                 self.child_logger.info(f"Device {device_id}'s status updated to {status}.")
                 return create_response(True, message=f"Device {device_id}'s status updated to {status}.", status=200)
             else:
@@ -297,6 +548,8 @@ class Database:
                 {"plantInventory": plant_id}, 
                 {"$pull": {"plantInventory": plant_id}}
             )
+            self.record_change("plants", "delete", ids=[plant_id])
+            self.record_change("rooms", "update")
             # Check if any rooms were affected by the pull operation
             if room_update_result.modified_count > 0:
                 self.child_logger.info(f"Pulled plant ID {plant_id} from room(s) plantInventory. "
@@ -340,6 +593,9 @@ class Database:
                 {"deviceInventory": device_id},
                 {"$pull": {"deviceInventory": device_id}}
             )
+            self.record_change("devices", "delete", ids=[device_id])
+            for collection in ["plants", "rooms"]:
+                self.record_change(collection, "update")
             # Check if any rooms were affected by the pull operation
             if room_update_result.modified_count > 0:
                 self.child_logger.info(f"Pulled device ID {device_id} from room(s) deviceInventory. "
@@ -355,16 +611,55 @@ class Database:
             return create_response(False, message=str(e), status=500)
 
 
-    def remove_empty_rooms(self):
-        # Check if any room has an empty 'plantInventory' and 'deviceInventory', and delete those rooms
-        rooms_to_delete = self.rooms_collection.find({
-            "$and": [
-                {"plantInventory": {"$size": 0}},  # No plants in the inventory
-                {"deviceInventory": {"$size": 0}}  # No devices in the inventory
-            ]
+    def delete_outdated_plants(self, older_than: datetime) -> int:
+        # Selected with the lastUpdated index, then removed from the rooms with a single $pull
+        plant_ids = self.plants_collection.distinct("plantId", {"lastUpdated": {"$lt": older_than}})
+        if not plant_ids:
+            return 0
+        # lastUpdated is checked again, a plant registered in the meantime is kept (and stays in its room)
+        result = self.plants_collection.delete_many({"plantId": {"$in": plant_ids}, "lastUpdated": {"$lt": older_than}})
+        if not result.deleted_count:
+            return 0
+        kept = set(self.plants_collection.distinct("plantId", {"plantId": {"$in": plant_ids}}))
+        plant_ids = [plant_id for plant_id in plant_ids if plant_id not in kept]
+        self.rooms_collection.update_many(
+            {"plantInventory": {"$in": plant_ids}},
+            {"$pull": {"plantInventory": {"$in": plant_ids}}}
+        )
+        self.record_change("plants", "delete", ids=plant_ids)
+        self.record_change("rooms", "update")
+        self.child_logger.info(f"Outdated plants {plant_ids} deleted.")
+        return result.deleted_count
+
+    def delete_outdated_devices(self, older_than: datetime) -> int:
+        device_ids = self.devices_collection.distinct("deviceId", {"lastUpdated": {"$lt": older_than}})
+        if not device_ids:
+            return 0
+        result = self.devices_collection.delete_many({"deviceId": {"$in": device_ids}, "lastUpdated": {"$lt": older_than}})
+        if not result.deleted_count:
+            return 0
+        kept = set(self.devices_collection.distinct("deviceId", {"deviceId": {"$in": device_ids}}))
+        device_ids = [device_id for device_id in device_ids if device_id not in kept]
+        for collection in [self.plants_collection, self.rooms_collection]:
+            collection.update_many(
+                {"deviceInventory": {"$in": device_ids}},
+                {"$pull": {"deviceInventory": {"$in": device_ids}}}
+            )
+        self.record_change("devices", "delete", ids=device_ids)
+        for collection in ["plants", "rooms"]:
+            self.record_change(collection, "update")
+        self.child_logger.info(f"Outdated devices {device_ids} deleted.")
+        return result.deleted_count
+
+    def remove_empty_rooms(self) -> int:
+        # Delete the rooms with an empty 'plantInventory' and 'deviceInventory'
+        result = self.rooms_collection.delete_many({
+            "plantInventory": {"$size": 0},  # No plants in the inventory
+            "deviceInventory": {"$size": 0}  # No devices in the inventory
         })
-        for room in rooms_to_delete:
-            self.rooms_collection.delete_one({"roomId": room["roomId"]})
+        if result.deleted_count:
+            self.record_change("rooms", "delete")
+        return result.deleted_count
 
 
 
@@ -374,6 +669,7 @@ class Database:
                     {"telegramId": telegram_id},
                     {"$pull": {"plantInventory": plant_id}}
                 )
+            self.record_change("users", "update")
             # Check if user was affected by the pull operation
             if user_update_result.modified_count > 0:
                 self.child_logger.info(f"Pulled plant ID {plant_id} from user(s) plantInventory. "
@@ -397,6 +693,9 @@ class Database:
             if result.deleted_count == 0:
                 self.child_logger.info(f"Service {name} not found for deletion.")
                 return create_response(False, message=f"Service {name} not found.", status=404)
+            self.record_change("services", "delete", ids=[name])
+            if self.mirror:
+                self.mirror.remove("services", "name", name)
             self.child_logger.info(f"Service {name} deleted successfully.")
             return create_response(True, message=f"Service {name} deleted successfully.", status=200)
         except PyMongoError as e:
@@ -0,0 +1,118 @@
+'''MongoDB client shared by the registry, with its pool settings and the pool utilisation'''
+import threading
+import time
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from config import Config
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+
+
+def read_preference(name: str, max_staleness: int = -1):
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference '{name}', choose from {list(READ_PREFERENCES)}.")
+    # The primary is never stale
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts the connections of the pools by server, the events are published on the
+    threads that use the connections, so a check out is timed on its own thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # "host:port" -> counters
+        self._pools = {}
+        self._local = threading.local()
+
+    def _pool(self, address) -> dict:
+        return self._pools.setdefault(f"{address[0]}:{address[1]}", {
+            "open": 0, "checkedOut": 0, "maxCheckedOut": 0, "checkOuts": 0,
+            "checkOutFailures": 0, "checkOutWaitMs": 0.0, "maxCheckOutWaitMs": 0.0, "cleared": 0
+        })
+
+    def pool_created(self, event):
+        with self.lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self._pool(event.address)["cleared"] += 1
+
+    def pool_closed(self, event):
+        with self.lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        with self.lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(pool["open"] - 1, 0)
+
+    def connection_check_out_started(self, event):
+        self._local.started_at = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self._pool(event.address)["checkOutFailures"] += 1
+
+    def connection_checked_out(self, event):
+        wait = (time.perf_counter() - getattr(self._local, "started_at", time.perf_counter())) * 1000
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["checkOuts"] += 1
+            pool["checkedOut"] += 1
+            pool["maxCheckedOut"] = max(pool["maxCheckedOut"], pool["checkedOut"])
+            pool["checkOutWaitMs"] += wait
+            pool["maxCheckOutWaitMs"] = max(pool["maxCheckOutWaitMs"], wait)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["checkedOut"] = max(pool["checkedOut"] - 1, 0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            servers = {}
+            for address, pool in self._pools.items():
+                servers[address] = {
+                    **pool,
+                    "utilisation": round(pool["checkedOut"] / Config.MONGO_MAX_POOL_SIZE, 4) if Config.MONGO_MAX_POOL_SIZE else None,
+                    "checkOutWaitMs": round(pool["checkOutWaitMs"], 3),
+                    "avgCheckOutWaitMs": round(pool["checkOutWaitMs"] / pool["checkOuts"], 3) if pool["checkOuts"] else None,
+                    "maxCheckOutWaitMs": round(pool["maxCheckOutWaitMs"], 3)
+                }
+            return {"maxPoolSize": Config.MONGO_MAX_POOL_SIZE, "minPoolSize": Config.MONGO_MIN_POOL_SIZE, "servers": servers}
+
+
+pool_monitor = PoolMonitor()
+
+# One pool per server for the models and the database agent. Reads and writes go to the primary
+# by default, the list reads choose their read preference (see Database)
+client = MongoClient(
+    Config.MONGO_URL,
+    maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+    minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+    serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS or None,
+    event_listeners=[pool_monitor]
+)
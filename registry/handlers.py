@@ -1,19 +1,64 @@
 '''Each handler extracts and validates parameters, ensuring they are correctly 
 formatted before passing them to the database methods.'''
 
+from typing import Optional
+from config import Config
 from utility import convert_to_bool, create_response
-from models import DeviceParam, ValidationError, Plant, Device
+from models import DeviceParam, PageParam, ValidationError, Plant, Device, registration_stats
 from db.db import Database
+from maintenance import MaintenanceScheduler
 
 
 
 class Handler:
-    def __init__(self, database_agent: Database, logger) -> None:
+    # Collections a GET response depends on, by the first part of the path
+    GET_DEPENDENCIES = {
+        'general': ('general',),
+        'plants': ('plants',),
+        'plant_kinds': ('plant_kinds',),
+        'devices': ('devices',),
+        'users': ('users',),
+        'services': ('services',),
+        'rooms': ('rooms',),
+    }
+    # A room snapshot joins its plant kind, plants and devices
+    SNAPSHOT_DEPENDENCIES = ('rooms', 'plant_kinds', 'plants', 'devices')
+    # Written by every registration, a repeated one changes nothing else
+    UNTRACKED_FIELDS = {'lastUpdated', 'deviceInventory'}
+    # Their documents carry lastUpdated, which a repeated registration changes without a new revision,
+    # so the tags of the responses reading them are weak
+    WEAK_ETAG_COLLECTIONS = {'plants', 'devices'}
+    # Fields of the plants and devices that locate them in a room, or are copied to it
+    ROOM_FIELDS = {'plants': {'roomId', 'plantKind', 'plantDate'}, 'devices': {'deviceLocation', 'roomLocation'}}
+
+    def __init__(self, database_agent: Database, logger, maintenance: MaintenanceScheduler) -> None:
         self.db = database_agent
         self.logger = logger
+        self.maintenance = maintenance
 
     def _uri_normalizer(self, uri):
         return [part.lower() for part in uri]
+
+    def _page_params(self, params, id_type=int):
+        # Returns the page, or the response to send when the parameters are invalid
+        try:
+            page = PageParam(**params)
+            if page.after is not None:
+                page.after = id_type(page.after)
+        except (ValidationError, ValueError) as e:
+            return None, create_response(False, message=f"Invalid pagination parameters: {str(e)}", status=400)
+        return page, None
+
+    def get_etag(self, uri):
+        # Read before the query, so a write in between only makes the tag older than the body
+        normalized_uri = self._uri_normalizer(uri)
+        collections = self.GET_DEPENDENCIES.get(normalized_uri[0])
+        if normalized_uri[0] == 'rooms' and 'snapshot' in normalized_uri[1:3]:
+            collections = self.SNAPSHOT_DEPENDENCIES
+        # The maintenance status isn't stored in a collection
+        if not collections or normalized_uri[1:2] == ['maintenance']:
+            return None
+        return self.db.revisions.etag(collections, weak=bool(self.WEAK_ETAG_COLLECTIONS & set(collections)))
     
     def handle_get(self, uri, params):
         normalized_uri = self._uri_normalizer(uri)
@@ -38,17 +83,82 @@ class Handler:
         elif normalized_uri[0] == 'rooms':
             return self._handle_get_rooms(normalized_uri, params)
         
+        elif normalized_uri[0] == 'admin':
+            return self._handle_get_admin(normalized_uri)
+
+        elif normalized_uri[0] == 'changes':
+            return self._handle_get_changes(params)
+        
         return create_response(False, message="Invalid path.", status=404)
 
+    def _handle_get_admin(self, uri):
+        if len(uri) < 2:
+            return create_response(False, message="Choose your admin subpath from 'indexes' ...", status=400)
+
+        if uri[1] == "indexes":
+            return self.db.find_index_stats()
+        elif uri[1] == "changes":
+            return create_response(True, content=self.db.changes.stats(), status=200)
+        elif uri[1] == "mirror":
+            return self.db.find_mirror_stats()
+        elif uri[1] == "registrations":
+            return create_response(True, content=registration_stats.summary(), status=200)
+        elif uri[1] == "pool":
+            return self.db.find_pool_stats()
+
+        return create_response(False, message="Invalid admin subpath.", status=404)
+
+    def _handle_get_changes(self, params):
+        since = params.get("since")
+        if not since:
+            # Starting point: the consumer lists the items, then follows the changes from this cursor
+            return create_response(True, content={"cursor": self.db.changes.cursor(), "events": [], "reset": False}, status=200)
+
+        try:
+            timeout = min(max(float(params.get("timeout", 0)), 0), Config.CHANGE_FEED_MAX_WAIT)
+        except ValueError as e:
+            return create_response(False, message=f"Timeout must be a number of seconds: {str(e)}", status=400)
+        collections = [collection for collection in params.get("collections", "").lower().split(",") if collection]
+
+        events, cursor, reset = self.db.changes.read(since, collections=collections, timeout=timeout)
+        return create_response(True, content={"cursor": cursor, "events": events, "reset": reset}, status=200)
+
+    def _handle_get_room_snapshots(self, uri, params):
+        # /rooms/<room_id>/snapshot or /rooms/snapshot?rooms=1,2,3
+        batch = uri[1] == 'snapshot'
+        try:
+            if batch:
+                room_ids = [int(room_id) for room_id in params.get("rooms", "").split(",") if room_id.strip()]
+            else:
+                room_ids = [int(uri[1])]
+        except ValueError as e:
+            return create_response(False, message=f"Room IDs must be numbers: {str(e)}", status=400)
+
+        if not room_ids:
+            return create_response(False, message="No room ID inserted, try '?rooms=1,2,3'.", status=400)
+        if len(room_ids) > Config.PAGE_MAX_LIMIT:
+            return create_response(False, message=f"Too many rooms, at most {Config.PAGE_MAX_LIMIT} per request.", status=413)
+
+        response = self.db.find_room_snapshots(room_ids)
+        if not batch and response.get("success") and not response.get("content"):
+            return create_response(False, message=f"No room found with ID {room_ids[0]}", status=404)
+        return response
+
     def _handle_get_rooms(self, uri, params):
+        if 'snapshot' in uri[1:3]:
+            return self._handle_get_room_snapshots(uri, params)
+
         room_id = None
         if len(uri) > 1:
             try:
                 room_id = int(uri[1])
             except ValueError as e:
                 return create_response(False, message=f"Room ID must be a number, not '{uri[1]}': {str(e)}", status=400)
-                
-        return self.db.find_rooms(room_id=room_id)    
+
+        page, error = self._page_params(params)
+        if error:
+            return error
+        return self.db.find_rooms(room_id=room_id, page=page)    
 
     def _handle_get_services(self, uri, params):
         service_name = None
@@ -71,6 +181,8 @@ class Handler:
             return self.db.find_general(to_find="weatherForecast")
         elif uri[1] == "telegram_bot":
             return self.db.find_general(to_find="telegramBot")
+        elif uri[1] == "maintenance":
+            return create_response(True, content=self.maintenance.status(), status=200)
         
         return create_response(False, message="Invalid general subpath.", status=404)
     
@@ -83,8 +195,11 @@ class Handler:
                 plant_id = int(uri[1])
             except ValueError as e:
                 return create_response(False, message=f"Plant ID must be a number, not '{uri[1]}': {str(e)}", status=400)
-                
-        return self.db.find_plants(plant_id=plant_id, no_detail=no_detail)    
+
+        page, error = self._page_params(params)
+        if error:
+            return error
+        return self.db.find_plants(plant_id=plant_id, no_detail=no_detail, page=page)    
     
     def _handle_get_plant_kinds(self, uri, params):    
         kind_name = uri[1] if len(uri) > 1 else None
@@ -103,7 +218,10 @@ class Handler:
             device_params = DeviceParam(**params)
         except ValidationError as e:
             return create_response(False, message=f"Invalid parameters: {e}", status=400)
-        return self.db.find_devices(device_params, device_id=device_id)
+        page, error = self._page_params(params)
+        if error:
+            return error
+        return self.db.find_devices(device_params, device_id=device_id, page=page)
 
     def _handle_get_users(self, normalized_uri, params):
         plant_id = params.get("plant_id")
@@ -112,8 +230,12 @@ class Handler:
                 plant_id = int(plant_id)
             except ValueError as e:
                 return create_response(False, message=f"Plant ID must be a changeable to integer, not '{plant_id}': {str(e)}", status=400)
-        
-        return self.db.find_users(params)
+
+        page, error = self._page_params(params, id_type=str)
+        if error:
+            return error
+        filters = {key: value for key, value in params.items() if key not in PageParam.model_fields}
+        return self.db.find_users(filters, page=page)
 
 
 
@@ -121,7 +243,10 @@ class Handler:
     def handle_post(self, uri, params, data):
         normalized_uri = self._uri_normalizer(uri)
 
-        if normalized_uri[0] == 'plants':
+        if self._is_bulk(normalized_uri):
+            return self._handle_bulk(normalized_uri[0], data, insert_only=True)
+
+        elif normalized_uri[0] == 'plants':
             return self._handle_post_plants(data)
         
         elif normalized_uri[0] == 'devices':
@@ -148,6 +273,8 @@ class Handler:
             return create_response(False, message=f"Plant with id {plant.plant_id} already exists. Use PUT to update the resource.", status=409)
         
         response = plant.save_to_db()
+        if response.get("success"):
+            self._record_saved('plants', [plant], "insert")
         response.update({"status":201}) if response.get("success") else response
         return response
     
@@ -163,6 +290,8 @@ class Handler:
             return create_response(False, message=f"Device with id {device.device_id} already exists. Use PUT to update the resource.", status=409)
         
         response = device.save_to_db()
+        if response.get("success"):
+            self._record_saved('devices', [device], "insert")
         response.update({"status":201}) if response.get("success") else response
         return response
 
@@ -185,10 +314,108 @@ class Handler:
     
 
 
+    def _is_bulk(self, uri):
+        return len(uri) > 1 and uri[0] in ('plants', 'devices') and uri[1] == '_bulk'
+
+    def _handle_bulk(self, item_type, data, insert_only: bool):
+        # POST rejects the existing items as conflicts, PUT upserts them
+        if not isinstance(data, list):
+            return create_response(False, message=f"Invalid input. A list of {item_type} is expected.", status=400)
+        if len(data) > Config.BULK_MAX_ITEMS:
+            return create_response(False, message=f"Too many {item_type}, at most {Config.BULK_MAX_ITEMS} per request.", status=413)
+
+        model, id_field = (Plant, "plantId") if item_type == 'plants' else (Device, "deviceId")
+        results = [None] * len(data)
+        valid_items, positions = [], []
+        for index, item in enumerate(data):
+            try:
+                valid_items.append(model(**item))
+                positions.append(index)
+            except (ValidationError, TypeError) as e:
+                item_id = item.get(id_field) if isinstance(item, dict) else None
+                results[index] = {id_field: item_id, "success": False, "status": 400, "message": f"Validation failed: {str(e)}"}
+
+        self.logger.info(f"Bulk {'POST' if insert_only else 'PUT'} request for {len(data)} {item_type}.")
+        previous = None
+        if not insert_only and valid_items:
+            # To record only what the upserts change
+            previous = self.db.find_registered(item_type, [item.model_dump(by_alias=True)[id_field] for item in valid_items])
+        saved = {"insert": [], "update": []}
+        for index, item, result in zip(positions, valid_items, model.bulk_save_to_db(valid_items, insert_only=insert_only)):
+            results[index] = result
+            if result["success"]:
+                saved["insert" if result["status"] == 201 else "update"].append(item)
+        for operation, items in saved.items():
+            self._record_saved(item_type, items, operation, previous)
+        for index, result in enumerate(results):
+            result["index"] = index
+
+        failed = sum(1 for result in results if not result["success"])
+        return create_response(failed == 0, content=results,
+                               message=f"{len(results) - failed} {item_type} registered, {failed} failed.", status=200)
+
+    def _previous(self, id_field: str, presence_response: dict) -> Optional[dict]:
+        # The document found before a single registration, by id. Empty for a new item, None when unknown
+        if presence_response.get('status') == 404:
+            return {}
+        if presence_response.get('status') != 200:
+            return None
+        return {item[id_field]: item for item in presence_response.get('content') or []}
+
+    def _changed_fields(self, document: dict, previous: Optional[dict]) -> Optional[list]:
+        # None when the item is new (or its previous document unknown)
+        if previous is None:
+            return None
+        return sorted(field for field, value in document.items()
+                      if field not in self.UNTRACKED_FIELDS and previous.get(field) != value)
+
+    def _room_and_plant(self, item_type, document: dict):
+        if item_type == 'plants':
+            return document.get('roomId'), None
+        location = document.get('deviceLocation') or {}
+        return location.get('roomId'), location.get('plantId')
+
+    def _record_saved(self, item_type, items: list, operation: str, previous: Optional[dict]=None):
+        # The registrations write through the models, the inventories of the rooms (and plants) change with them.
+        # previous maps the ids to the documents before the save: the items registered again unchanged are
+        # left out, and the event tells the fields the others changed
+        id_field = 'plantId' if item_type == 'plants' else 'deviceId'
+        ids, fields, room_ids, relocated_room_ids, plant_ids = [], set(), set(), set(), set()
+        all_known = True
+        for item in items:
+            document = item.model_dump(by_alias=True, exclude_unset=True)
+            before = previous.get(document[id_field]) if previous is not None else None
+            changed = self._changed_fields(document, before)
+            if changed == []:
+                continue
+            ids.append(document[id_field])
+            if changed is None:
+                all_known = False
+            else:
+                fields.update(changed)
+            # A moved item leaves its previous room (and plant) too
+            locations = [self._room_and_plant(item_type, document)] + ([self._room_and_plant(item_type, before)] if before else [])
+            room_ids.update(room_id for room_id, _ in locations if room_id is not None)
+            if changed is None or self.ROOM_FIELDS[item_type] & set(changed):
+                relocated_room_ids.update(room_id for room_id, _ in locations if room_id is not None)
+                plant_ids.update(plant_id for _, plant_id in locations if plant_id)
+        if not ids:
+            return
+
+        room_ids, relocated_room_ids = sorted(room_ids), sorted(relocated_room_ids)
+        self.db.record_change(item_type, operation, ids=ids, room_ids=room_ids, fields=sorted(fields) if all_known else None)
+        if plant_ids:
+            self.db.record_change('plants', "update", ids=sorted(plant_ids), room_ids=relocated_room_ids, fields=['deviceInventory'])
+        if relocated_room_ids:
+            self.db.record_change('rooms', "update", ids=relocated_room_ids, room_ids=relocated_room_ids)
+
     def handle_put(self, uri, params, data):
         normalized_uri = self._uri_normalizer(uri)
 
-        if normalized_uri[0] == 'plants':
+        if self._is_bulk(normalized_uri):
+            return self._handle_bulk(normalized_uri[0], data, insert_only=False)
+
+        elif normalized_uri[0] == 'plants':
             return self._handle_put_plants(data)
         
         elif normalized_uri[0] == 'devices':
@@ -212,8 +439,11 @@ class Handler:
             return create_response(False, message=f"Plant validation failed: {str(e)}", status=400)
         
         self.logger.info(f"PUT request for the plant {plant.plant_id}.")
-        plant_presence_response = self.db.find_plants(plant.plant_id, no_detail=True)
+        plant_presence_response = self.db.find_plants(plant.plant_id)
         response = plant.save_to_db()
+        if response.get("success"):
+            self._record_saved('plants', [plant], "update" if plant_presence_response.get('status') == 200 else "insert",
+                               self._previous('plantId', plant_presence_response))
         if plant_presence_response.get('status') == 200:
             response.update({"status":200}) if response.get("success") else response
         if plant_presence_response.get('status') == 404:
@@ -229,6 +459,9 @@ class Handler:
         self.logger.info(f"PUT request for the device {device.device_id}.")
         device_presence_response = self.db.find_devices(device_id=device.device_id)
         response = device.save_to_db()
+        if response.get("success"):
+            self._record_saved('devices', [device], "update" if device_presence_response.get('status') == 200 else "insert",
+                               self._previous('deviceId', device_presence_response))
         if device_presence_response.get('status') == 200:
             response.update({"status":200}) if response.get("success") else response
         if device_presence_response.get('status') == 404:
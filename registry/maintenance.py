@@ -0,0 +1,99 @@
+'''Background scheduler of the registry maintenance jobs (cleanup, index maintenance, ...)'''
+
+import datetime
+import random
+import threading
+import time
+from typing import Callable
+
+
+class MaintenanceJob():
+    def __init__(self, name: str, func: Callable, interval: float, jitter: float, initial_delay: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        # Fraction of the interval added or removed at random from every run
+        self.jitter = jitter
+        self.running = False
+        self.next_run = time.time() + initial_delay
+        self.last_run = {}
+        self.counters = {"runs": 0, "failures": 0, "skipped": 0}
+
+    def schedule_next(self, started_at: float):
+        delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+        self.next_run = started_at + max(delay, 0)
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "running": self.running,
+            "lastRun": self.last_run,
+            "nextRun": datetime.datetime.fromtimestamp(self.next_run).strftime("%Y-%m-%d %H:%M:%S"),
+            **self.counters
+        }
+
+
+class MaintenanceScheduler():
+    """Runs every job on its own cadence from a daemon thread. A job that is still
+    running when it's due again is skipped instead of overlapping with itself."""
+
+    def __init__(self, logger, max_wait: float=5):
+        self.logger = logger
+        self.max_wait = max_wait
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="maintenance_scheduler", daemon=True)
+
+    def add_job(self, name: str, func: Callable, interval: float, jitter: float=0, initial_delay: float=0):
+        with self.lock:
+            self.jobs[name] = MaintenanceJob(name, func, interval, jitter, initial_delay)
+        self.logger.info(f"Maintenance job {name} scheduled every {interval} seconds.")
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            now = time.time()
+            with self.lock:
+                due = [job for job in self.jobs.values() if job.next_run <= now]
+                for job in due:
+                    job.schedule_next(started_at=now)
+                    if job.running:
+                        job.counters["skipped"] += 1
+                        self.logger.warning(f"Maintenance job {job.name} is still running, this run is skipped.")
+                        continue
+                    job.running = True
+                    # A slow job doesn't delay the others
+                    threading.Thread(target=self._execute, args=(job,), name=f"maintenance_{job.name}", daemon=True).start()
+                next_run = min((job.next_run for job in self.jobs.values()), default=now + self.max_wait)
+            self.stop_event.wait(min(max(next_run - time.time(), 0), self.max_wait))
+
+    def _execute(self, job: MaintenanceJob):
+        start = time.perf_counter()
+        last_run = {"startedAt": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        try:
+            last_run["result"] = job.func()
+            last_run["success"] = True
+        except Exception as e:
+            last_run["success"] = False
+            last_run["error"] = str(e)
+            self.logger.error(f"Maintenance job {job.name} failed: {str(e)}")
+        last_run["durationMs"] = round((time.perf_counter() - start) * 1000, 3)
+
+        with self.lock:
+            job.running = False
+            job.last_run = last_run
+            job.counters["runs"] += 1
+            if not last_run["success"]:
+                job.counters["failures"] += 1
+
+    def status(self) -> list:
+        with self.lock:
+            return [job.status() for job in self.jobs.values()]
@@ -0,0 +1,116 @@
+'''Write-through in-memory copy of the small and hot collections of the registry'''
+import threading
+import time
+from typing import Callable, List, Optional
+from pymongo.errors import PyMongoError
+
+
+class CatalogMirror():
+    """Reads of the mirrored collections are served from memory. The registry's own writes
+    update the copy in place, the changes made by others arrive through a change stream
+    (replica sets only) and, in any case, with the periodic refresh."""
+
+    def __init__(self, collections: dict, logger, on_change: Callable[[str, str], None]=None):
+        # name -> pymongo collection
+        self.collections = collections
+        self.logger = logger
+        # Called with the name of a collection found changed by a refresh, i.e. changed out of the registry
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        # name -> list of documents (without _id)
+        self._items = {}
+        self._loaded_at = {}
+        self.counters = {name: {"hits": 0, "misses": 0, "loads": 0, "writes": 0} for name in collections}
+        self.change_stream = False
+        self.refresh()
+
+    def refresh(self, name: str=None) -> dict:
+        names = [name] if name else list(self.collections)
+        for name in names:
+            try:
+                items = list(self.collections[name].find({}, {"_id": 0}))
+            except PyMongoError as e:
+                # The previous copy is kept, staleness shows in the stats
+                self.logger.error(f"Failed to load the mirror of {name}: {str(e)}")
+                continue
+            with self.lock:
+                changed = name in self._items and self._items[name] != items
+                self._items[name] = items
+                self._loaded_at[name] = time.time()
+                self.counters[name]["loads"] += 1
+            if changed and self.on_change:
+                self.on_change(name, "update")
+        with self.lock:
+            return {name: len(self._items.get(name, [])) for name in names}
+
+    def get(self, name: str) -> Optional[List[dict]]:
+        # None when the collection was never loaded, the caller reads it from Mongo
+        with self.lock:
+            items = self._items.get(name)
+            self.counters[name]["hits" if items is not None else "misses"] += 1
+            return list(items) if items is not None else None
+
+    def upsert(self, name: str, key: str, document: dict):
+        # Same merge as the $set of the write paths. The documents are replaced, never
+        # modified, as the ones handed out by get may be being encoded meanwhile
+        document = {field: value for field, value in document.items() if field != "_id"}
+        with self.lock:
+            items = self._items.get(name)
+            if items is None:
+                return
+            for position, item in enumerate(items):
+                if item.get(key) == document.get(key):
+                    items[position] = {**item, **document}
+                    break
+            else:
+                items.append(document)
+            self.counters[name]["writes"] += 1
+
+    def remove(self, name: str, key: str, value):
+        with self.lock:
+            items = self._items.get(name)
+            if items is None:
+                return
+            self._items[name] = [item for item in items if item.get(key) != value]
+            self.counters[name]["writes"] += 1
+
+    def watch(self, db, retry_interval: float):
+        threading.Thread(target=self._watch, args=(db, retry_interval), name="mirror_watcher", daemon=True).start()
+
+    def _watch(self, db, retry_interval: float):
+        names = {collection.name: name for name, collection in self.collections.items()}
+        pipeline = [{"$match": {"ns.coll": {"$in": list(names)}}}]
+        supported = False
+        while True:
+            try:
+                with db.watch(pipeline) as stream:
+                    supported = self.change_stream = True
+                    self.logger.info(f"Following the changes of {list(self.collections)} for the mirror.")
+                    for change in stream:
+                        name = names.get(change.get("ns", {}).get("coll"))
+                        if not name:
+                            continue
+                        self.refresh(name)
+            except PyMongoError as e:
+                if not supported:
+                    # A standalone mongod, the periodic refresh keeps the mirror up to date
+                    self.logger.warning(f"Change streams unavailable, the mirror is refreshed periodically: {str(e)}")
+                    return
+                self.change_stream = False
+                self.logger.error(f"Change stream of the mirror interrupted: {str(e)}")
+            time.sleep(retry_interval)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self.lock:
+            collections = {}
+            for name, counters in self.counters.items():
+                reads = counters["hits"] + counters["misses"]
+                loaded_at = self._loaded_at.get(name)
+                collections[name] = {
+                    "documents": len(self._items.get(name, [])),
+                    "ageSeconds": round(now - loaded_at, 3) if loaded_at else None,
+                    "hitRatio": round(counters["hits"] / reads, 4) if reads else None,
+                    **counters
+                }
+            return {"changeStream": self.change_stream, "collections": collections}
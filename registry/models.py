@@ -1,14 +1,17 @@
 """Pydantic models for validations and registration of plants and devices"""
 
-from pydantic import BaseModel, ValidationError, ConfigDict
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+import threading
+import time
+from collections import deque
+from pydantic import BaseModel, ValidationError, ConfigDict, Field
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import PyMongoError, BulkWriteError
 from datetime import datetime
-from typing import List, Optional, Dict, Literal, Any
+from typing import List, Optional, Dict, Literal, Any, Union
 from config import Config, MyLogger
 from utility import to_lower_camel_case
+from db.pool import client
 
-client = MongoClient(Config.MONGO_URL)
 db = client[Config.DB]
 plants_collection = db[Config.PLANTS_COLLECTION]
 rooms_collection = db[Config.ROOMS_COLLECTION]
@@ -16,8 +19,90 @@ devices_collection = db[Config.DEVICES_COLLECTION]
 
 model_logger = MyLogger.set_logger(logger_name=Config.MODEL_LOGGER)
 
+# Decided on the first registration, as the client connects lazily
+_transactions_supported = None
+
+
+def _use_transactions() -> bool:
+    """Multi-document transactions need a replica set (or a sharded cluster)"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        if Config.MONGO_TRANSACTIONS == "off":
+            _transactions_supported = False
+        else:
+            client.admin.command("ping")
+            _transactions_supported = client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+            model_logger.info(f"Registrations {'run in transactions' if _transactions_supported else 'use conditional updates'}.")
+    return _transactions_supported
+
+
+def _run_save(save) -> bool:
+    """Runs save(session) in a transaction when possible, save(None) otherwise.
+    Returns whether a transaction was used."""
+    if not _use_transactions():
+        save(None)
+        return False
+    with client.start_session() as session:
+        # Retried as a whole on transient errors, aborted when save raises
+        session.with_transaction(save)
+    return True
+
+
+class RegistrationStats():
+    """Latency of the registrations, percentiles are computed on the last ones"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, item_type: str, started_at: float, success: bool, transactional: bool):
+        duration = (time.perf_counter() - started_at) * 1000
+        with self.lock:
+            stats = self._stats.setdefault(item_type, {"count": 0, "failures": 0, "transactions": 0,
+                                                       "latencies": deque(maxlen=self.window)})
+            stats["count"] += 1
+            stats["failures"] += 0 if success else 1
+            stats["transactions"] += 1 if transactional else 0
+            stats["latencies"].append(duration)
+
+    def summary(self) -> dict:
+        with self.lock:
+            summary = {}
+            for item_type, stats in self._stats.items():
+                latencies = sorted(stats["latencies"])
+                summary[item_type] = {
+                    "count": stats["count"],
+                    "failures": stats["failures"],
+                    "transactions": stats["transactions"],
+                    "p50Ms": round(latencies[len(latencies) // 2], 3),
+                    "p95Ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3),
+                    "maxMs": round(latencies[-1], 3)
+                }
+            return summary
+
+
+registration_stats = RegistrationStats(window=Config.REGISTRATION_STATS_WINDOW)
+
+
+def _bulk_write(collection, operations: list) -> Dict[int, str]:
+    """Sends the operations in a single round trip, returns the errors by operation index"""
+    if not operations:
+        return {}
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        return {error["index"]: error.get("errmsg", "") for error in e.details.get("writeErrors", [])}
+    return {}
+
+
+def _item_result(id_field: str, item_id: int, success: bool, status: int, message: str) -> dict:
+    return {id_field: item_id, "success": success, "status": status, "message": message}
+
+
 class BaseModelWithTimestamp(BaseModel):
-    last_updated: Optional[str] = None
+    # Stored as a BSON date, so that the cleaner selects the outdated items with an indexed range query
+    last_updated: Optional[datetime] = None
     
     # Lets the model to accept both camel and snake case. 
     # Plus, providing option to dump in both ways
@@ -26,7 +111,7 @@ class BaseModelWithTimestamp(BaseModel):
     )
     def model_dump_with_time(self, by_alias: bool = True, exclude_unset: bool = True) -> dict:
         """Adds a timestamp to the model before dumping"""
-        self.last_updated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.last_updated = datetime.now().replace(microsecond=0)
         # Change the difult dump to be camelCase
         return self.model_dump(by_alias=by_alias, exclude_unset=exclude_unset)
 
@@ -66,75 +151,153 @@ class Device(BaseModelWithTimestamp):
     def save_to_db(self):
         model_logger.debug(f"Entering save_to_db method for device_id: {self.device_id}")
         print()
+        started_at, transactional, success = time.perf_counter(), False, False
         try:
             model_logger.info(f"""Starting update/insert for device {self.device_id} in room {self.device_location.room_id} for plant {self.device_location.plant_id}...""")
-            plant_id = self.device_location.plant_id
-            room_id = self.device_location.room_id
-
-            # Check if the device's plant exists in the database
-            if plant_id:
-                self._check_plant_exists(plant_id)
-                
-            # Check if the device's room exist in the database
-            self._check_room_exists(room_id)
-            self._upsert_device()
-
-            if plant_id:
-                self._update_plant_device_inventory(plant_id)
-            self._update_room_device_inventory(room_id)
+            transactional = _run_save(self._save)
+            success = True
 
         except Exception as e:
             model_logger.error(f"Error saving device {self.device_id} to database: {str(e)}")
             return {"success": False, "message": f"Failed to registere the device: {str(e)}"}
 
-        return {"success": True, "message": "Device registered successfully"}
+        finally:
+            registration_stats.record("devices", started_at, success, transactional)
 
+        return {"success": True, "message": "Device registered successfully"}
 
-    ### Helper functions
-    def _check_plant_exists(self, plant_id: int):
-        plant = plants_collection.find_one({"plantId": plant_id})
-        if not plant:
-            model_logger.error(f"Plant with id {plant_id} does not exist.")
-            raise ValueError(f"Plant with id {plant_id} does not exist.")
-    
-    def _check_room_exists(self, room_id: int):
-        room = rooms_collection.find_one({'roomId': room_id})
-        if not room:
+    def _save(self, session=None):
+        # The existence checks are the inventory updates themselves: three round trips in all.
+        # Without a transaction, a failed check undoes what was written before it.
+        plant_id = self.device_location.plant_id
+        room_id = self.device_location.room_id
+        # Stamps last_updated, which goes to the plant too
+        self.model_dump_with_time()
+
+        previous_inventory = None
+        if plant_id:
+            previous_inventory = self._update_plant_device_inventory(plant_id, session)
+        if not self._update_room_device_inventory(room_id, session):
+            if plant_id and not session and self.device_id not in previous_inventory:
+                plants_collection.update_one({'plantId': plant_id}, {'$pull': {'deviceInventory': self.device_id}})
             model_logger.error(f"Room with id {room_id} does not exist.")
             raise ValueError(f"Room with id {room_id} does not exist.")
-        
-    def _upsert_device(self):
+        self._upsert_device(session)
+
+
+    ### Helper functions
+    def _upsert_device(self, session=None):
         device_data = self.model_dump_with_time()
         device_update_result = devices_collection.update_one(
             {'deviceId': self.device_id},
             {'$set': device_data},
-            upsert=True
+            upsert=True,
+            session=session
         )
         if device_update_result.upserted_id:
             model_logger.info(f"Inserted new device with ID {self.device_id}.")
         else:
             model_logger.info(f"Updated existing device with ID {self.device_id}.")
 
-    # Plus, updates plant's last update too
-    def _update_plant_device_inventory(self, plant_id: int):
-        plants_collection.update_one(
+    # Plus, updates plant's last update too. Returns the inventory before the update
+    def _update_plant_device_inventory(self, plant_id: int, session=None) -> list:
+        plant = plants_collection.find_one_and_update(
             {'plantId': plant_id},
             {
                 '$addToSet': {'deviceInventory': self.device_id},
                 '$set': {'lastUpdated': self.last_updated}
-            }
+            },
+            projection={'_id': 0, 'deviceInventory': 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session
         )
+        if plant is None:
+            model_logger.error(f"Plant with id {plant_id} does not exist.")
+            raise ValueError(f"Plant with id {plant_id} does not exist.")
         model_logger.info(f"Device id {self.device_id} upserted to plant {plant_id} device_inventory.")
+        return plant.get('deviceInventory', [])
 
-    def _update_room_device_inventory(self, room_id: int):
-        rooms_collection.update_one(
+    def _update_room_device_inventory(self, room_id: int, session=None) -> bool:
+        room_update_result = rooms_collection.update_one(
             {'roomId': room_id},
             {
                 '$addToSet': {'deviceInventory': self.device_id},
                 '$set': {'location': self.room_location}
-            }
+            },
+            session=session
         )
+        if not room_update_result.matched_count:
+            return False
         model_logger.info(f"Device id {self.device_id} upserted to room {room_id} device_inventory.\n")
+        return True
+
+    @classmethod
+    def bulk_save_to_db(cls, devices: List["Device"], insert_only: bool = False) -> List[dict]:
+        """Registers the devices with one round trip per collection, returns a result per device.
+        With insert_only, the devices that already exist are rejected as conflicts."""
+        model_logger.info(f"Starting bulk update/insert of {len(devices)} devices...")
+        results = [None] * len(devices)
+        try:
+            device_ids = [device.device_id for device in devices]
+            plant_ids = list({device.device_location.plant_id for device in devices if device.device_location.plant_id})
+            room_ids = list({device.device_location.room_id for device in devices})
+            existing_devices = {d["deviceId"] for d in devices_collection.find({"deviceId": {"$in": device_ids}}, {"deviceId": 1})}
+            existing_plants = {p["plantId"] for p in plants_collection.find({"plantId": {"$in": plant_ids}}, {"plantId": 1})}
+            existing_rooms = {r["roomId"] for r in rooms_collection.find({"roomId": {"$in": room_ids}}, {"roomId": 1})}
+
+            to_save = []
+            for index, device in enumerate(devices):
+                plant_id, room_id = device.device_location.plant_id, device.device_location.room_id
+                if insert_only and device.device_id in existing_devices:
+                    results[index] = _item_result("deviceId", device.device_id, False, 409, f"Device with id {device.device_id} already exists. Use PUT to update the resource.")
+                elif plant_id and plant_id not in existing_plants:
+                    results[index] = _item_result("deviceId", device.device_id, False, 400, f"Plant with id {plant_id} does not exist.")
+                elif room_id not in existing_rooms:
+                    results[index] = _item_result("deviceId", device.device_id, False, 400, f"Room with id {room_id} does not exist.")
+                else:
+                    to_save.append(index)
+
+            operations = [UpdateOne({'deviceId': devices[index].device_id}, {'$set': devices[index].model_dump_with_time()}, upsert=True)
+                          for index in to_save]
+            errors = _bulk_write(devices_collection, operations)
+
+            # Inventories of the plants and the rooms, grouped to one update per document
+            plants_inventory, rooms_inventory = {}, {}
+            for position, index in enumerate(to_save):
+                if position in errors:
+                    continue
+                device = devices[index]
+                if device.device_location.plant_id:
+                    plant = plants_inventory.setdefault(device.device_location.plant_id, {"devices": [], "lastUpdated": None})
+                    plant["devices"].append(device.device_id)
+                    plant["lastUpdated"] = device.last_updated
+                room = rooms_inventory.setdefault(device.device_location.room_id, {"devices": [], "location": None})
+                room["devices"].append(device.device_id)
+                room["location"] = device.room_location
+            _bulk_write(plants_collection, [
+                UpdateOne({'plantId': plant_id}, {'$addToSet': {'deviceInventory': {'$each': plant["devices"]}},
+                                                  '$set': {'lastUpdated': plant["lastUpdated"]}})
+                for plant_id, plant in plants_inventory.items()])
+            _bulk_write(rooms_collection, [
+                UpdateOne({'roomId': room_id}, {'$addToSet': {'deviceInventory': {'$each': room["devices"]}},
+                                                '$set': {'location': room["location"]}})
+                for room_id, room in rooms_inventory.items()])
+
+            for position, index in enumerate(to_save):
+                device_id = devices[index].device_id
+                if position in errors:
+                    results[index] = _item_result("deviceId", device_id, False, 500, f"Failed to registere the device: {errors[position]}")
+                else:
+                    status = 200 if device_id in existing_devices else 201
+                    results[index] = _item_result("deviceId", device_id, True, status, "Device registered successfully")
+
+        except PyMongoError as e:
+            model_logger.error(f"Error occurred durring bulk update/insert of devices: {e}.")
+            results = [result or _item_result("deviceId", device.device_id, False, 500, f"Failed to registere the device: {str(e)}")
+                       for device, result in zip(devices, results)]
+
+        model_logger.info(f"Bulk update/insert of {len(devices)} devices completed.")
+        return results
 
 
 
@@ -154,45 +317,47 @@ class Plant(BaseModelWithTimestamp):
     def save_to_db(self) -> dict:
         model_logger.debug(f"Entering save_to_db method for plant_id: {self.plant_id}")
         print()
+        started_at, transactional, success = time.perf_counter(), False, False
         try:
             model_logger.info(f"""Starting update/insert for plant {self.plant_id} in room {self.room_id} ...""")
-
-            # Check if the plant already exists in the database
-            existing_plant = plants_collection.find_one({"plantId": self.plant_id})
-    
-            # Prepare the data to update, excluding device_inventory if the plant already exists
-            updated_data = self.model_dump_with_time()
-
-            if existing_plant:
-                model_logger.info(f"Plant {self.plant_id} already exists in the database. Preparing to update.")
-                # If the plant exists, we want to update only specific fields excluding device_inventory
-                updated_data.pop("deviceInventory", None)
-            
-            # Perform the update or insert (upsert) for the plant in the transaction
-            self._upsert_plant(updated_data)
-
-            # Perform the upsert for the room (adding plant_id to plant_inventory)
-            self._upsert_room()
+            transactional = _run_save(self._save)
+            success = True
 
         except PyMongoError as e:
             model_logger.error(f"Error occurred durring update/insert: {e}.")
             return {"success": False, "message": f"Failed to registere the plant: {str(e)}"}
 
+        finally:
+            registration_stats.record("plants", started_at, success, transactional)
+
         model_logger.debug(f"Exiting save_to_db method for plant_id: {self.plant_id}\n")
         return {"success": True, "message": "Plant registered successfully"}
 
-    def _upsert_plant(self, updated_data: dict) -> None:
+    def _save(self, session=None) -> None:
+        # The device inventory is only written when the plant is inserted, so that of an
+        # existing plant is kept without reading it first
+        updated_data = self.model_dump_with_time()
+        updated_data.pop("deviceInventory", None)
+
+        # Perform the update or insert (upsert) for the plant
+        self._upsert_plant(updated_data, session)
+
+        # Perform the upsert for the room (adding plant_id to plant_inventory)
+        self._upsert_room(session)
+
+    def _upsert_plant(self, updated_data: dict, session=None) -> None:
         plant_update_result = plants_collection.update_one(
             {"plantId": self.plant_id},
-            {"$set": updated_data},
+            {"$set": updated_data, "$setOnInsert": {"deviceInventory": []}},
             upsert=True,
+            session=session
         )
         if plant_update_result.upserted_id:
             model_logger.info(f"Inserted new plant with ID {self.plant_id}.")
         else:
             model_logger.info(f"Updated existing plant with ID {self.plant_id}.")
 
-    def _upsert_room(self) -> None:
+    def _upsert_room(self, session=None) -> None:
         # Update the room by adding the plant_id to plantInventory if it doesn't exist yet
         room_update_result = rooms_collection.update_one(
             {"roomId": self.room_id},
@@ -201,6 +366,7 @@ class Plant(BaseModelWithTimestamp):
                 '$set': {'plantKind': self.plant_kind, 'plantDate': self.plant_date},
             },  
             upsert=True,  # If the room doesn't exist, this will create the room with the plant_id
+            session=session
         )
         if room_update_result.upserted_id:
             model_logger.info(f"Created new room with ID {self.room_id} and added plant {self.plant_id}.")
@@ -209,6 +375,63 @@ class Plant(BaseModelWithTimestamp):
                 model_logger.info(f"Plant {self.plant_id} is added to room {self.room_id}'s inventory.")
             else:
                 model_logger.info(f"Plant {self.plant_id} is already in room {self.room_id}'s inventory.")
+
+    @classmethod
+    def bulk_save_to_db(cls, plants: List["Plant"], insert_only: bool = False) -> List[dict]:
+        """Registers the plants with one round trip per collection, returns a result per plant.
+        With insert_only, the plants that already exist are rejected as conflicts."""
+        model_logger.info(f"Starting bulk update/insert of {len(plants)} plants...")
+        results = [None] * len(plants)
+        try:
+            plant_ids = [plant.plant_id for plant in plants]
+            existing_plants = {p["plantId"] for p in plants_collection.find({"plantId": {"$in": plant_ids}}, {"plantId": 1})}
+
+            to_save, operations = [], []
+            for index, plant in enumerate(plants):
+                if insert_only and plant.plant_id in existing_plants:
+                    results[index] = _item_result("plantId", plant.plant_id, False, 409, f"Plant with id {plant.plant_id} already exists. Use PUT to update the resource.")
+                    continue
+                updated_data = plant.model_dump_with_time()
+                # The device inventory of an existing plant is kept
+                if plant.plant_id in existing_plants:
+                    updated_data.pop("deviceInventory", None)
+                to_save.append(index)
+                operations.append(UpdateOne({"plantId": plant.plant_id}, {"$set": updated_data}, upsert=True))
+            errors = _bulk_write(plants_collection, operations)
+
+            # One update per room, the kind and date of its last plant are kept as in save_to_db
+            rooms = {}
+            for position, index in enumerate(to_save):
+                if position in errors:
+                    continue
+                room = rooms.setdefault(plants[index].room_id, {"plants": [], "plant": None})
+                room["plants"].append(plants[index].plant_id)
+                room["plant"] = plants[index]
+            room_ids = list(rooms)
+            room_errors = _bulk_write(rooms_collection, [
+                UpdateOne({"roomId": room_id},
+                          {"$addToSet": {"plantInventory": {"$each": room["plants"]}},
+                           "$set": {"plantKind": room["plant"].plant_kind, "plantDate": room["plant"].plant_date}},
+                          upsert=True)
+                for room_id, room in rooms.items()])
+            failed_rooms = {room_ids[position]: message for position, message in room_errors.items()}
+
+            for position, index in enumerate(to_save):
+                plant = plants[index]
+                error = errors.get(position) or failed_rooms.get(plant.room_id)
+                if error:
+                    results[index] = _item_result("plantId", plant.plant_id, False, 500, f"Failed to registere the plant: {error}")
+                else:
+                    status = 200 if plant.plant_id in existing_plants else 201
+                    results[index] = _item_result("plantId", plant.plant_id, True, status, "Plant registered successfully")
+
+        except PyMongoError as e:
+            model_logger.error(f"Error occurred durring bulk update/insert of plants: {e}.")
+            results = [result or _item_result("plantId", plant.plant_id, False, 500, f"Failed to registere the plant: {str(e)}")
+                       for plant, result in zip(plants, results)]
+
+        model_logger.info(f"Bulk update/insert of {len(plants)} plants completed.")
+        return results
         
         
 
@@ -221,6 +444,18 @@ class DeviceParam(BaseModelAlias):
     room_id: Optional[int] = None
     no_detail: bool=False
 
+class PageParam(BaseModelAlias):
+    # The items are sorted by ID, 'after' is the last ID of the previous page
+    limit: Optional[int] = Field(default=None, gt=0, le=Config.PAGE_MAX_LIMIT)
+    after: Optional[Union[int, str]] = None
+    # Comma separated fields to return, the ID is always included
+    fields: Optional[str] = None
+    # Sends the items while they are read from the cursor
+    stream: bool = False
+
+    def field_list(self) -> List[str]:
+        return [field.strip() for field in (self.fields or "").split(",") if field.strip()]
+
 
 
 
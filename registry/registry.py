@@ -5,24 +5,47 @@ from web_service import WebCatalog
 from db.db import Database
 from cleaners import Cleaner
 from handlers import Handler
+from maintenance import MaintenanceScheduler
 
 
 
 if __name__ == '__main__':
     database = Database(logger=MyLogger.set_logger(logger_name=Config.DB_LOGGER))
     cleaner = Cleaner(database_agent=database, logger=MyLogger.set_logger(logger_name=Config.CLEANER_LOGGER))
-    handler = Handler(database_agent=database, logger=MyLogger.set_logger(logger_name=Config.HANDLER_LOGGER))
+
+    maintenance = MaintenanceScheduler(logger=MyLogger.set_logger(logger_name=Config.MAINTENANCE_LOGGER))
+    maintenance.add_job("cleanup", cleaner.cleanup, interval=Config.CLEANUP_INTERVAL, jitter=Config.CLEANUP_JITTER)
+    maintenance.add_job("index_maintenance", database.ensure_indexes, interval=Config.INDEX_MAINTENANCE_INTERVAL,
+                        initial_delay=Config.INDEX_MAINTENANCE_INTERVAL)
+    if database.mirror:
+        # Catches the changes missed by the change stream, or replaces it on a standalone mongod
+        maintenance.add_job("mirror_refresh", database.mirror.refresh, interval=Config.MIRROR_REFRESH_INTERVAL,
+                            initial_delay=Config.MIRROR_REFRESH_INTERVAL)
+    maintenance.start()
+
+    handler = Handler(database_agent=database, logger=MyLogger.set_logger(logger_name=Config.HANDLER_LOGGER), maintenance=maintenance)
 
     ## CherryPy setup
     conf = {
         "/": {
             'request.dispatch': cherrypy.dispatch.MethodDispatcher(),
-            'tools.sessions.on': True
+            # Stateless JSON API: no session cookie, nor a session lock per request
+            'tools.sessions.on': False,
+            # Compressed when the client accepts it, chunk by chunk for the streamed lists
+            'tools.gzip.on': True,
+            'tools.gzip.mime_types': ['application/json', 'application/x-ndjson']
         }
     }
+    if Config.SERVER_ENVIRONMENT:
+        cherrypy.config.update({'environment': Config.SERVER_ENVIRONMENT})
     cherrypy.config.update({
-        'server.socket_host': '0.0.0.0',  # Bind to all network interfaces
-        'server.socket_port': 8080,       # Ensure it's listening on port 8080
+        'server.socket_host': Config.SERVER_HOST,
+        'server.socket_port': Config.SERVER_PORT,
+        'server.thread_pool': Config.SERVER_THREAD_POOL,
+        'server.thread_pool_max': Config.SERVER_THREAD_POOL_MAX,
+        'server.socket_queue_size': Config.SERVER_SOCKET_QUEUE_SIZE,
+        'server.accepted_queue_size': Config.SERVER_ACCEPTED_QUEUE_SIZE,
+        'server.socket_timeout': Config.SERVER_SOCKET_TIMEOUT,
     })
     webService = WebCatalog(handler=handler)
     cherrypy.tree.mount(webService, '/', conf)
@@ -0,0 +1,35 @@
+'''Revision counters of the collections, used as ETags of the GET responses'''
+import threading
+import time
+from typing import Iterable, List
+
+
+class RevisionTracker():
+    """Each write on a collection increments its counter. The counters restart with the
+    process, so the start time (epoch) is part of the tags to keep them unique."""
+
+    def __init__(self):
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.lock = threading.Lock()
+        self.revisions = {}
+
+    def bump(self, *collections: str):
+        with self.lock:
+            for collection in collections:
+                self.revisions[collection] = self.revisions.get(collection, 0) + 1
+
+    def etag(self, collections: Iterable[str], weak: bool=False) -> str:
+        # Weak when the body may differ from the tagged one in fields that aren't tracked
+        with self.lock:
+            revisions = ".".join(str(self.revisions.get(collection, 0)) for collection in collections)
+        return f'{"W/" if weak else ""}"{self.epoch}-{revisions}"'
+
+    @staticmethod
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    @staticmethod
+    def parse_if_none_match(header: str) -> List[str]:
+        # Weak comparison, as required for If-None-Match
+        return [RevisionTracker.opaque(tag) for tag in header.split(",")]
@@ -0,0 +1,60 @@
+'''Encoding of the list responses item by item, straight from the Mongo cursor'''
+import json
+from typing import Iterator, Optional
+from pymongo.errors import PyMongoError
+from utility import DateTimeEncoder
+
+NDJSON = "application/x-ndjson"
+
+
+class StreamedItems():
+    """Content of a response that is read from the cursor while it's sent. Keeps the
+    last ID, so that the next page cursor is known once the items are sent."""
+
+    def __init__(self, cursor, id_field: str, limit: Optional[int] = None):
+        self.cursor = cursor
+        self.id_field = id_field
+        self.limit = limit
+        self.count = 0
+        self.last_id = None
+
+    def __iter__(self):
+        for item in self.cursor:
+            self.count += 1
+            self.last_id = item.get(self.id_field)
+            yield item
+
+    def next_after(self):
+        return self.last_id if self.limit and self.count == self.limit else None
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, cls=DateTimeEncoder)
+
+
+def encode_json(response: dict, logger) -> Iterator[bytes]:
+    # success and status come last, so that a failure in the middle of the cursor
+    # still ends as a valid document reporting the error
+    items = response["content"]
+    yield b'{"content": ['
+    try:
+        for position, item in enumerate(items):
+            yield ((", " if position else "") + _dumps(item)).encode("utf-8")
+    except PyMongoError as e:
+        logger.error(f"Streaming interrupted after {items.count} items: {str(e)}")
+        yield f'], "success": false, "status": 500, "message": {_dumps(str(e))}}}'.encode("utf-8")
+        return
+    trailer = {"nextAfter": items.next_after()} if items.limit else {}
+    trailer.update({"success": response["success"], "status": response["status"]})
+    yield ("], " + _dumps(trailer)[1:]).encode("utf-8")
+
+
+def encode_ndjson(response: dict, logger) -> Iterator[bytes]:
+    # One item per line, the next page starts after the ID of the last line
+    items = response["content"]
+    try:
+        for item in items:
+            yield (_dumps(item) + "\n").encode("utf-8")
+    except PyMongoError as e:
+        logger.error(f"Streaming interrupted after {items.count} items: {str(e)}")
+        yield (_dumps({"success": False, "status": 500, "message": str(e)}) + "\n").encode("utf-8")
@@ -1,4 +1,9 @@
 '''Utility functions across the scripts'''
+import json
+from datetime import datetime
+
+# Format of the dates in the responses, as they were stored before being BSON dates
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 def to_camel_case(snake_str) -> str:
     return "".join(word.capitalize() for word in snake_str.lower().split("_"))
@@ -14,6 +19,12 @@ def convert_to_bool(param):
     if param and param.lower() in ["true", "1"]:
         return bool(param)
 
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.strftime(DATETIME_FORMAT)
+        return super().default(o)
+
 def create_response(success: bool, content: dict = None, message: str = "", status: int = 200) -> dict:
     response = {
         "success": success,
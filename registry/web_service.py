@@ -1,21 +1,63 @@
+import json
+import types
 import cherrypy
-from utility import create_response
+from utility import create_response, DateTimeEncoder
 from handlers import Handler
+from revisions import RevisionTracker
+from streaming import StreamedItems, NDJSON, encode_json, encode_ndjson
+
+
+def json_handler(*args, **kwargs):
+    # Same as the default json_out handler, plus the datetimes read from MongoDB
+    value = cherrypy.serving.request._json_inner_handler(*args, **kwargs)
+    # Streamed responses are already encoded
+    if isinstance(value, types.GeneratorType):
+        return value
+    return json.dumps(value, cls=DateTimeEncoder).encode('utf-8')
 
 class WebCatalog():
     exposed = True
     def __init__(self, handler: Handler) -> None:
         self.handler = handler
 
-    @cherrypy.tools.json_out()
+    @cherrypy.tools.json_out(handler=json_handler)
     @cherrypy.tools.json_in()
     def GET(self, *uri, **params):
         print({"uri":uri, "param":params})
         if len(uri) < 1:
             return create_response(False, message="No url inserted, try from 'general', 'plants', 'devices', plant_kinds, ...")
-        return self.handler.handle_get(uri, params)
 
-    @cherrypy.tools.json_out()
+        # Opt-in streaming of the lists, as one JSON document or one item per line
+        ndjson = NDJSON in cherrypy.request.headers.get("Accept", "")
+        if ndjson:
+            params["stream"] = "true"
+
+        etag = self.handler.get_etag(uri)
+        if etag and ndjson:
+            # Another representation of the same resource
+            etag = f'{etag[:-1]}-ndjson"'
+        if etag:
+            # Nothing was written to the collections since the client's copy
+            if RevisionTracker.opaque(etag) in RevisionTracker.parse_if_none_match(cherrypy.request.headers.get("If-None-Match", "")):
+                cherrypy.response.headers["ETag"] = etag
+                raise cherrypy.HTTPRedirect([], 304)
+
+        response = self.handler.handle_get(uri, params)
+        if isinstance(response.get("content"), StreamedItems):
+            # Not tagged either: the status is sent before the items are read, and a cursor
+            # failing midway ends a 200 with success false
+            cherrypy.response.stream = True
+            if ndjson:
+                cherrypy.response.headers["Content-Type"] = NDJSON
+                return encode_ndjson(response, self.handler.logger)
+            return encode_json(response, self.handler.logger)
+
+        # A failed read isn't tagged, so it's never served again as not modified
+        if etag and response.get("status") != 500:
+            cherrypy.response.headers["ETag"] = etag
+        return response
+
+    @cherrypy.tools.json_out(handler=json_handler)
     @cherrypy.tools.json_in()
     def POST(self, *uri, **params):
         data = cherrypy.request.json
@@ -23,7 +65,7 @@ class WebCatalog():
             return create_response(False, message="No url inserted, try from 'plants', 'devices', ...")
         return self.handler.handle_post(uri, params, data)
 
-    @cherrypy.tools.json_out()
+    @cherrypy.tools.json_out(handler=json_handler)
     @cherrypy.tools.json_in()
     def PUT(self, *uri, **params):
         data = cherrypy.request.json
@@ -31,7 +73,7 @@ class WebCatalog():
             return create_response(False, message="No url inserted, try from 'plants', 'devices', ...")
         return self.handler.handle_put(uri, params, data)
 
-    @cherrypy.tools.json_out()
+    @cherrypy.tools.json_out(handler=json_handler)
     @cherrypy.tools.json_in()
     def DELETE(self, *uri, **params):
         if len(uri) < 1:
@@ -9,8 +9,8 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from datetime import datetime
-from typing import Literal
 from config import Config, MyLogger
+from catalog_client import CatalogClient
 
 
 class DataManager():
@@ -18,13 +18,13 @@ class DataManager():
         self.config = config
         self.logger = MyLogger.set_logger(config.DATA_MANAGER_LOGGER)
         self.catalog_address = self.config.CATALOG_URL
-        self.endpoint_cache = {}
+        self.catalog = CatalogClient(self.config, self.logger)
         # self.post_service()
         self.logger.info("Initiating the data manager...")
 
 
     def _get_plant(self, plant_id):
-        endpoint, host = self._discover_service_plus(self.config.PLANTS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.PLANTS_ENDPOINT, 'GET')
         output = []
         try:
             if endpoint:    
@@ -36,7 +36,7 @@ class DataManager():
                 
             
             self.logger.info(f"Fetching sensors information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             plants_response = response.json()
 
@@ -52,7 +52,7 @@ class DataManager():
 
 
     def _get_rooms(self, room_id: str):
-        endpoint, host = self._discover_service_plus(self.config.ROOMS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.ROOMS_ENDPOINT, 'GET')
         output = []
         try:
             if endpoint:    
@@ -63,7 +63,7 @@ class DataManager():
                 self.logger.error(f"Failed to get rooms endpoint")
                 
             self.logger.info(f"Fetching rooms information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             rooms_response = response.json()
 
@@ -79,7 +79,7 @@ class DataManager():
 
     
     def get_LLM(self):
-        endpoint, host = self._discover_service_plus(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.GENERAL_ENDPOINT, 'GET')
         output = {}
         try:
             if endpoint:    
@@ -88,7 +88,7 @@ class DataManager():
                 self.logger.error(f"Failed to get LLM's endpoint")
                 
             self.logger.info(f"Fetching LLM information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             json_data = response.json()
 
@@ -112,7 +112,7 @@ class DataManager():
 
 
     def get_sensing_data(self, plant_id: str, room_id: str = None, results: int = 4, start_date: str = None, end_date: str = None):
-        endpoint, host = self._discover_service_plus(item=self.config.ADAPTOR_SENSING_DATA_ENDPOINT, 
+        endpoint, host = self.catalog.discover_with_host(item=self.config.ADAPTOR_SENSING_DATA_ENDPOINT, 
                                                     method='GET',
                                                     microservice=self.config.THINGSPEAK_ADAPTOR_REGISTRY_NAME)
         
@@ -188,7 +188,7 @@ class DataManager():
         # Post the data to the registry system
         url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}"
         try:
-            response = requests.post(url, json=data)
+            response = self.catalog.post(url, json=data)
             response.raise_for_status()
             if response.json().get("success"): 
                 self.logger.info("Service registered successfully.")
@@ -199,48 +199,6 @@ class DataManager():
         
 
 
-    def _discover_service_plus(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None, microservice: str=Config.SERVICE_REGISTRY_NAME):
-        # Return the endpoint from the cache
-        if item in self.endpoint_cache and method in self.endpoint_cache[item]:
-            return self.endpoint_cache[item][method], self.endpoint_cache[item]['host']
-
-        try:
-            url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}/{microservice}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            service_response = response.json()
-
-            if service_response.get("success"):
-                # Extract the service registry from the response
-                service_registry = service_response.get("content", [[]])
-                service = service_registry[0]
-                if service:
-                    endpoints = service.get("endpoints", [])
-                    host = service.get("host", "")
-                    for endpoint in endpoints:
-                        path = endpoint.get("path", "")
-                        service_method = endpoint.get("method", "")
-
-                        if item in path and method == service_method:
-                            if sub_path:
-                                if sub_path in path:
-                                    self.endpoint_cache.setdefault(item, {})[method] = path
-                                    self.endpoint_cache[item]["host"] = host
-                                    return path, host
-                            else:
-                                self.endpoint_cache.setdefault(item, {})[method] = path
-                                self.endpoint_cache[item]["host"] = host
-                                return path, host
-                            
-            self.logger.error(f"Failed to discover service endpoint")
-
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch services endpoint: {e}")
-
-
-
-
 class Reporter():
     def __init__(self, config: Config):
         self.config = config
@@ -2,15 +2,15 @@ import os
 import requests
 import json
 from datetime import date, datetime
-from typing import Literal
 from config import Config, MyLogger
+from catalog_client import CatalogClient
 
 class DataManager():
     def __init__(self, config: Config):
         self.config = config
         self.logger = MyLogger.set_logger(config.DATA_MANAGER_LOGGER)
         self.catalog_address = self.config.CATALOG_URL
-        self.endpoint_cache = {}
+        self.catalog = CatalogClient(self.config, self.logger)
         # self.post_service()
         self.logger.info("Initiating the data manager...")
 
@@ -39,7 +39,7 @@ class DataManager():
 
 
     def delete_plant_from_user_inventory(self, plant_id, user_id):
-        endpoint, host = self._discover_service_plus(self.config.USERS_ENDPOINT, 'DELETE')
+        endpoint, host = self.catalog.discover_with_host(self.config.USERS_ENDPOINT, 'DELETE')
         params = {
             "plant_id": int(plant_id),
             "telegram_id": user_id
@@ -51,7 +51,7 @@ class DataManager():
                 self.logger.error(f"Failed to get users endpoint")
                 
             self.logger.info(f"Removing req send to {url} with params: {params}")
-            response = requests.delete(url, params=params)
+            response = self.catalog.delete(url, params=params)
             response.raise_for_status()
             users_response = response.json()
 
@@ -67,7 +67,7 @@ class DataManager():
 
 
     def post_user(self, plant_id, username, password, telegram_id):
-        endpoint, host = self._discover_service_plus(self.config.USERS_ENDPOINT, 'POST')
+        endpoint, host = self.catalog.discover_with_host(self.config.USERS_ENDPOINT, 'POST')
         body = {
             "userName": username,
             "password": password,
@@ -81,7 +81,7 @@ class DataManager():
                 self.logger.error(f"Failed to get users endpoint")
                 
             self.logger.info(f"Posting users information to {url} with body: {body}")
-            response = requests.post(url, json=body)
+            response = self.catalog.post(url, json=body)
             response.raise_for_status()
             users_response = response.json()
 
@@ -140,7 +140,7 @@ class DataManager():
     }
         
         params = {k: v for k, v in local_vars.items() if v is not None}
-        endpoint, host = self._discover_service_plus(self.config.DEVICES_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.DEVICES_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}"
@@ -151,7 +151,7 @@ class DataManager():
                 return
             
             self.logger.info(f"Fetching sensors information from {url} with params: {params}")
-            response = requests.get(url, params)
+            response = self.catalog.get(url, params)
             response.raise_for_status()
             devices_response = response.json()
 
@@ -166,16 +166,33 @@ class DataManager():
             self.logger.error(f"Failed to fetch devices information: {e}")
 
 
+    def _get_room_snapshot(self, room_id: int) -> dict:
+        # The room with its plant kind, plants and devices, in a single request
+        endpoint = self.catalog.discover(self.config.ROOMS_ENDPOINT, 'GET', sub_path="snapshot")
+        if not endpoint:
+            self.logger.error(f"Failed to get room snapshots endpoint")
+            return {}
+
+        url = f"{self.catalog_address}{endpoint}"
+        result = self.catalog.fetch("GET", url, params={"rooms": room_id})
+        if not result.success:
+            self.logger.error(f"Failed to fetch the snapshot of room {room_id}: {result.message}")
+            return {}
+        return (result.content or [{}])[0]
+
+
     def get_devices_for_plant(self, room_id: int, plant_id: int): 
-        plant_devices = self._get_devices(room_id=room_id, plant_id=plant_id) 
-        temp_device = self._get_devices(measure_type="temperature", room_id=room_id)
-        ligh_device = self._get_devices(measure_type="light", room_id=room_id)
+        # Filtered from the room snapshot instead of a request per filter
+        devices = self._get_room_snapshot(room_id).get("devices", [])
+        plant_devices = [device for device in devices if device.get("deviceLocation", {}).get("plantId") == plant_id]
+        temp_device = [device for device in devices if "temperature" in [m.lower() for m in device.get("measureTypes", [])]]
+        ligh_device = [device for device in devices if "light" in [m.lower() for m in device.get("measureTypes", [])]]
 
         return plant_devices + temp_device + ligh_device
 
 
     def _get_user(self, user_name: str=None, plant_id: int=None, telegram_id: str=None):
-        endpoint, host = self._discover_service_plus(self.config.USERS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.USERS_ENDPOINT, 'GET')
         output = []
         params = {k: v for k, v in {
             "user_name": user_name,
@@ -189,7 +206,7 @@ class DataManager():
                 self.logger.error(f"Failed to get users endpoint")
                 
             self.logger.info(f"Fetching users information from {url} with param: {params}")
-            response = requests.get(url, params=params)
+            response = self.catalog.get(url, params=params)
             response.raise_for_status()
             users_response = response.json()
 
@@ -205,7 +222,7 @@ class DataManager():
 
 
     def _get_plant(self, plant_id=None):
-        endpoint, host = self._discover_service_plus(self.config.PLANTS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.PLANTS_ENDPOINT, 'GET')
         output = []
         try:
             if endpoint:    
@@ -217,7 +234,7 @@ class DataManager():
                 
             
             self.logger.info(f"Fetching sensors information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             plants_response = response.json()
 
@@ -233,7 +250,7 @@ class DataManager():
 
 
     def _get_rooms(self, room_id: str):
-        endpoint, host = self._discover_service_plus(self.config.ROOMS_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.ROOMS_ENDPOINT, 'GET')
         output = []
         try:
             if endpoint:    
@@ -244,7 +261,7 @@ class DataManager():
                 self.logger.error(f"Failed to get rooms endpoint")
                 
             self.logger.info(f"Fetching rooms information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             rooms_response = response.json()
 
@@ -268,7 +285,7 @@ class DataManager():
 
 
     def get_sensing_data(self, plant_id: str, room_id: str = None, results: int = 4, start_date: str = None, end_date: str = None):
-        endpoint, host = self._discover_service_plus(item=self.config.ADAPTOR_SENSING_DATA_ENDPOINT, 
+        endpoint, host = self.catalog.discover_with_host(item=self.config.ADAPTOR_SENSING_DATA_ENDPOINT, 
                                                     method='GET',
                                                     microservice=self.config.THINGSPEAK_ADAPTOR_REGISTRY_NAME)
         
@@ -308,7 +325,7 @@ class DataManager():
 
 
     def get_report(self, plant_id, results: int=100):
-        endpoint, host = self._discover_service_plus(item=self.config.REPORTER_ENDPOINT, 
+        endpoint, host = self.catalog.discover_with_host(item=self.config.REPORTER_ENDPOINT, 
                                                     method='GET',
                                                     microservice=self.config.REPORTER_REGISTRY_NAME)
         try:
@@ -349,7 +366,7 @@ class DataManager():
         
 
     def get_bot_token(self):
-        endpoint, host = self._discover_service_plus(self.config.GENERAL_ENDPOINT, 'GET')
+        endpoint, host = self.catalog.discover_with_host(self.config.GENERAL_ENDPOINT, 'GET')
         output = ""
         try:
             if endpoint:    
@@ -358,7 +375,7 @@ class DataManager():
                 self.logger.error(f"Failed to get telegram bot's endpoint")
                 
             self.logger.info(f"Fetching telgram bot information from {url}")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             json_data = response.json()
 
@@ -388,7 +405,7 @@ class DataManager():
         # Post the data to the registry system
         url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}"
         try:
-            response = requests.post(url, json=data)
+            response = self.catalog.post(url, json=data)
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Error posting service data: {str(e)}")
@@ -398,46 +415,6 @@ class DataManager():
             self.logger.error("Error registring the service.")
 
 
-    def _discover_service_plus(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None, microservice: str=Config.SERVICE_REGISTRY_NAME):
-        # Return the endpoint from the cache
-        if item in self.endpoint_cache and method in self.endpoint_cache[item]:
-            return self.endpoint_cache[item][method], self.endpoint_cache[item]['host']
-
-        try:
-            url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}/{microservice}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            service_response = response.json()
-
-            if service_response.get("success"):
-                # Extract the service registry from the response
-                service_registry = service_response.get("content", [[]])
-                service = service_registry[0]
-                if service:
-                    endpoints = service.get("endpoints", [])
-                    host = service.get("host", "")
-                    for endpoint in endpoints:
-                        path = endpoint.get("path", "")
-                        service_method = endpoint.get("method", "")
-
-                        if item in path and method == service_method:
-                            if sub_path:
-                                if sub_path in path:
-                                    self.endpoint_cache.setdefault(item, {})[method] = path
-                                    self.endpoint_cache[item]["host"] = host
-                                    return path, host
-                            else:
-                                self.endpoint_cache.setdefault(item, {})[method] = path
-                                self.endpoint_cache[item]["host"] = host
-                                return path, host
-                            
-            self.logger.error(f"Failed to discover service endpoint")
-
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch services endpoint: {e}")
-
-
 if __name__ == "__main__":
     manager = DataManager(Config)
     # data = manager.get_sensing_data(101, results=1)
@@ -1,9 +1,12 @@
 import requests
 import threading
 import json
-from typing import Literal
+import time
 from MyMQTT2 import MyMQTT
 from config import Config, MyLogger
+from catalog_client import CatalogClient
+from uploader import BulkUploader
+from timeseries import TimeSeriesStore, TIME_FORMAT, parse_time
 
 class MyClientMQTT():
     def __init__(self, clientID, broker, port, host, child_logger):
@@ -36,7 +39,7 @@ class Adaptor():
         self.config = config
         self.catalog_address = self.config.CATALOG_URL
         self.logger = MyLogger.get_main_loggger()
-        self.endpoint_cache = {}
+        self.catalog = CatalogClient(self.config, self.logger)
         self.broker = ""
         self.port = None
         self.rooms = []
@@ -44,9 +47,17 @@ class Adaptor():
         self.main_topic = ""
         self.sensors_by_room = {}
         self.channels_detail = {}
+        # (room_id, plant_id or None, measure_type) as in the topics -> (channel_id, write API key, field)
+        self.routes = {}
         self.user_API_key = self.config.USER_API_KEY
         self.available_measure_types = self.config.AVAILABLE_MEASURE_TYPES
 
+        # Buffers the readings of the MQTT thread, written on ThingSpeak in the background
+        self.uploader = BulkUploader(self.config, self.logger)
+        # Answers the sensing data queries, ThingSpeak only backfills what came before it
+        self.store = TimeSeriesStore(self.config.STORE_PATH, self.config.STORE_POINTS_PER_FIELD,
+                                     self.config.STORE_RETENTION_HOURS, self.logger)
+
         self.logger.info("Initiating the adaptor...")
         self.get_broker()
         self.initiate_mqtt()
@@ -54,8 +65,8 @@ class Adaptor():
         self.get_topic_template()
         self.prepare_main_topic()
         self.subscribe_to_topic()
+        # Creates the missing channels and the routes of the readings too
         self.update_and_sort_devices_by_room()
-        self.check_and_create_channel()
         # self.start_update_timer()
         print()
 
@@ -71,19 +82,29 @@ class Adaptor():
         # Step 1: Send request to retrieve list of channels
         url = self.config.THINGSPEAK_URL + self.config.THINGSPEAK_CHANNELS_ENDPOINT + self.config.USER_API_KEY
         # url = self.config.CHANNELS_API.replace("{API_key}", self.user_API_key)
-        response = requests.get(url)
-        channels = response.json()
+        try:
+            response = requests.get(url)
+            channels = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # The channels and routes in use are kept until the next update
+            self.logger.error(f"Failed to retrieve the thingspeak channels: {e}")
+            return
 
+        # Built aside and swapped at the end, so notify never sees a half-built index
+        channels_detail, routes = {}, {}
         for room_id in self.rooms:
             channel_name = str(room_id)
 
             # Dictionary mapping field numbers to their names according to data sensing devices
             field_names_dict = {}
+            # Field number -> (plant_id or None, measure_type), as they appear in the topics
+            field_keys = {}
             fieldNum = 1
             for device in self.sensors_by_room[room_id]:
                 for measure_type in device["measureTypes"]:
                     if measure_type in self.available_measure_types:
                         plant_id = device["deviceLocation"].get("plantId")
+                        field_keys[f"field{fieldNum}"] = (str(plant_id) if plant_id else None, measure_type)
                         if plant_id:
                             field_names_dict[f"field{fieldNum}"] = f"{measure_type}-{plant_id}"
                         else:
@@ -92,7 +113,7 @@ class Adaptor():
                     
 
             # Adding the information of channels' fields to the channel detail dict
-            self.channels_detail[channel_name] = {"fields" : field_names_dict}
+            channels_detail[channel_name] = {"fields" : field_names_dict}
 
             # Step 2: Check if the channel exists
             channel_exists = any(channel['name'] == channel_name for channel in channels)
@@ -100,8 +121,8 @@ class Adaptor():
             if channel_exists:
                 self.logger.info(f"Channel '{channel_name}' already exists.")
                 channel_id, write_api_key = next((channel['id'], channel["api_keys"][0]["api_key"]) for channel in channels if channel['name'] == channel_name)
-                self.channels_detail[channel_name]["writeApiKey"] = write_api_key
-                self.channels_detail[channel_name]["channelId"] = channel_id
+                channels_detail[channel_name]["writeApiKey"] = write_api_key
+                channels_detail[channel_name]["channelId"] = channel_id
 
             else:
                 # Step 3: Create the channel
@@ -118,10 +139,19 @@ class Adaptor():
                     created_channel = create_channel_response.json()
                     channel_id, write_api_key = created_channel['id'], created_channel["api_keys"][0]["api_key"]
                     self.logger.info(f"Channel '{channel_name}' created with ID {channel_id}")
-                    self.channels_detail[channel_name]["writeApiKey"] = write_api_key
-                    self.channels_detail[channel_name]["channelId"] = channel_id
+                    channels_detail[channel_name]["writeApiKey"] = write_api_key
+                    channels_detail[channel_name]["channelId"] = channel_id
                 except requests.exceptions.RequestException as e:
                     self.logger.info(f"Failed to create channel {channel_name}: {e}")
+                    continue
+
+            # The first field of a plant and measure type gets its readings
+            for field, (plant_id, measure_type) in field_keys.items():
+                routes.setdefault((channel_name, plant_id, measure_type), (channel_id, write_api_key, field))
+
+        self.channels_detail = channels_detail
+        self.routes = routes
+        self.logger.info(f"{len(routes)} fields routed on {len(channels_detail)} channels.")
 
 
     # To get the channels and fields information for user interface
@@ -130,53 +160,73 @@ class Adaptor():
 
 
     def get_sensing_data(self, room_id: str, results: int = 4, plant_id: str = None, start_date: str = None, end_date: str = None):
+        # The last `results` values of each field of the room (of the plant and the room-wide ones
+        # with plant_id), between start and end, as [(value, created_at)] oldest first
         channel_detail = self.channels_detail.get(room_id)
-        if not room_id:
+        if not channel_detail:
             self.logger.error(f"No channel detail found for room ID: {room_id}")
             return False
 
-        fields, the_channel_id = channel_detail["fields"], channel_detail['channelId']
-        params = {'results': results}
+        start = parse_time(start_date) if start_date else None
+        end = parse_time(end_date) if end_date else None
+        try:
+            results = int(results)
+        except ValueError:
+            results = None
+        if results is None or (start_date and start is None) or (end_date and end is None):
+            self.logger.error(f"Invalid sensing data query: results {results}, start {start_date}, end {end_date}")
+            return False
+
+        names = [name for name in channel_detail["fields"].values()
+                 if not plant_id or name in ['temperature', 'light'] or name.endswith(plant_id)]
+        if not self.store.covers(room_id, names, results, start, end):
+            self._backfill_sensing_data(room_id, channel_detail, len(names) * results, start_date, end_date)
+        return self.store.query(room_id, names, results, start, end)
+
+
+    def _backfill_sensing_data(self, room_id: str, channel_detail: dict, results: int, start_date: str = None, end_date: str = None):
+        # Enough entries for every field to have its results, as each entry may hold a few fields only
+        params = {'results': min(results, self.config.THINGSPEAK_MAX_RESULTS)}
         if start_date:
             params['start'] = start_date
         if end_date:
             params['end'] = end_date
 
-        # requests thingSpeak for the last 5 data point to get the last value of each sensor
         try:
             # https://api.thingspeak.com/channels/<2425367>/feeds.json?results=4
-            url = f"{self.config.THINGSPEAK_URL}/channels/{str(the_channel_id)}/feeds.json"
+            url = f"{self.config.THINGSPEAK_URL}/channels/{str(channel_detail['channelId'])}/feeds.json"
             req_g = requests.get(url, params=params)
-            # req_g = requests.get(f"{self.thingSpeak_channels_url}{str(the_channel_id)}/feeds.json?results=4")
-            self.logger.info(f"Get request of sensing data for room {room_id} with params {params}")
-
+            self.logger.info(f"Backfill request of sensing data for room {room_id} with params {params}")
             data_list = req_g.json().get("feeds", [])
-            current_data_dict = {field: [] for field in fields.values()}
-
-            for datumDict in data_list:
-                timestamp = datumDict.get("created_at")
-                for field, value in datumDict.items():
-                    if field.startswith("field") and value:
-                        if not plant_id:
-                            current_data_dict[fields[field]].append((value, timestamp))
-                        elif fields[field] not in ['temperature', 'light']:
-                            if fields[field].endswith(plant_id):
-                                current_data_dict[fields[field]].append((value, timestamp))
-                        else:
-                            current_data_dict[fields[field]].append((value, timestamp))
-            
-
-            # Remove empty lists from the dictionary
-            current_data_dict = {k: v for k, v in current_data_dict.items() if v}
-
-            return current_data_dict
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # Answered with the local points only
             self.logger.error(f"Failed to get sensing data from ThingSpeak. Error: {e}")
-            return 
+            return
         except KeyError as e:
             self.logger.error(f"Key error: {e}")
-            return 
+            return
+
+        fields = channel_detail["fields"]
+        points, entry_times = [], []
+        for datumDict in data_list:
+            timestamp = parse_time(datumDict.get("created_at") or "", [TIME_FORMAT])
+            if timestamp is None:
+                continue
+            entry_times.append(timestamp)
+            for field, value in datumDict.items():
+                if field in fields and value:
+                    try:
+                        points.append((fields[field], float(value), timestamp))
+                    except ValueError:
+                        continue
+
+        # The feed has every entry from its oldest one on, or the whole window if it's shorter than asked
+        if entry_times and len(data_list) >= params['results']:
+            complete_from = min(entry_times)
+        else:
+            complete_from = parse_time(start_date) if start_date else 0.0
+        self.store.backfill(room_id, points, complete_from, parse_time(end_date) if end_date else None)
 
 
     def update_and_sort_devices_by_room(self):
@@ -190,6 +240,7 @@ class Adaptor():
 
          # Schedule the next update if the method is not triggered by external requests
         self.start_update_timer()
+        self.check_and_create_channel()
         
 
     def _update_rooms(self):
@@ -205,7 +256,7 @@ class Adaptor():
 
     
     def _get_rooms(self):
-        endpoint = self._discover_service("rooms", 'GET')
+        endpoint = self.catalog.discover("rooms", 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}"
@@ -214,7 +265,7 @@ class Adaptor():
                 return
             
             self.logger.info(f"Fetching sensors information from {url}")
-            req = requests.get(url)
+            req = self.catalog.get(url)
             req.raise_for_status()
             response = req.json()
 
@@ -231,7 +282,7 @@ class Adaptor():
 
 
     def get_broker(self):
-        endpoint = self._discover_service("general", 'GET')
+        endpoint = self.catalog.discover("general", 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}/broker"
@@ -240,7 +291,7 @@ class Adaptor():
                 return
             
             self.logger.info(f"Fetching broker information from {url} ...")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             broker_response = response.json()
 
@@ -260,43 +311,6 @@ class Adaptor():
             self.logger.error(f"Invalid broker information received: {e}")
 
 
-    def _discover_service(self, item: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'], sub_path: str=None):
-        # Return the endpoint from the cache
-        if item in self.endpoint_cache and method in self.endpoint_cache[item]:
-            return self.endpoint_cache[item][method]
-
-        try:
-            url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}/{self.config.SERVICE_REGISTRY_NAME}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            service_response = response.json()
-
-            if service_response.get("success"):
-                # Extract the service registry from the response
-                service_registry = service_response.get("content", [[]])
-                service = service_registry[0]
-                if service:
-                    endpoints = service.get("endpoints", [])
-                    for endpoint in endpoints:
-                        path = endpoint.get("path", "")
-                        service_method = endpoint.get("method", "")
-
-                        if item in path and method == service_method:
-                            if sub_path:
-                                if sub_path in path:
-                                    self.endpoint_cache.setdefault(item, {})[method] = path
-                                    return path
-                            else:
-                                self.endpoint_cache.setdefault(item, {})[method] = path
-                                return path
-                            
-            self.logger.error(f"Failed to discover service endpoint")
-
-        except requests.RequestException as e:
-            self.logger.error(f"Failed to fetch services endpoint: {e}")
-
-
     def initiate_mqtt(self):
         self.mqtt_client = MyClientMQTT(clientID = self.config.MQTT_CLIENT_ID,
                                         broker=self.broker,
@@ -320,7 +334,7 @@ class Adaptor():
     }
         
         params = {k: v for k, v in local_vars.items() if v is not None}
-        endpoint = self._discover_service(self.config.DEVICES_ENDPOINT, 'GET')
+        endpoint = self.catalog.discover(self.config.DEVICES_ENDPOINT, 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}"
@@ -329,7 +343,7 @@ class Adaptor():
                 return
             
             self.logger.info(f"Fetching sensors information from {url} with params: {params}")
-            response = requests.get(url, params)
+            response = self.catalog.get(url, params)
             response.raise_for_status()
             devices_response = response.json()
 
@@ -346,7 +360,7 @@ class Adaptor():
 
 
     def get_plants(self, plant_id: int=None):
-        endpoint = self._discover_service("plants", 'GET')
+        endpoint = self.catalog.discover("plants", 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}"
@@ -357,7 +371,7 @@ class Adaptor():
                 return
             
             self.logger.info(f"Fetching plants information from {url}.")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             plants_response = response.json()
 
@@ -375,7 +389,7 @@ class Adaptor():
     
 
     def get_topic_template(self):
-        endpoint = self._discover_service("general", 'GET')
+        endpoint = self.catalog.discover("general", 'GET')
         try:
             if endpoint:    
                 url = f"{self.catalog_address}{endpoint}/template"
@@ -384,7 +398,7 @@ class Adaptor():
                 return
             
             self.logger.info(f"Fetching template information from {url} ...")
-            response = requests.get(url)
+            response = self.catalog.get(url)
             response.raise_for_status()
             template_response = response.json()
 
@@ -419,6 +433,10 @@ class Adaptor():
         self.mqtt_client.stop()
 
 
+    def get_metrics(self):
+        return {"uploads": self.uploader.stats(), "store": self.store.stats()}
+
+
     def subscribe_to_topic(self):
         self.mqtt_client.subscribe(topic=self.main_topic)
 
@@ -438,7 +456,7 @@ class Adaptor():
         # Post the data to the registry system
         url = f"{self.catalog_address}/{self.config.SERVICES_ENDPOINT}"
         try:
-            response = requests.post(url, json=data)
+            response = self.catalog.post(url, json=data)
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Error posting service data: {str(e)}")
@@ -461,35 +479,32 @@ class Adaptor():
             for info_key, index in self.template.items():
                 msg_info[info_key] = seperatedTopic[index]
             room_id, plant_id, measure_type = msg_info["room_id"], msg_info["plant_id"], msg_info["measure_type"]
+            # Plant 0 stands for the sensors of the whole room
+            plant_id = plant_id if int(plant_id) else None
         except Exception as e:
             self.logger.error(f"Topic {topic }and topic template {self.template} not operable.")
             return
 
-        field_available = False
-        for channel_name, channel_detail in self.channels_detail.items():
-            if channel_name == room_id:
-                channel_API = channel_detail["writeApiKey"]
-                for field, sensor_name in channel_detail["fields"].items():   # sensor_name: 'PH_101', 'light
-                    target_field_name = measure_type
-                    if int(plant_id):
-                        target_field_name += f"-{plant_id}"
-                    if sensor_name == target_field_name:
-                        channedlField = field
-                        field_available = True
-                        break
-            if field_available:
-                break
-                
-        # Writing on Thingspeak channel
-        if field_available:
-            try:
-                self.logger.debug(f"{self.config.THINGSPEAK_URL}\n{self.config.THINGSPEAK_UPDATE_ENDPOINT}\n&{channedlField}={str(event['v'])}")
-                url = self.config.THINGSPEAK_URL+self.config.THINGSPEAK_UPDATE_ENDPOINT+f"api_key={channel_API}"+f"&{channedlField}={str(event['v'])}"
-                response = requests.get(url)     
-                self.logger.info(f"{measure_type} on channel {channel_name} and {field} is writen on thinkspeak with code {response.text}\n")
-            
-            except (requests.exceptions.RequestException, UnboundLocalError) as e:
-                self.logger.error(f"Error during writing {sensor_name} on thinkspeak channel: {e}")
+        route = self.routes.get((room_id, plant_id, measure_type))
+        if route is None:
+            self.logger.debug(f"No thingspeak field for {measure_type} of plant {plant_id} in room {room_id}.")
+            return
+
+        # Queued for the next bulk update of the channel
+        channel_id, channel_API, channel_field = route
+        try:
+            measured_at = float(event['t'])
+        except (TypeError, ValueError):
+            measured_at = time.time()
+        self.uploader.add(channel_id, channel_API, channel_field, event['v'], measured_at)
+
+        # Kept locally under the name of the field, as the sensing data queries ask for it
+        field_name = f"{measure_type}-{plant_id}" if plant_id else measure_type
+        try:
+            self.store.add(room_id, field_name, float(event['v']), measured_at)
+        except (TypeError, ValueError):
+            self.logger.debug(f"Non numeric {measure_type} value {event['v']} is not stored locally.")
+        self.logger.debug(f"{measure_type} on channel {room_id} and {channel_field} is queued for thingspeak.")
 
 
 # if __name__ == "__main__":
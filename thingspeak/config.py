@@ -12,6 +12,13 @@ class Config:
     GENERAL_ENDPOINT = os.getenv("GENERAL_ENDPOINT")
     SERVICES_ENDPOINT = os.getenv("SERVICES_ENDPOINT")
     SERVICE_REGISTRY_NAME = os.getenv("SERVICE_REGISTRY_NAME")
+    CATALOG_TIMEOUT = float(os.getenv("CATALOG_TIMEOUT", 5))  # seconds
+    CATALOG_RETRIES = int(os.getenv("CATALOG_RETRIES", 2))  # retries of the idempotent requests
+    CATALOG_BACKOFF = float(os.getenv("CATALOG_BACKOFF", 0.2))  # seconds, doubled at every retry
+    CATALOG_POOL_SIZE = int(os.getenv("CATALOG_POOL_SIZE", 10))  # keep-alive connections
+    CATALOG_DISCOVERY_TTL = int(os.getenv("CATALOG_DISCOVERY_TTL", 300))  # seconds before the endpoint map is reloaded
+    CATALOG_DISCOVERY_NEGATIVE_TTL = int(os.getenv("CATALOG_DISCOVERY_NEGATIVE_TTL", 30))  # seconds a miss or a failure is remembered
+    CATALOG_CONDITIONAL_CACHE_SIZE = int(os.getenv("CATALOG_CONDITIONAL_CACHE_SIZE", 256))  # GET responses kept for revalidation
     MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID")
     LOGGER_NAME = os.getenv("BASE_LOGGER")
     SERVICE_REGISTRY_FILE = os.getenv("SERVICE_REGISTRY_FILE")
@@ -28,6 +35,20 @@ class Config:
     THINGSPEAK_UPDATE_ENDPOINT = os.getenv("THINGSPEAK_UPDATE_ENDPOINT")
     THINGSPEAK_CHANNELS_ENDPOINT = os.getenv("THINGSPEAK_CHANNELS_ENDPOINT")
     USER_API_KEY = os.getenv("USER_API_KEY")
+    THINGSPEAK_BULK_ENDPOINT = os.getenv("THINGSPEAK_BULK_ENDPOINT", "/channels/{channel_id}/bulk_update.json")
+    THINGSPEAK_BULK_INTERVAL = int(os.getenv("THINGSPEAK_BULK_INTERVAL", 15))  # seconds between the updates of a channel (rate limit)
+    THINGSPEAK_BULK_MAX_ENTRIES = int(os.getenv("THINGSPEAK_BULK_MAX_ENTRIES", 960))  # entries per bulk update
+    THINGSPEAK_BUFFER_SIZE = int(os.getenv("THINGSPEAK_BUFFER_SIZE", 5000))  # entries waiting per channel
+    THINGSPEAK_MERGE_WINDOW = int(os.getenv("THINGSPEAK_MERGE_WINDOW", 10))  # seconds within which readings share an entry
+    THINGSPEAK_TIMEOUT = float(os.getenv("THINGSPEAK_TIMEOUT", 10))  # seconds
+    THINGSPEAK_MAX_ATTEMPTS = int(os.getenv("THINGSPEAK_MAX_ATTEMPTS", 5))  # rejected updates of an entry before it's dropped
+    THINGSPEAK_SPOOL_PATH = os.getenv("THINGSPEAK_SPOOL_PATH", "spool/readings.db")
+    THINGSPEAK_SPOOL_MAX_READINGS = int(os.getenv("THINGSPEAK_SPOOL_MAX_READINGS", 500000))  # oldest evicted above it
+    THINGSPEAK_SPOOL_COMPACT_INTERVAL = int(os.getenv("THINGSPEAK_SPOOL_COMPACT_INTERVAL", 300))  # seconds
+    STORE_PATH = os.getenv("STORE_PATH", "store")  # segments of the local time-series store
+    STORE_POINTS_PER_FIELD = int(os.getenv("STORE_POINTS_PER_FIELD", 50000))  # kept in memory for each channel field
+    STORE_RETENTION_HOURS = int(os.getenv("STORE_RETENTION_HOURS", 720))  # segments older than that are deleted
+    THINGSPEAK_MAX_RESULTS = int(os.getenv("THINGSPEAK_MAX_RESULTS", 8000))  # entries of a feed request
 
 
 
@@ -0,0 +1,110 @@
+'''On-disk write-ahead log of the readings waiting for upload to ThingSpeak'''
+import os
+import sqlite3
+import threading
+from typing import Iterable, List
+
+
+class ReadingSpool():
+    """Each reading is appended (and committed) before it's buffered for upload, and deleted
+    once ThingSpeak confirmed it. The readings left at a restart are replayed in their order.
+    Above max_readings the oldest ones are evicted, so an outage can't fill the disk."""
+
+    def __init__(self, path: str, max_readings: int, logger):
+        self.path = path
+        self.max_readings = max_readings
+        self.logger = logger
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Set before the table is created, so that the freed pages can be given back by compact
+        self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        # A commit is durable at the next checkpoint, and it doesn't wait for the disk on every reading
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS readings (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id TEXT NOT NULL,
+            write_key TEXT NOT NULL,
+            field TEXT NOT NULL,
+            value,
+            at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0)""")
+        self.count = self.connection.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        self.counters = {"appended": 0, "confirmed": 0, "evicted": 0, "discarded": 0}
+
+
+    def append(self, channel_id, write_key: str, field: str, value, at: float) -> int:
+        with self.lock:
+            seq = self.connection.execute(
+                "INSERT INTO readings (channel_id, write_key, field, value, at) VALUES (?, ?, ?, ?, ?)",
+                (str(channel_id), write_key, field, value, at)).lastrowid
+            self.count += 1
+            self.counters["appended"] += 1
+            if self.count > self.max_readings:
+                self._evict(self.count - self.max_readings)
+            return seq
+
+
+    def _evict(self, amount: int):
+        # Called with the lock held. The evicted readings still in memory are uploaded all the same
+        self.connection.execute("DELETE FROM readings WHERE seq IN (SELECT seq FROM readings ORDER BY seq LIMIT ?)", (amount,))
+        self.count -= amount
+        self.counters["evicted"] += amount
+        self.logger.warning(f"Spool is full, {amount} oldest readings evicted.")
+
+
+    def pending(self) -> List[tuple]:
+        # (seq, channel_id, write_key, field, value, at, attempts) in the order they were received
+        with self.lock:
+            return self.connection.execute(
+                "SELECT seq, channel_id, write_key, field, value, at, attempts FROM readings ORDER BY seq").fetchall()
+
+
+    def confirm(self, seqs: Iterable[int], discarded: bool = False):
+        # Uploaded (or given up on, when discarded)
+        seqs = list(seqs)
+        with self.lock:
+            deleted = 0
+            # Within the limit of the variables of a statement
+            for start in range(0, len(seqs), 500):
+                chunk = seqs[start:start + 500]
+                deleted += self.connection.execute(
+                    f"DELETE FROM readings WHERE seq IN ({','.join('?' * len(chunk))})", chunk).rowcount
+            self.count -= deleted
+            self.counters["discarded" if discarded else "confirmed"] += deleted
+
+
+    def attempted(self, seqs: Iterable[int]):
+        # Counted on disk too, so that a restart doesn't reset the retries of a rejected entry
+        seqs = list(seqs)
+        with self.lock:
+            for start in range(0, len(seqs), 500):
+                chunk = seqs[start:start + 500]
+                self.connection.execute(
+                    f"UPDATE readings SET attempts = attempts + 1 WHERE seq IN ({','.join('?' * len(chunk))})", chunk)
+
+
+    def compact(self):
+        # Gives the pages of the confirmed readings back and empties the WAL
+        with self.lock:
+            try:
+                self.connection.execute("PRAGMA incremental_vacuum")
+                self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                self.logger.error(f"Failed to compact the spool: {e}")
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            counters = dict(self.counters)
+            count = self.count
+        size = sum(os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path))
+        return {"path": self.path, "readings": count, "maxReadings": self.max_readings, "sizeBytes": size, **counters}
@@ -0,0 +1,243 @@
+'''Local time-series store of the readings, answering the sensing data queries without ThingSpeak'''
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# ThingSpeak's created_at, also used for the points served from the store
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# Accepted for the start and end of the queries, in UTC as on ThingSpeak
+QUERY_TIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]
+SEGMENT_SECONDS = 3600
+
+
+def parse_time(text: str, formats: List[str] = QUERY_TIME_FORMATS) -> Optional[float]:
+    for time_format in formats:
+        try:
+            return datetime.strptime(text, time_format).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def format_time(at: float) -> str:
+    return datetime.fromtimestamp(at, timezone.utc).strftime(TIME_FORMAT)
+
+
+def format_value(value: float) -> str:
+    # As ThingSpeak returns them: '23' for 23.0
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Series():
+    """Points of a field sorted by time, in two arrays of doubles. The oldest points are
+    skipped by moving `first` and cut off once they are as many as the capacity, so the
+    trimming costs O(1) per point on average."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = array("d")
+        self.values = array("d")
+        self.first = 0
+
+    def __len__(self):
+        return len(self.times) - self.first
+
+    def add(self, at: float, value: float):
+        if not len(self) or at >= self.times[-1]:
+            self.times.append(at)
+            self.values.append(value)
+        else:
+            # Late or backfilled point
+            position = bisect_right(self.times, at, self.first)
+            self.times.insert(position, at)
+            self.values.insert(position, value)
+        if len(self) > self.capacity:
+            self.first += 1
+            if self.first >= self.capacity:
+                del self.times[:self.first]
+                del self.values[:self.first]
+                self.first = 0
+
+    def oldest(self) -> Optional[float]:
+        return self.times[self.first] if len(self) else None
+
+    def window(self, start: Optional[float], end: Optional[float]) -> Tuple[int, int]:
+        low = bisect_left(self.times, start, self.first) if start is not None else self.first
+        high = bisect_right(self.times, end, self.first) if end is not None else len(self.times)
+        return low, high
+
+
+class TimeSeriesStore():
+    """Keeps the readings of every channel field (by field name, e.g. 'moisture-101') in memory,
+    and in hourly segment files to survive the restarts. The adaptor being the only writer of
+    its channels, the store is complete from `since` on for each room; older data is backfilled
+    from ThingSpeak by the adaptor when a query reaches before it."""
+
+    def __init__(self, path: str, points_per_field: int, retention_hours: int, logger):
+        self.path = path
+        self.points_per_field = points_per_field
+        self.retention = retention_hours * 3600
+        self.logger = logger
+        self.lock = threading.Lock()
+        # room_id -> field name -> _Series
+        self.series = {}
+        # room_id -> time from which the store has every point of the room
+        self.since = {}
+        # room_id -> (segment start, open file)
+        self.segments = {}
+        self.started_at = time.time()
+        self.counters = {"points": 0, "localQueries": 0, "backfills": 0, "backfilledPoints": 0}
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+
+    def _load(self):
+        # Segments are named after the hour they were written in, lines are '<at>\t<field name>\t<value>'
+        oldest_kept = time.time() - self.retention
+        for room_id in os.listdir(self.path):
+            room_path = os.path.join(self.path, room_id)
+            if not os.path.isdir(room_path):
+                continue
+            for segment in sorted(os.listdir(room_path)):
+                segment_path = os.path.join(room_path, segment)
+                if not segment.endswith(".seg") or not segment[:-4].isdigit():
+                    continue
+                if int(segment[:-4]) + SEGMENT_SECONDS < oldest_kept:
+                    os.remove(segment_path)
+                    continue
+                with open(segment_path) as file:
+                    for line in file:
+                        try:
+                            at, name, value = line.rstrip("\n").split("\t")
+                            self._add(room_id, name, float(value), float(at))
+                        except ValueError:
+                            # A line cut by a crash
+                            continue
+            series = self.series.get(room_id)
+            if series:
+                # From the first point loaded, or later if some field kept its latest points only
+                since = min(points.oldest() for points in series.values())
+                trimmed = [points.oldest() for points in series.values() if len(points) == points.capacity]
+                self.since[room_id] = max([since] + trimmed)
+        self.logger.info(f"Local store loaded with {self.counters['points']} points of {len(self.since)} rooms.")
+
+
+    def _add(self, room_id: str, name: str, value: float, at: float):
+        # Called with the lock held (or while loading)
+        series = self.series.setdefault(room_id, {}).get(name)
+        if series is None:
+            series = self.series[room_id][name] = _Series(self.points_per_field)
+        trimmed = len(series) == series.capacity
+        series.add(at, value)
+        self.counters["points"] += 1
+        if trimmed and room_id in self.since:
+            # The room is complete from the oldest point still kept only
+            self.since[room_id] = max(self.since[room_id], series.oldest())
+
+
+    def add(self, room_id: str, name: str, value: float, at: float):
+        with self.lock:
+            # Rooms never seen are complete from the start of this run
+            self.since.setdefault(room_id, self.started_at)
+            self._add(room_id, name, value, at)
+            self._persist(room_id, name, value, at)
+
+
+    def _persist(self, room_id: str, name: str, value: float, at: float):
+        if not re.fullmatch(r"[\w-]+", room_id):
+            return
+        segment_start = int(time.time() // SEGMENT_SECONDS * SEGMENT_SECONDS)
+        current = self.segments.get(room_id)
+        try:
+            if current is None or current[0] != segment_start:
+                if current is not None:
+                    current[1].close()
+                room_path = os.path.join(self.path, room_id)
+                os.makedirs(room_path, exist_ok=True)
+                current = self.segments[room_id] = (segment_start, open(os.path.join(room_path, f"{segment_start}.seg"), "a"))
+                self._expire(room_path)
+            current[1].write(f"{at}\t{name}\t{value}\n")
+            current[1].flush()
+        except OSError as e:
+            self.logger.error(f"Failed to write the segment of room {room_id}: {e}")
+
+
+    def _expire(self, room_path: str):
+        oldest_kept = time.time() - self.retention
+        for segment in os.listdir(room_path):
+            if segment.endswith(".seg") and segment[:-4].isdigit() and int(segment[:-4]) + SEGMENT_SECONDS < oldest_kept:
+                os.remove(os.path.join(room_path, segment))
+
+
+    def covers(self, room_id: str, names: List[str], results: int, start: Optional[float], end: Optional[float]) -> bool:
+        """Whether the store alone answers the query: the window starts after `since`, the store
+        has the whole history of the room (`since` 0), or each field with points has its last
+        `results` points of the window after `since`."""
+        with self.lock:
+            since = self.since.get(room_id)
+            if since is None:
+                return False
+            if since <= 0 or (start is not None and start >= since):
+                return True
+            series = self.series.get(room_id, {})
+            for name in names:
+                points = series.get(name)
+                if points is None:
+                    # A silent field, ThingSpeak has no more of it than the rest of the room
+                    continue
+                low, high = points.window(max(start, since) if start is not None else since, end)
+                if high - low < results:
+                    return False
+            return True
+
+
+    def backfill(self, room_id: str, points: List[Tuple[str, float, float]], start: float, end: Optional[float]):
+        """Adds the points (name, value, at) fetched from ThingSpeak for [start, end], end None for up to now.
+        Only the ones before `since` are new, and the room becomes complete from start on if the window joins it."""
+        with self.lock:
+            since = self.since.setdefault(room_id, self.started_at)
+            added = 0
+            for name, value, at in points:
+                if at < since:
+                    self._add(room_id, name, value, at)
+                    added += 1
+            if end is None or end >= since:
+                since = min(since, start)
+            # Not before the points dropped from the full series, backfilled ones included
+            trimmed = [points.oldest() for points in self.series.get(room_id, {}).values() if len(points) == points.capacity]
+            self.since[room_id] = max([since] + trimmed)
+            self.counters["backfills"] += 1
+            self.counters["backfilledPoints"] += added
+
+
+    def query(self, room_id: str, names: List[str], results: int, start: Optional[float], end: Optional[float]) -> Dict[str, List[Tuple[str, str]]]:
+        # The last `results` points of each field in the window, oldest first
+        with self.lock:
+            self.counters["localQueries"] += 1
+            series = self.series.get(room_id, {})
+            data = {}
+            for name in names:
+                points = series.get(name)
+                if points is None:
+                    continue
+                low, high = points.window(start, end)
+                low = max(low, high - results)
+                if high > low:
+                    data[name] = [(format_value(points.values[position]), format_time(points.times[position]))
+                                  for position in range(low, high)]
+            return data
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "rooms": {room_id: {"since": format_time(since),
+                                    "fields": {name: len(points) for name, points in self.series.get(room_id, {}).items()}}
+                          for room_id, since in self.since.items()},
+                **self.counters
+            }
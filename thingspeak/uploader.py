@@ -0,0 +1,216 @@
+'''Per-channel write buffers of the adaptor, flushed to ThingSpeak through the bulk update API'''
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+import requests
+from spool import ReadingSpool
+
+
+class _Channel():
+    def __init__(self, channel_id, write_key: str, batch_limit: int):
+        self.channel_id = channel_id
+        self.write_key = write_key
+        # Entries per update, halved after a rejection to isolate the entry ThingSpeak refuses
+        self.batch_limit = batch_limit
+        # Entries waiting for upload, oldest first: {"at": epoch seconds, "fields": {"field1": value},
+        # "seqs": spool sequences of the readings, "attempts": updates rejected so far}
+        self.entries = deque()
+        # Monotonic time the rate limit of the channel allows the next update
+        self.next_flush = 0.0
+        self.failures = 0
+
+
+class BulkUploader():
+    """The readings of a channel are merged into entries, one value per field, and sent by
+    a background thread with a bulk update at most once every interval. A value for a field
+    the last entry already has (or one that comes after the merge window) starts a new entry.
+    When a buffer is full, its oldest entry is dropped.
+
+    Every reading goes through the spool first, and leaves it once its update is confirmed.
+    Unreachable, unauthorised or rate limited updates are retried until they pass. ThingSpeak
+    rejects a whole update for one bad entry, so a rejected batch is sent again in halves
+    until the entry is alone, which is dropped after max_attempts."""
+
+    def __init__(self, config, logger):
+        self.url = config.THINGSPEAK_URL + config.THINGSPEAK_BULK_ENDPOINT
+        self.interval = config.THINGSPEAK_BULK_INTERVAL
+        self.max_entries = config.THINGSPEAK_BULK_MAX_ENTRIES
+        self.buffer_size = config.THINGSPEAK_BUFFER_SIZE
+        self.merge_window = config.THINGSPEAK_MERGE_WINDOW
+        self.timeout = config.THINGSPEAK_TIMEOUT
+        self.max_attempts = config.THINGSPEAK_MAX_ATTEMPTS
+        self.compact_interval = config.THINGSPEAK_SPOOL_COMPACT_INTERVAL
+        self.logger = logger
+        self.session = requests.Session()
+
+        self.lock = threading.Lock()
+        # Keyed by the channel ID as a string, as it comes back from the spool
+        self.channels = {}
+        self.counters = {"points": 0, "entries": 0, "flushes": 0, "flushedEntries": 0,
+                         "failedFlushes": 0, "rejectedFlushes": 0, "droppedPoints": 0, "replayedPoints": 0}
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+
+        self.spool = ReadingSpool(config.THINGSPEAK_SPOOL_PATH, config.THINGSPEAK_SPOOL_MAX_READINGS, logger)
+        self._replay()
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="thingspeak_uploader", daemon=True)
+        self.thread.start()
+
+
+    def add(self, channel_id, write_key: str, field: str, value, at: float):
+        seq = self.spool.append(channel_id, write_key, field, value, at)
+        self._buffer(str(channel_id), write_key, field, value, at, seq)
+
+
+    def _replay(self):
+        # The readings of the previous run, in their order, before any new one
+        pending = self.spool.pending()
+        for seq, channel_id, write_key, field, value, at, attempts in pending:
+            self._buffer(channel_id, write_key, field, value, at, seq, attempts)
+        if pending:
+            self.counters["replayedPoints"] += len(pending)
+            self.logger.info(f"{len(pending)} readings replayed from the spool.")
+
+
+    def _buffer(self, channel_id: str, write_key: str, field: str, value, at: float, seq: int, attempts: int = 0):
+        with self.lock:
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                channel = self.channels[channel_id] = _Channel(channel_id, write_key, self.max_entries)
+            channel.write_key = write_key
+
+            last = channel.entries[-1] if channel.entries else None
+            if last is not None and field not in last["fields"] and abs(at - last["at"]) <= self.merge_window:
+                last["fields"][field] = value
+                last["seqs"].append(seq)
+                last["attempts"] = max(last["attempts"], attempts)
+            else:
+                if len(channel.entries) >= self.buffer_size:
+                    self._drop(channel, channel.entries.popleft())
+                    self.logger.warning(f"Write buffer of channel {channel_id} is full, oldest entry dropped.")
+                channel.entries.append({"at": at, "fields": {field: value}, "seqs": [seq], "attempts": attempts})
+                self.counters["entries"] += 1
+            self.counters["points"] += 1
+
+
+    def _drop(self, channel: _Channel, entry: dict):
+        # Called with the lock held
+        self.counters["droppedPoints"] += len(entry["fields"])
+        self.spool.confirm(entry["seqs"], discarded=True)
+
+
+    def _run(self):
+        last_compaction = time.monotonic()
+        while not self.stopped.wait(1):
+            self.flush()
+            if time.monotonic() - last_compaction >= self.compact_interval:
+                self.spool.compact()
+                last_compaction = time.monotonic()
+
+
+    def flush(self, force: bool=False):
+        # Sends a batch of every channel the rate limit allows (all of them when forced)
+        now = time.monotonic()
+        with self.lock:
+            due = [channel for channel in self.channels.values()
+                   if channel.entries and (force or channel.next_flush <= now)]
+        for channel in due:
+            self._flush_channel(channel)
+
+
+    def _flush_channel(self, channel: _Channel):
+        with self.lock:
+            # Taken out of the buffer, so that the new readings don't merge into entries being sent
+            count = min(len(channel.entries), channel.batch_limit)
+            batch = [channel.entries.popleft() for _ in range(count)]
+            write_key = channel.write_key
+
+        payload = {"write_api_key": write_key,
+                   "updates": [{"created_at": datetime.fromtimestamp(entry["at"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                **entry["fields"]} for entry in batch]}
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url.replace("{channel_id}", str(channel.channel_id)),
+                                         json=payload, timeout=self.timeout)
+            success = response.status_code == 202 and response.json().get("success", False)
+            error = None if success else f"code {response.status_code}: {response.text}"
+            # Refused for its content, as opposed to the rate limit, an outage or a key being replaced
+            rejected = not success and 400 <= response.status_code < 500 and response.status_code not in (401, 403, 429)
+        except (requests.RequestException, ValueError) as e:
+            success, error, rejected = False, str(e), False
+        elapsed = time.perf_counter() - start
+        # A rejected batch is split before any of its entries is counted as attempted
+        split = rejected and len(batch) > 1
+
+        if success:
+            self.spool.confirm(seq for entry in batch for seq in entry["seqs"])
+        elif rejected and not split:
+            self.spool.attempted(seq for entry in batch for seq in entry["seqs"])
+
+        with self.lock:
+            self.counters["flushes"] += 1
+            self.flush_time += elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+            dropped = 0
+            if success:
+                channel.failures = 0
+                channel.next_flush = time.monotonic() + self.interval
+                channel.batch_limit = min(channel.batch_limit * 2, self.max_entries)
+                self.counters["flushedEntries"] += len(batch)
+            else:
+                if split:
+                    # The first half goes with the next update, the rate limit still applies
+                    channel.batch_limit = len(batch) // 2
+                    channel.next_flush = time.monotonic() + self.interval
+                else:
+                    # Retried after a growing pause
+                    channel.failures += 1
+                    channel.next_flush = time.monotonic() + min(self.interval * 2 ** channel.failures, self.interval * 20)
+                self.counters["rejectedFlushes" if rejected else "failedFlushes"] += 1
+                # Back in front of the buffer, in their order
+                for entry in reversed(batch):
+                    entry["attempts"] += 1 if rejected and not split else 0
+                    if entry["attempts"] >= self.max_attempts or len(channel.entries) >= self.buffer_size:
+                        # Given up on, or the buffer is full: the newest readings are kept
+                        self._drop(channel, entry)
+                        dropped += 1
+                        continue
+                    channel.entries.appendleft(entry)
+
+        if success:
+            self.logger.info(f"{len(batch)} entries written on channel {channel.channel_id} in {elapsed * 1000:.0f} ms.")
+        elif split:
+            self.logger.warning(f"Bulk update of channel {channel.channel_id} rejected, its {len(batch)} entries are sent again "
+                                f"by {len(batch) // 2} ({dropped} dropped): {error}")
+        else:
+            self.logger.error(f"Bulk update of channel {channel.channel_id} failed ({len(batch) - dropped} entries kept, "
+                              f"{dropped} dropped): {error}")
+
+
+    def stop(self):
+        self.stopped.set()
+        self.flush(force=True)
+        self.spool.compact()
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            channels = {str(channel_id): {"queueDepth": len(channel.entries),
+                                          "queuedPoints": sum(len(entry["fields"]) for entry in channel.entries),
+                                          "failures": channel.failures,
+                                          "batchLimit": channel.batch_limit}
+                        for channel_id, channel in self.channels.items()}
+            counters = dict(self.counters)
+            flush_time, max_flush_time = self.flush_time, self.max_flush_time
+
+        return {
+            "queueDepth": sum(channel["queueDepth"] for channel in channels.values()),
+            "channels": channels,
+            **counters,
+            "avgFlushMs": round(flush_time / counters["flushes"] * 1000, 3) if counters["flushes"] else 0,
+            "maxFlushMs": round(max_flush_time * 1000, 3),
+            "spool": self.spool.stats()
+        }
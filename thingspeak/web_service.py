@@ -38,6 +38,9 @@ class WebAdaptor():
             
             return create_response(True, content=data, status=200)
 
+        elif uri[0] == "metrics":
+            return create_response(True, content=self.adaptor.get_metrics(), status=200)
+
         return create_response(False, message="URL not valid, try 'channels'", status=404)
 
 
@@ -74,4 +77,5 @@ if __name__ == "__main__":
     finally:
         # Terminate the webservice 
         adaptor.stop_mqtt()   
+        adaptor.uploader.stop()
         